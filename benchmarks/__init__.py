@@ -0,0 +1 @@
+# 离线基准测试：本地模拟 Naver keywordstool / Gemini，无需网络即可量化各阶段吞吐与内存
@@ -0,0 +1,228 @@
+import hashlib
+import itertools
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import google.generativeai as genai
+from google.generativeai import caching
+
+_SYLLABLES = "가나다라마바사아자차카타파하강남동서북방향수건용품세트케이스커버가방백팩신발의류"
+
+
+def fake_keyword(seed: int, length: int = 3) -> str:
+    rnd = random.Random(seed)
+    return "".join(rnd.choice(_SYLLABLES) for _ in range(length))
+
+
+class FakeKeywordstoolServer:
+    """
+    本地 keywordstool 替身：
+    - latency_ms：每个请求的固定延迟
+    - rate_429：按概率返回 429（模拟限流）
+    - rows_per_hint：每个 hintKeyword 返回多少条联想词（控制响应体大小）
+    """
+
+    def __init__(self, latency_ms: float = 80, rate_429: float = 0.0, rows_per_hint: int = 40, seed: int = 7):
+        self.latency_ms = latency_ms
+        self.rate_429 = rate_429
+        self.rows_per_hint = rows_per_hint
+        self.requests = 0
+        self.throttled = 0
+        self._rnd = random.Random(seed)
+        self._lock = threading.Lock()
+        outer = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                outer._handle(self)
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def _handle(self, req: BaseHTTPRequestHandler):
+        with self._lock:
+            self.requests += 1
+            throttle = self._rnd.random() < self.rate_429
+            if throttle:
+                self.throttled += 1
+        time.sleep(self.latency_ms / 1000.0)
+        if throttle:
+            req.send_response(429)
+            req.send_header("Content-Length", "0")
+            req.end_headers()
+            return
+        hints = parse_qs(urlparse(req.path).query).get("hintKeywords", [""])[0].split(",")
+        rows = []
+        for hint in hints:
+            rows.append({"relKeyword": hint, "monthlyPcQcCnt": 1200, "monthlyMobileQcCnt": "< 10", "compIdx": "높음"})
+            base = int(hashlib.md5(hint.encode("utf-8")).hexdigest()[:8], 16)
+            for i in range(self.rows_per_hint):
+                rows.append({
+                    "relKeyword": hint + fake_keyword(base + i, 2),
+                    "monthlyPcQcCnt": (base + i * 37) % 5000,
+                    "monthlyMobileQcCnt": str((base + i * 91) % 20000),
+                    "compIdx": ("낮음", "중간", "높음")[i % 3],
+                })
+        body = json.dumps({"keywordList": rows}, ensure_ascii=False).encode("utf-8")
+        req.send_response(200)
+        req.send_header("Content-Type", "application/json")
+        req.send_header("Content-Length", str(len(body)))
+        req.end_headers()
+        req.wfile.write(body)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class _FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class _FakeStreamResponse:
+    # stream=True 的替身：迭代得到分片，迭代完后 .text 为全文
+    def __init__(self, text: str, latency_s: float, chunk_chars: int = 200):
+        self.text = text
+        self._chunks = [text[i:i + chunk_chars] for i in range(0, len(text), chunk_chars)]
+        self._delay = latency_s / max(1, len(self._chunks))
+
+    def __iter__(self):
+        for piece in self._chunks:
+            time.sleep(self._delay)
+            yield _FakeResponse(piece)
+
+
+class FakeGeminiModel:
+    # safe_generate 的模型替身：按指令类型返回结构与真实输出一致的文本
+    model_name = "models/fake-gemini"
+
+    def __init__(self, latency_s: float = 0.5, n_keywords: int = 40, file_latency_s: float = 0.0):
+        self.latency_s = latency_s
+        self.n_keywords = n_keywords
+        self.file_latency_s = file_latency_s
+        self.calls = 0
+        self.file_parts = 0
+        self.cached_file_parts = 0
+
+    def step1_text(self) -> str:
+        kws = [fake_keyword(i) + " " + fake_keyword(i + 1000, 2) for i in range(self.n_keywords)]
+        reviews = "\n".join(f"| {i} | {fake_keyword(i, 8)} | 好评 {i} | 痛点 {i} |" for i in range(1, 6))
+        half = self.n_keywords // 2
+
+        def table(platform, words):
+            rows = "\n".join(f"| {i} | {w} | 翻译 | 策略 |" for i, w in enumerate(words, start=1))
+            return f"| 序号 | {platform}韩文关键词 | 中文翻译 | 纯中文策略解释 |\n|---|---|---|---|\n{rows}\n"
+
+        return (
+            "## 第一部分：Coupang 专属优化\n"
+            f"```\nLxU {kws[0]} {kws[1]}\n```\n"
+            + table("Coupang", kws[:half]) +
+            f"```\n{','.join(kws[:half])}\n```\n"
+            "## 第二部分：Naver 专属优化\n"
+            f"```\nLxU {kws[2]} {kws[3]}\n```\n"
+            + table("Naver", kws[half:]) +
+            f"```\n{','.join(kws[half:])}\n```\n"
+            "| 序号 | 韩文评价原文 | 纯中文翻译 | 买家痛点分析 |\n|---|---|---|---|\n"
+            f"{reviews}\n\n"
+            f"[LXU_KEYWORDS_START]\n{','.join(kws)}\n[LXU_KEYWORDS_END]\n"
+        )
+
+    def step3_text(self) -> str:
+        rows = "\n".join(
+            f"| {i} | 核心出单词 | 1 | {fake_keyword(i)} | {1000 - i} | 翻译 | 中 | 说明 |" for i in range(1, 51)
+        )
+        return (
+            "第一步：产品解析\n\n"
+            "| 序号 | 广告组分类 | 相关性评分 | 韩文关键词 | 月总搜索量 | 中文翻译 | 竞争度 | 推荐策略与说明 |\n"
+            "|---|---|---|---|---|---|---|---|\n"
+            f"{rows}\n\n第四步：否定关键词列表\n"
+        )
+
+    def _generate(self, contents, stream: bool, cached_files: int = 0):
+        self.calls += 1
+        parts = contents if isinstance(contents, (list, tuple)) else [contents]
+        # 多轮对话 contents：[{"role": ..., "parts": [...]}, ...]
+        flat = [p for c in parts for p in (c["parts"] if isinstance(c, dict) else [c])]
+        files = sum(1 for p in flat if isinstance(p, _FakeFile))
+        self.file_parts += files
+        self.cached_file_parts += cached_files
+        prompt = flat[-1]
+        text = self.step1_text() if "LXU_KEYWORDS_START" in str(prompt) else self.step3_text()
+        # 未缓存的文件每次都要重新处理：按 file_latency_s 计入延迟
+        latency = self.latency_s + files * self.file_latency_s
+        if stream:
+            return _FakeStreamResponse(text, latency)
+        time.sleep(latency)
+        return _FakeResponse(text)
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        return self._generate(contents, stream)
+
+    def from_cached_content(self, cached_content=None):
+        return _FakeCachedModel(self, cached_content)
+
+
+class _FakeCachedModel:
+    # from_cached_content 的替身：文件已在缓存上下文里，请求只带文字
+    def __init__(self, base: FakeGeminiModel, cached):
+        self.base = base
+        self.cached = cached
+        self.model_name = base.model_name
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        return self.base._generate(contents, stream, cached_files=len(self.cached.contents))
+
+
+class _FakeCachedContent:
+    def __init__(self, name: str, contents):
+        self.name = name
+        self.contents = list(contents)
+        self.deleted = False
+
+    def delete(self):
+        self.deleted = True
+
+
+class _FakeState:
+    def __init__(self, name: str):
+        self.name = name
+
+
+class _FakeFile:
+    def __init__(self, name: str, state: str = "ACTIVE"):
+        self.name = name
+        self.state = _FakeState(state)
+
+
+def install_fake_genai(upload_latency_s: float = 0.3):
+    # 替换 genai 的文件接口（上传/查询/删除），只在基准测试进程内生效
+    counter = itertools.count(1)
+
+    def upload_file(path=None, mime_type=None, display_name=None, **kwargs):
+        time.sleep(upload_latency_s)
+        return _FakeFile(f"files/fake-{next(counter)}")
+
+    def create_cached(model=None, contents=None, ttl=None, display_name=None, **kwargs):
+        return _FakeCachedContent(f"cachedContents/fake-{next(counter)}", contents or [])
+
+    genai.upload_file = upload_file
+    genai.get_file = lambda name: _FakeFile(name)
+    genai.delete_file = lambda name: None
+    caching.CachedContent.create = staticmethod(create_cached)
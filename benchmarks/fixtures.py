@@ -0,0 +1,52 @@
+import io
+import random
+
+from PIL import Image, ImageDraw
+
+
+def _draw_detail_block(d: ImageDraw.ImageDraw, w: int, y: int, rnd: random.Random) -> int:
+    # 模拟详情页的一个区块：标题文字行 + 产品图色块，区块之间留白
+    for i in range(rnd.randint(2, 5)):
+        d.rectangle((80, y, 80 + rnd.randint(w // 3, w - 160), y + 28), fill=(40, 40, 40))
+        y += 48
+    ph = rnd.randint(300, 900)
+    d.rectangle((60, y + 20, w - 60, y + 20 + ph), fill=(rnd.randint(0, 255), rnd.randint(0, 255), rnd.randint(0, 255)))
+    for _ in range(30):
+        x0, y0 = rnd.randint(60, w - 200), rnd.randint(y + 20, y + ph)
+        d.ellipse((x0, y0, x0 + 120, y0 + 120), fill=(rnd.randint(0, 255), 120, 160))
+    return y + ph + rnd.randint(60, 200)
+
+
+def make_long_image(width: int = 860, height: int = 12000, seed: int = 1) -> Image.Image:
+    rnd = random.Random(seed)
+    im = Image.new("RGB", (width, height), "white")
+    d = ImageDraw.Draw(im)
+    y = 40
+    while y < height - 200:
+        y = _draw_detail_block(d, width, y, rnd)
+    return im
+
+
+def make_color_block_image(width: int = 860, height: int = 4200) -> Image.Image:
+    # 回归用例：白底上的通栏纯色色块 + 通栏色带（横幅 / 色卡），这些行方差为 0，但不是留白
+    im = Image.new("RGB", (width, height), "white")
+    d = ImageDraw.Draw(im)
+    d.rectangle((0, 200, width - 1, 1600), fill=(220, 30, 40))
+    colors = [(30, 60, 200), (250, 200, 0), (20, 160, 80), (120, 40, 160)]
+    for i, y in enumerate(range(1900, 3900, 250)):
+        d.rectangle((0, y, width - 1, y + 199), fill=colors[i % len(colors)])
+    return im
+
+
+def make_long_image_bytes(width: int = 860, height: int = 12000, seed: int = 1, fmt: str = "PNG") -> bytes:
+    buf = io.BytesIO()
+    make_long_image(width, height, seed).save(buf, format=fmt)
+    return buf.getvalue()
+
+
+def make_pdf_bytes(pages: int = 10, width: int = 1240, height: int = 1754, seed: int = 1) -> bytes:
+    # 用 PIL 生成多页 PDF（每页是一张位图，接近供应商导出的图片型 PDF）
+    images = [make_long_image(width, height, seed + i) for i in range(pages)]
+    buf = io.BytesIO()
+    images[0].save(buf, format="PDF", save_all=True, append_images=images[1:], resolution=150)
+    return buf.getvalue()
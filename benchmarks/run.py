@@ -0,0 +1,311 @@
+"""
+离线基准测试入口（仓库根目录执行）：
+
+    python -m benchmarks.run                       # 全部阶段，结果 JSON 打印到 stdout
+    python -m benchmarks.run --stages naver slicing --out bench.json
+    python -m benchmarks.run --latency-ms 120 --rate-429 0.1 --naver-batch 5
+
+每个阶段在独立子进程中运行，peak_rss_mb 是该子进程自身的峰值常驻内存，互不干扰。
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+STAGES = ("naver", "slicing", "packaging", "reports", "end_to_end")
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 单位是字节，Linux 是 KB
+    return round(rss / (1024.0 * 1024.0) if sys.platform == "darwin" else rss / 1024.0, 1)
+
+
+def _seeds(n):
+    from benchmarks.fakes import fake_keyword
+    return [f"{fake_keyword(i)} {fake_keyword(i + 500, 2)}" for i in range(n)]
+
+
+def bench_naver(p):
+    from benchmarks.fakes import FakeKeywordstoolServer
+    from keyword_expand import ExpandConfig, expand_market
+    from naver_api import HOP_COL, NaverClient, NaverLookup, fetch_naver_data
+    from relevance import RankConfig
+
+    with FakeKeywordstoolServer(p["latency_ms"], p["rate_429"], p["rows_per_hint"]) as server:
+        client = NaverClient("bench", "bench", "bench", base_url=server.base_url, backoff_base=0.05)
+        lookup = NaverLookup(client)
+        seeds = _seeds(p["seeds"])
+        t0 = time.perf_counter()
+        df, failures = fetch_naver_data(seeds, client, batch_size=p["naver_batch"], lookup=lookup)
+        hop1_s = time.perf_counter() - t0
+        cfg = ExpandConfig(enabled=p["expand_depth"] > 1, max_depth=p["expand_depth"])
+        df = expand_market(df, seeds, lookup.fetch, cfg, RankConfig(), max_workers=client.limiter.max_limit)
+        wall = time.perf_counter() - t0
+        return {
+            "hop1_s": hop1_s,
+            "rows_by_hop": {int(k): int(v) for k, v in df[HOP_COL].value_counts().sort_index().items()} if not df.empty else {},
+            "wall_s": wall,
+            "requests": server.requests,
+            "throttled": server.throttled,
+            "requests_per_s": server.requests / wall if wall else None,
+            "seeds": p["seeds"],
+            "rows": len(df),
+            "failures": len(failures),
+            "final_concurrency": client.limiter.limit,
+            "output_bytes": int(df.memory_usage(deep=True).sum()) if not df.empty else 0,
+        }
+
+
+def check_color_blocks(cfg):
+    # 回归检查：通栏纯色色块 / 色带必须被切片覆盖（不能当留白丢掉）
+    from benchmarks.fixtures import make_color_block_image
+    from material_pack import plan_cuts
+
+    im = make_color_block_image(width=cfg.target_w)
+    covered = [False] * im.size[1]
+    for y0, y1, _ in plan_cuts(im, cfg):
+        covered[y0:y1] = [True] * (y1 - y0)
+    missing = [y for y in (200, 900, 1599, 1900, 2150, 3850) if not covered[y]]
+    if missing:
+        raise AssertionError(f"纯色色块未被切片覆盖: y={missing}")
+
+
+def bench_slicing(p):
+    from benchmarks.fixtures import make_long_image
+    from material_pack import PackConfig, resize_to_width, slice_vertical
+
+    cfg = PackConfig()
+    check_color_blocks(cfg)
+    pages = [make_long_image(height=p["image_height"], seed=i) for i in range(p["pages"])]
+    t0 = time.perf_counter()
+    n_slices = 0
+    for im in pages:
+        n_slices += len(slice_vertical(resize_to_width(im, cfg.target_w), cfg))
+    wall = time.perf_counter() - t0
+    return {"wall_s": wall, "pages": len(pages), "slices": n_slices, "slices_per_s": n_slices / wall if wall else None}
+
+
+def _pack_inputs(p):
+    import pandas as pd
+    df = pd.DataFrame({
+        "Naver实际搜索词": _seeds(300),
+        "词组属性": ["💡 衍生拓展词"] * 300,
+        "月总搜索量": list(range(300)),
+        "竞争度": ["중간"] * 300,
+        "AI溯源(原词)": ["seed"] * 300,
+    })
+    return df
+
+
+def bench_packaging(p):
+    from benchmarks.fakes import FakeGeminiModel
+    from benchmarks.fixtures import make_pdf_bytes
+    from material_pack import PackConfig, write_feed_to_master_zip
+    from output_writer import SpooledZipWriter
+
+    pdf = make_pdf_bytes(pages=p["pdf_pages"])
+    model = FakeGeminiModel(latency_s=0)
+    df = _pack_inputs(p)
+    out = SpooledZipWriter()
+    t0 = time.perf_counter()
+    write_feed_to_master_zip(
+        master_zip=out,
+        folder_name="bench",
+        uploaded_filename="bench.pdf",
+        uploaded_bytes=pdf,
+        cfg=PackConfig(codec=p["codec"]),
+        kw_list=_seeds(40),
+        df_market=df,
+        final_df=df,
+        res1_text=model.step1_text(),
+        res3_text=model.step3_text(),
+        out_root="FEED_bench",
+    )
+    out.close()
+    wall = time.perf_counter() - t0
+    size = out.size
+    out.discard()
+    return {"wall_s": wall, "pdf_pages": p["pdf_pages"], "input_bytes": len(pdf), "output_bytes": size, "codec": p["codec"]}
+
+
+def bench_reports(p):
+    from benchmarks.fakes import FakeGeminiModel
+    from reports import build_excel_bytes, build_html_report
+
+    model = FakeGeminiModel(latency_s=0)
+    res1, res3 = model.step1_text(), model.step3_text()
+    t0 = time.perf_counter()
+    total = 0
+    for i in range(p["reports"]):
+        total += len(build_excel_bytes(res1, res3))
+        total += len(build_html_report(f"bench{i}", res1, res3).encode("utf-8"))
+    wall = time.perf_counter() - t0
+    return {"wall_s": wall, "reports": p["reports"], "reports_per_s": p["reports"] / wall if wall else None, "output_bytes": total}
+
+
+def bench_end_to_end(p):
+    from benchmarks.fakes import FakeGeminiModel, FakeKeywordstoolServer, install_fake_genai
+    from benchmarks.fixtures import make_long_image_bytes, make_pdf_bytes
+    from naver_api import NaverClient
+    from output_writer import SpooledZipWriter
+    from pipeline import PipelineContext, ProductJob, run_batch
+
+    install_fake_genai(upload_latency_s=p["upload_latency_s"])
+    if p["input"] == "pdf":
+        jobs = [ProductJob(file_name=f"bench{i}.pdf", data=make_pdf_bytes(pages=p["pdf_pages"], seed=i)) for i in range(p["products"])]
+    else:
+        jobs = [ProductJob(file_name=f"bench{i}.png", data=make_long_image_bytes(height=6000, seed=i)) for i in range(p["products"])]
+    with FakeKeywordstoolServer(p["latency_ms"], p["rate_429"], p["rows_per_hint"]) as server:
+        out = SpooledZipWriter()
+        ctx = PipelineContext(
+            model=FakeGeminiModel(latency_s=p["gemini_latency_s"], n_keywords=p["seeds"], file_latency_s=p["file_latency_s"]),
+            naver_client=NaverClient("bench", "bench", "bench", base_url=server.base_url, backoff_base=0.05),
+            batch_size=p["naver_batch"],
+            output=out,
+            product_parts=p["product_parts"],
+        )
+        ctx.pack_cfg.codec = p["codec"]
+        ctx.stream_step1 = not p["no_stream"]
+        ctx.context_mode = p["context_mode"]
+        ctx.upload_cfg.enabled = not p["no_upload_optimize"]
+        stage_time = {}
+        started = {}
+        first_result = []
+
+        def on_event(event):
+            key = (event.job.file_name, event.stage)
+            if event.kind == "stage_start":
+                started[key] = time.perf_counter()
+            elif event.kind == "stage_done":
+                stage_time[event.stage] = stage_time.get(event.stage, 0.0) + time.perf_counter() - started[key]
+                # 第一个产品的结果可以下载的时刻：分包模式 = 打包完成；否则要等总包 close
+                if event.stage == "package" and not first_result and p["product_parts"]:
+                    first_result.append(time.perf_counter() - t0)
+
+        t0 = time.perf_counter()
+        results = run_batch(jobs, ctx, on_event=on_event, gemini_workers=p["gemini_workers"], package_workers=p["package_workers"])
+        out.close()
+        wall = time.perf_counter() - t0
+        size = out.size
+        out.discard()
+        return {
+            "wall_s": wall,
+            "products": len(jobs),
+            "failed": sum(1 for v in results.values() if v),
+            "products_per_min": len(jobs) * 60.0 / wall if wall else None,
+            "first_result_s": first_result[0] if first_result else wall,
+            "stage_busy_s": stage_time,
+            "naver_requests": server.requests,
+            "gemini_calls": ctx.model.calls,
+            "gemini_file_parts": ctx.model.file_parts,
+            "gemini_cached_file_parts": ctx.model.cached_file_parts,
+            "input_bytes": sum(len(job.data) for job in jobs),
+            "upload_bytes": sum(job.profile.to_dict()["counters"].get("gemini.upload_bytes", 0) for job in jobs),
+            "page_decodes": sum(1 for job in jobs for sp in job.profile.to_dict()["spans"] if sp["name"] in ("pdf.render", "image.decode")),
+            "output_bytes": size,
+            "part_bytes": sum(job.part.size for job in jobs if job.part is not None),
+        }
+
+
+BENCHES = {
+    "naver": bench_naver,
+    "slicing": bench_slicing,
+    "packaging": bench_packaging,
+    "reports": bench_reports,
+    "end_to_end": bench_end_to_end,
+}
+
+
+def _child(name, params, conn):
+    try:
+        result = BENCHES[name](params)
+        result["peak_rss_mb"] = _peak_rss_mb()
+        conn.send(result)
+    except Exception as e:
+        conn.send({"error": f"{type(e).__name__}: {e}"})
+    finally:
+        conn.close()
+
+
+def run_stage(name, params):
+    # spawn：每个阶段一个干净进程，峰值内存不被前一个阶段污染
+    ctx = multiprocessing.get_context("spawn")
+    parent, child = ctx.Pipe(duplex=False)
+    proc = ctx.Process(target=_child, args=(name, params, child))
+    proc.start()
+    child.close()
+    result = parent.recv()
+    proc.join()
+    return result
+
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="LxU 离线基准测试")
+    ap.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    ap.add_argument("--out", help="结果 JSON 写入该文件（缺省打印到 stdout）")
+    ap.add_argument("--seeds", type=int, default=50, help="每个产品的种子词数")
+    ap.add_argument("--latency-ms", type=float, default=80, help="keywordstool 替身每请求延迟")
+    ap.add_argument("--rate-429", type=float, default=0.05, help="keywordstool 替身返回 429 的概率")
+    ap.add_argument("--rows-per-hint", type=int, default=40, help="每个 hint 返回的联想词条数")
+    ap.add_argument("--naver-batch", type=int, default=1)
+    ap.add_argument("--expand-depth", type=int, default=1, help="naver：多层拓词层数（1 = 只查种子词）")
+    ap.add_argument("--pages", type=int, default=3, help="slicing：长图张数")
+    ap.add_argument("--image-height", type=int, default=12000)
+    ap.add_argument("--pdf-pages", type=int, default=10)
+    ap.add_argument("--codec", choices=["png", "webp", "jpeg"], default="png")
+    ap.add_argument("--reports", type=int, default=20)
+    ap.add_argument("--products", type=int, default=6)
+    ap.add_argument("--gemini-latency-s", type=float, default=0.5)
+    ap.add_argument("--upload-latency-s", type=float, default=0.3)
+    ap.add_argument("--gemini-workers", type=int, default=2)
+    ap.add_argument("--package-workers", type=int, default=1)
+    ap.add_argument("--file-latency-s", type=float, default=0.0, help="Gemini 替身每次处理未缓存文件的额外延迟")
+    ap.add_argument("--context-mode", choices=("separate", "chat", "cached"), default="separate")
+    ap.add_argument("--input", choices=("png", "pdf"), default="png", help="end_to_end：产品文件类型（pdf 页数见 --pdf-pages）")
+    ap.add_argument("--no-upload-optimize", action="store_true", help="end_to_end：原文件直接上传，不做压缩拼版")
+    ap.add_argument("--product-parts", action="store_true", help="end_to_end：每个产品先写分包、完成即可下载，再并入总包")
+    ap.add_argument("--no-stream", action="store_true", help="end_to_end：第一步不用流式生成 / 不提前查 Naver")
+    return ap.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    params = {k: v for k, v in vars(args).items() if k not in ("stages", "out")}
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "params": params,
+        },
+        "stages": {},
+    }
+    for name in args.stages:
+        print(f"▶ {name} ...", file=sys.stderr, flush=True)
+        result = run_stage(name, params)
+        report["stages"][name] = result
+        print(f"  {name}: " + (result.get("error") or f"{result['wall_s']:.2f}s, peak RSS {result.get('peak_rss_mb')} MB"), file=sys.stderr, flush=True)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    return 1 if any("error" in r for r in report["stages"].values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,186 @@
+"""
+LxU 测品流水线命令行入口（无需 Streamlit，适合 cron / 服务器批量跑）。
+
+用法示例：
+    python cli.py ./详情页 ./输出 --gemini-workers 3 --naver-batch 5
+    python cli.py ./详情页 ./输出 --zip --credentials .streamlit/secrets.toml
+
+凭据读取顺序：--credentials 文件（.toml / .json）> 环境变量
+    GEMINI_API_KEY / API_KEY / SECRET_KEY / CUSTOMER_ID（与 Streamlit Secrets 同名）
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11
+    tomllib = None
+
+import google.generativeai as genai
+
+from gemini_cache import GeminiResponseCache
+from gemini_files import GeminiUploadManager
+from job_store import JobCheckpointStore
+from keyword_store import KeywordMarketStore
+from naver_api import NaverClient
+from naver_cache import NaverKeywordCache
+from output_writer import DirectoryWriter, SpooledZipWriter
+from pipeline import CONTEXT_MODES, PipelineContext, load_jobs, run_batch
+from quota import QuotaGovernor
+
+CREDENTIAL_KEYS = ("GEMINI_API_KEY", "API_KEY", "SECRET_KEY", "CUSTOMER_ID")
+STAGE_LABELS = {"prepare": "预处理", "step1": "第一步", "naver": "Naver 拓词", "step3": "第三步", "package": "打包"}
+
+
+def load_credentials(path=None):
+    creds = {k: os.environ.get(k) for k in CREDENTIAL_KEYS}
+    if path:
+        with open(path, "rb") as f:
+            if path.endswith(".toml"):
+                if tomllib is None:
+                    raise SystemExit("读取 .toml 凭据需要 Python 3.11+，请改用 .json")
+                data = tomllib.load(f)
+            else:
+                data = json.load(f)
+        creds.update({k: data[k] for k in CREDENTIAL_KEYS if data.get(k)})
+    missing = [k for k in CREDENTIAL_KEYS if not creds.get(k)]
+    if missing:
+        raise SystemExit(f"⚠️ 缺少 API 密钥: {', '.join(missing)}")
+    return creds
+
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="LxU 测品策略生成器 - 命令行批处理")
+    ap.add_argument("input_dir", help="详情页目录（pdf/png/jpg/jpeg）")
+    ap.add_argument("output_dir", help="结果输出目录")
+    ap.add_argument("--credentials", help="凭据文件（.toml 或 .json），缺省读环境变量")
+    ap.add_argument("--model", default="gemini-2.5-flash")
+    ap.add_argument("--cache-dir", default=os.environ.get("LXU_CACHE_DIR", ".lxu_cache"))
+    ap.add_argument("--gemini-workers", type=int, default=2, help="Gemini 阶段同时处理的产品数")
+    ap.add_argument("--naver-workers", type=int, default=1, help="同时拓词的产品数（单产品内部并发由 AIMD 自动调节）")
+    ap.add_argument("--prepare-workers", type=int, default=1, help="预处理（解码/渲染 + 压缩拼版）同时处理的产品数")
+    ap.add_argument("--package-workers", type=int, default=1, help="打包阶段同时处理的产品数")
+    ap.add_argument("--naver-batch", type=int, default=1, choices=range(1, 6), metavar="1-5", help="每次 Naver 请求合并的种子词数")
+    ap.add_argument("--naver-cache-hours", type=float, default=72)
+    ap.add_argument("--expand-depth", type=int, default=1, help="多层拓词层数：1 = 只查种子词，≥2 = 拿最相关的衍生词继续往下查")
+    ap.add_argument("--expand-frontier", type=int, default=40, help="多层拓词每层最多再查的衍生词数")
+    ap.add_argument("--expand-budget", type=int, default=20, help="多层拓词的总请求数上限（每个请求 5 个词）")
+    ap.add_argument("--naver-rps", type=float, default=10, help="Naver 每秒请求上限（按 CUSTOMER_ID）")
+    ap.add_argument("--naver-daily", type=int, default=0, help="Naver 每日请求上限，0 = 不限（计数与 Streamlit 共用缓存目录时共享）")
+    ap.add_argument("--gemini-rpm", type=float, default=60, help="Gemini 每分钟生成调用上限")
+    ap.add_argument("--gemini-daily", type=int, default=0, help="Gemini 每日生成调用上限，0 = 不限")
+    ap.add_argument("--force-refresh", action="store_true", help="忽略 Naver 缓存重新查询")
+    ap.add_argument("--category", default="", help="本批品类标签（写入历史关键词库）")
+    ap.add_argument("--no-resume", action="store_true", help="不从断点续跑（仍会保存本次各阶段的断点）")
+    ap.add_argument("--no-gemini-cache", action="store_true", help="不复用 Gemini 缓存结果")
+    ap.add_argument("--no-rank", action="store_true", help="第三步不做本地相关性预筛（原样传 CSV）")
+    ap.add_argument("--prompt-budget", type=int, default=2500, help="第三步市场数据的估算 token 预算")
+    ap.add_argument("--context-mode", choices=CONTEXT_MODES, default="separate", help="第一步/第三步如何共享产品文件")
+    ap.add_argument("--no-stream", action="store_true", help="第一步不用流式生成（也不提前查 Naver）")
+    ap.add_argument("--no-upload-optimize", action="store_true", help="原文件直接上传 Gemini，不做压缩拼版")
+    ap.add_argument("--feed-layout", choices=["dir", "zip"], default="dir")
+    ap.add_argument("--codec", choices=["png", "webp", "jpeg"], default="png")
+    ap.add_argument("--quality", type=int, default=85)
+    ap.add_argument("--no-dedupe", action="store_true", help="喂料包保留所有切片，不合并近似重复的")
+    ap.add_argument("--dedupe-hamming", type=int, default=16, help="切片感知哈希（256 位）差异 ≤ 此位数才进入像素复核")
+    ap.add_argument("--dedupe-max-diff", type=float, default=5.0, help="像素复核：缩略图 4×4 块平均灰度差 ≤ 此值才合并")
+    ap.add_argument("--page-range", default="", help="PDF 页码范围，如 1-5,8")
+    ap.add_argument("--zip", action="store_true", help="输出单个 LxU_批量测品结果合集.zip，而不是目录")
+    return ap.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    creds = load_credentials(args.credentials)
+    genai.configure(api_key=creds["GEMINI_API_KEY"])
+
+    jobs = load_jobs(args.input_dir)
+    if not jobs:
+        print(f"目录中没有可处理的文件: {args.input_dir}", file=sys.stderr)
+        return 1
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    output = SpooledZipWriter() if args.zip else DirectoryWriter(args.output_dir)
+
+    governor = QuotaGovernor(os.path.join(args.cache_dir, "api_quota.sqlite3"))
+    naver_quota = governor.limiter("naver", creds["CUSTOMER_ID"], rate=args.naver_rps, burst=max(1.0, args.naver_rps), daily_limit=args.naver_daily)
+    ctx = PipelineContext(
+        model=genai.GenerativeModel(args.model),
+        naver_client=NaverClient(creds["API_KEY"], creds["SECRET_KEY"], creds["CUSTOMER_ID"], quota=naver_quota),
+        gemini_quota=governor.limiter("gemini", creds["GEMINI_API_KEY"], rate=args.gemini_rpm / 60.0, burst=5, daily_limit=args.gemini_daily),
+        naver_cache=NaverKeywordCache(os.path.join(args.cache_dir, "naver_keywordstool.sqlite3")),
+        force_refresh=args.force_refresh,
+        cache_ttl=args.naver_cache_hours * 3600,
+        batch_size=args.naver_batch,
+        response_cache=None if args.no_gemini_cache else GeminiResponseCache(os.path.join(args.cache_dir, "gemini_responses.sqlite3")),
+        upload_manager=GeminiUploadManager(os.path.join(args.cache_dir, "gemini_uploads.sqlite3")),
+        output=output,
+        feed_layout=args.feed_layout,
+        stream_step1=not args.no_stream,
+        context_mode=args.context_mode,
+        keyword_store=KeywordMarketStore(os.path.join(args.cache_dir, "keyword_market.sqlite3")),
+        category=args.category,
+        checkpoints=JobCheckpointStore(os.path.join(args.cache_dir, "job_checkpoints.sqlite3")),
+        # 强制刷新 Naver / 不用 Gemini 缓存 = 想要新结果，也不读旧断点
+        resume=not (args.no_resume or args.force_refresh or args.no_gemini_cache),
+    )
+    ctx.pack_cfg.page_range = args.page_range
+    ctx.rank_cfg.enabled = not args.no_rank
+    ctx.rank_cfg.token_budget = args.prompt_budget
+    ctx.expand_cfg.enabled = args.expand_depth > 1
+    ctx.expand_cfg.max_depth = args.expand_depth
+    ctx.expand_cfg.frontier = args.expand_frontier
+    ctx.expand_cfg.request_budget = args.expand_budget
+    ctx.pack_cfg.codec = args.codec
+    ctx.pack_cfg.quality = args.quality
+    ctx.pack_cfg.dedupe = not args.no_dedupe
+    ctx.pack_cfg.dedupe_hamming = args.dedupe_hamming
+    ctx.pack_cfg.dedupe_max_diff = args.dedupe_max_diff
+    ctx.upload_cfg.enabled = not args.no_upload_optimize
+
+    started = time.time()
+    done = [0]
+
+    def on_event(event):
+        name = event.job.file_name
+        if event.kind == "stage_done":
+            mark = "♻️ 断点恢复" if event.stage in event.job.resumed else "✅"
+            print(f"[{name}] {mark} {STAGE_LABELS[event.stage]}完成", flush=True)
+        elif event.kind == "job_failed":
+            print(f"[{name}] {event.data['label']}", file=sys.stderr, flush=True)
+        elif event.kind == "job_done":
+            done[0] += 1
+            print(f"进度 {done[0]}/{len(jobs)}  已用时 {time.time() - started:.0f}s", flush=True)
+
+    results = run_batch(
+        jobs, ctx,
+        on_event=on_event,
+        gemini_workers=args.gemini_workers,
+        naver_workers=args.naver_workers,
+        package_workers=args.package_workers,
+        prepare_workers=args.prepare_workers,
+    )
+
+    output.close()
+    if args.zip:
+        zip_path = os.path.join(args.output_dir, "LxU_批量测品结果合集.zip")
+        output.save_to(zip_path)
+        output.discard()
+        print(f"结果已写入 {zip_path}")
+    else:
+        print(f"结果已写入 {args.output_dir}")
+
+    lookup_stats = ctx.naver_lookup.stats()
+    print(f"Naver 查询 {lookup_stats['requested']} 次，其中 {lookup_stats['coalesced']} 次与其他产品合并")
+    for kind, u in sorted(governor.usage().items()):
+        print(f"{kind} 今日已调用 {u['today']}" + (f" / {u['daily_limit']}" if u["daily_limit"] > 0 else "") + " 次")
+    failed = {k: v for k, v in results.items() if v}
+    print(f"完成 {len(results) - len(failed)}/{len(results)} 个产品，用时 {time.time() - started:.0f}s")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
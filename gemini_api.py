@@ -0,0 +1,89 @@
+import time
+
+import profiling
+
+
+def safe_generate(model, contents, max_retries=3, cache=None, cache_key=None, quota=None):
+    # cache/cache_key 都给了才走缓存；失败文本（❌）不会被缓存
+    # quota（QuotaLimiter）：每次真实调用前按凭据限速 / 占日配额，额度不够时排队等待
+    if cache is not None and cache_key:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            profiling.count("gemini.cache_hit")
+            return cached
+
+    for attempt in range(1, max_retries + 1):
+        try:
+            if quota is not None:
+                quota.acquire()
+            profiling.count("gemini.calls")
+            with profiling.span("gemini.generate", attempt=attempt) as attrs:
+                try:
+                    res = model.generate_content(contents)
+                    text = res.text
+                except Exception as e:
+                    attrs["error"] = type(e).__name__
+                    raise
+            if cache is not None and cache_key:
+                cache.put(cache_key, text, getattr(model, "model_name", ""))
+            return text
+        except Exception as e:
+            profiling.count("gemini.errors")
+            if attempt < max_retries:
+                profiling.count("gemini.retries")
+                with profiling.span("gemini.retry_sleep"):
+                    time.sleep(3)
+            else:
+                return f"❌ 严重错误：API 连续 {max_retries} 次无响应或被安全拦截，无法生成内容。详情：{str(e)}"
+
+
+def stream_generate(model, contents, on_chunk=None, on_restart=None, max_retries=3, cache=None, cache_key=None, quota=None):
+    """
+    流式版 safe_generate：每收到一段文本调用 on_chunk(delta, text_so_far)。
+    中途出错整段重试，重试前调用 on_restart()；返回值与 safe_generate 一致（失败返回 ❌ 文本）。
+    """
+    if cache is not None and cache_key:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            profiling.count("gemini.cache_hit")
+            return cached
+
+    for attempt in range(1, max_retries + 1):
+        try:
+            if quota is not None:
+                quota.acquire()
+            profiling.count("gemini.calls")
+            with profiling.span("gemini.generate", attempt=attempt, stream=True) as attrs:
+                t0 = time.perf_counter()
+                parts = []
+                try:
+                    res = model.generate_content(contents, stream=True)
+                    for chunk in res:
+                        try:
+                            delta = chunk.text
+                        except ValueError:
+                            # 没有文本的分片（如只带 finish_reason），跳过
+                            continue
+                        if not parts:
+                            attrs["first_chunk_s"] = round(time.perf_counter() - t0, 3)
+                        parts.append(delta)
+                        if on_chunk is not None:
+                            on_chunk(delta, "".join(parts))
+                    # 被安全拦截等情况这里会抛异常，与非流式的 res.text 行为一致
+                    text = res.text
+                except Exception as e:
+                    attrs["error"] = type(e).__name__
+                    raise
+            if cache is not None and cache_key:
+                cache.put(cache_key, text, getattr(model, "model_name", ""))
+            return text
+        except Exception as e:
+            profiling.count("gemini.errors")
+            if attempt < max_retries:
+                profiling.count("gemini.retries")
+                if on_restart is not None:
+                    on_restart()
+                with profiling.span("gemini.retry_sleep"):
+                    time.sleep(3)
+            else:
+                return f"❌ 严重错误：API 连续 {max_retries} 次无响应或被安全拦截，无法生成内容。详情：{str(e)}"
@@ -0,0 +1,163 @@
+import concurrent.futures
+import datetime
+import io
+import mimetypes
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+import google.generativeai as genai
+from google.generativeai import caching
+
+import profiling
+
+# Gemini Files API 的文件默认 48 小时过期；拿不到过期时间时按 47 小时估算
+DEFAULT_FILE_LIFETIME = 47 * 3600
+
+
+def guess_mime_type(file_name: str) -> str:
+    mime_type, _ = mimetypes.guess_type(file_name)
+    return mime_type or "application/octet-stream"
+
+
+def wait_until_active(gen_file, poll_initial: float = 0.5, poll_max: float = 5.0, timeout: float = 600):
+    # 自适应轮询：0.5s 起步，每次 ×1.6，封顶 poll_max（小图通常第一次就 ACTIVE）
+    delay = poll_initial
+    deadline = time.time() + timeout
+    with profiling.span("gemini.poll") as attrs:
+        rounds = 0
+        while gen_file.state.name == "PROCESSING":
+            if time.time() > deadline:
+                raise TimeoutError(f"Gemini 文件处理超时: {gen_file.name}")
+            time.sleep(delay)
+            delay = min(poll_max, delay * 1.6)
+            gen_file = genai.get_file(gen_file.name)
+            rounds += 1
+        attrs["rounds"] = rounds
+    profiling.count("gemini.poll_rounds", rounds)
+    if gen_file.state.name == "FAILED":
+        raise RuntimeError(f"Gemini 文件处理失败: {gen_file.name}")
+    return gen_file
+
+
+def upload_bytes(data: bytes, file_name: str, **poll_kwargs):
+    # 直接从内存上传，不在工作目录落临时文件
+    profiling.count("gemini.upload_bytes", len(data))
+    with profiling.span("gemini.upload", bytes=len(data)):
+        gen_file = genai.upload_file(path=io.BytesIO(data), mime_type=guess_mime_type(file_name), display_name=file_name)
+        return wait_until_active(gen_file, **poll_kwargs)
+
+
+def create_cached_context(model, gen_file, ttl_seconds: float = 1800, display_name: str = ""):
+    """
+    把已上传的文件做成 Gemini 缓存上下文（CachedContent），返回 (绑定该上下文的模型, 缓存句柄)。
+    之后的请求只需发送文字指令，文件 token 按缓存计费、不再重复处理。
+    文件 token 数低于模型的缓存下限、或模型不支持时会抛异常，由调用方退回普通调用。
+    """
+    cached = caching.CachedContent.create(
+        model=getattr(model, "model_name", ""),
+        contents=[gen_file],
+        ttl=datetime.timedelta(seconds=ttl_seconds),
+        display_name=display_name[:100],
+    )
+    # from_cached_content 是类方法，经实例调用即可（测试桩可以用实例方法代替）
+    return model.from_cached_content(cached_content=cached), cached
+
+
+class GeminiUploadManager:
+    """
+    Gemini 文件上传管理：
+    - 按文件字节 sha256 去重：同一份文件在过期前直接复用云端文件（本地 SQLite 记录 hash -> 云端文件名）
+    - prefetch 把整批文件提前并发上传；同一 hash 同时只会有一个上传在进行
+    - 复用的文件不在产品结束时删除，由 Gemini 到期自动清理（或侧边栏一键清理）
+    """
+
+    def __init__(self, registry_path: str, max_workers: int = 4, reuse_margin: float = 3600):
+        folder = os.path.dirname(registry_path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.reuse_margin = reuse_margin
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gemini-upload")
+        self._inflight: Dict[str, concurrent.futures.Future] = {}
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(registry_path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS uploads (
+                hash TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                display_name TEXT NOT NULL,
+                uploaded_at REAL NOT NULL,
+                expires_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+
+    def _lookup(self, data_hash: str) -> Optional[Tuple[str, float]]:
+        with self._lock:
+            return self._conn.execute("SELECT name, expires_at FROM uploads WHERE hash = ?", (data_hash,)).fetchone()
+
+    def _record(self, data_hash: str, gen_file, file_name: str):
+        expires_at = time.time() + DEFAULT_FILE_LIFETIME
+        expiration = getattr(gen_file, "expiration_time", None)
+        if expiration is not None and hasattr(expiration, "timestamp"):
+            expires_at = expiration.timestamp()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO uploads (hash, name, display_name, uploaded_at, expires_at) VALUES (?, ?, ?, ?, ?)",
+                (data_hash, gen_file.name, file_name, time.time(), expires_at),
+            )
+            self._conn.commit()
+
+    def _forget(self, data_hash: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM uploads WHERE hash = ?", (data_hash,))
+            self._conn.commit()
+
+    def _obtain(self, data_hash: str, data: bytes, file_name: str):
+        row = self._lookup(data_hash)
+        if row is not None:
+            name, expires_at = row
+            if expires_at - time.time() > self.reuse_margin:
+                try:
+                    gen_file = wait_until_active(genai.get_file(name))
+                    profiling.count("gemini.upload_reused")
+                    return gen_file
+                except Exception:
+                    pass
+            self._forget(data_hash)
+        gen_file = upload_bytes(data, file_name)
+        self._record(data_hash, gen_file, file_name)
+        return gen_file
+
+    def _submit(self, data_hash: str, data: bytes, file_name: str) -> concurrent.futures.Future:
+        with self._lock:
+            fut = self._inflight.get(data_hash)
+            # 进行中的上传直接合并；已完成的在临近过期/失败时重新走 _obtain
+            if fut is not None and fut.done():
+                row = self._lookup(data_hash)
+                if fut.exception() is not None or row is None or row[1] - time.time() <= self.reuse_margin:
+                    fut = None
+            if fut is None:
+                # 上传记在发起方（prefetch 时激活的产品）的 profile 上
+                fut = self._executor.submit(profiling.bind(self._obtain), data_hash, data, file_name)
+                self._inflight[data_hash] = fut
+            return fut
+
+    def prefetch(self, items: Iterable[Tuple[str, bytes, str]]):
+        # items: (data_hash, data, file_name)
+        for data_hash, data, file_name in items:
+            self._submit(data_hash, data, file_name)
+
+    def get(self, data_hash: str, data: bytes, file_name: str):
+        return self._submit(data_hash, data, file_name).result()
+
+    def forget_all(self):
+        # 云端文件被手动清空后调用，避免继续复用已删除的文件
+        with self._lock:
+            self._inflight.clear()
+            self._conn.execute("DELETE FROM uploads")
+            self._conn.commit()
@@ -0,0 +1,157 @@
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import zipfile
+from typing import Any, Dict, Optional
+
+from output_writer import DirectoryWriter
+
+# 已压缩的产物（切片图片、嵌套 FEED.zip）拷回结果总包时不再 deflate
+_STORED_EXTS = (".png", ".webp", ".jpg", ".jpeg", ".zip")
+
+
+class _TeeWriter:
+    # 打包阶段的输出同时写进结果总包和本产品的断点产物目录
+    def __init__(self, primary, mirror: DirectoryWriter):
+        self.primary = primary
+        self.mirror = mirror
+        self.staging = mirror.root
+
+    def writestr(self, arcname: str, data, compress_type: Optional[int] = None):
+        self.primary.writestr(arcname, data, compress_type=compress_type)
+        self.mirror.writestr(arcname, data)
+
+
+class JobCheckpointStore:
+    """
+    产品级断点续跑（SQLite 记录各阶段产出 + artifacts/ 目录保存打包产物）：
+    - key：输入文件哈希 + 文件名 + 影响产出的设置（由调用方汇总成 settings）
+    - 每个阶段完成即写入该阶段的产出（JSON）；打包阶段的产物文件先写进独立的暂存目录，
+      该阶段断点提交后再整体替换成 artifacts/{key}/（同 key 的产品同时打包也不会互相删文件）
+    - 同一文件重跑时从最后完成的阶段继续；已打包完成的产品直接把产物拷进新的结果总包
+    - 超过 max_age_days 未更新的断点在启动时清理
+    """
+
+    def __init__(self, path: str, max_age_days: float = 7):
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.path = path
+        self.artifact_root = os.path.join(folder, "job_artifacts")
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                key TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (key, stage)
+            )
+            """
+        )
+        self._conn.commit()
+        self.prune(max_age_days * 86400)
+
+    @staticmethod
+    def make_key(data_hash: str, file_name: str, settings: Dict[str, Any]) -> str:
+        h = hashlib.sha256()
+        for part in (data_hash, file_name, json.dumps(settings, sort_keys=True, ensure_ascii=False)):
+            h.update(part.encode("utf-8"))
+            h.update(b"\x00")
+        return h.hexdigest()
+
+    def load(self, key: str) -> Dict[str, Dict[str, Any]]:
+        # {阶段名: 该阶段产出}；打包阶段的产物目录已不在时视为未完成
+        with self._lock:
+            rows = self._conn.execute("SELECT stage, payload FROM checkpoints WHERE key = ?", (key,)).fetchall()
+        stages = {stage: json.loads(payload) for stage, payload in rows}
+        if "package" in stages and not os.path.isdir(self._artifact_dir(key)):
+            stages.pop("package")
+        return stages
+
+    def save(self, key: str, stage: str, payload: Dict[str, Any], artifacts: Optional[_TeeWriter] = None):
+        # artifacts：artifact_writer 返回的写入器，断点提交后把它的暂存目录换成正式产物目录
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO checkpoints (key, stage, payload, updated_at) VALUES (?, ?, ?, ?)",
+                (key, stage, json.dumps(payload, ensure_ascii=False), time.time()),
+            )
+            self._conn.commit()
+            if artifacts is not None:
+                self._promote(key, artifacts.staging)
+
+    def _artifact_dir(self, key: str) -> str:
+        return os.path.join(self.artifact_root, key)
+
+    def artifact_writer(self, key: str, primary) -> _TeeWriter:
+        # 写进本次独占的暂存目录（"." 开头，不会被当成某个 key 的产物）；正式目录在 save 时才替换
+        os.makedirs(self.artifact_root, exist_ok=True)
+        staging = tempfile.mkdtemp(prefix=f".{key[:16]}.", dir=self.artifact_root)
+        return _TeeWriter(primary, DirectoryWriter(staging))
+
+    def discard_artifacts(self, writer: _TeeWriter):
+        # 打包失败：丢掉暂存目录，正式目录保持原样
+        shutil.rmtree(writer.staging, ignore_errors=True)
+
+    def _promote(self, key: str, staging: str):
+        # 目录不能直接 os.replace 到非空目录上：旧目录先挪开，新目录换进来，再删旧的。
+        # 两步之间崩溃只会让 load 认为打包未完成，下次重新打包
+        folder = self._artifact_dir(key)
+        old = f"{staging}.old"
+        if os.path.isdir(folder):
+            os.replace(folder, old)
+        os.replace(staging, folder)
+        shutil.rmtree(old, ignore_errors=True)
+
+    def copy_artifacts(self, key: str, output) -> int:
+        # 把保存的产物原样写进新的结果总包，返回文件数
+        folder = self._artifact_dir(key)
+        n = 0
+        for dirpath, _, filenames in os.walk(folder):
+            for name in sorted(filenames):
+                path = os.path.join(dirpath, name)
+                arcname = os.path.relpath(path, folder).replace(os.sep, "/")
+                with open(path, "rb") as f:
+                    data = f.read()
+                compress = zipfile.ZIP_STORED if name.lower().endswith(_STORED_EXTS) else None
+                output.writestr(arcname, data, compress_type=compress)
+                n += 1
+        return n
+
+    def prune(self, max_age_seconds: float):
+        cutoff = time.time() - max_age_seconds
+        with self._lock:
+            stale = [r[0] for r in self._conn.execute(
+                "SELECT key FROM checkpoints GROUP BY key HAVING MAX(updated_at) < ?", (cutoff,)
+            )]
+            self._conn.executemany("DELETE FROM checkpoints WHERE key = ?", [(k,) for k in stale])
+            self._conn.commit()
+        for key in stale:
+            shutil.rmtree(self._artifact_dir(key), ignore_errors=True)
+        # 进程中途退出留下的暂存目录
+        if os.path.isdir(self.artifact_root):
+            for name in os.listdir(self.artifact_root):
+                path = os.path.join(self.artifact_root, name)
+                if name.startswith(".") and os.path.getmtime(path) < cutoff:
+                    shutil.rmtree(path, ignore_errors=True)
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM checkpoints")
+            self._conn.commit()
+        shutil.rmtree(self.artifact_root, ignore_errors=True)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            products, packaged = self._conn.execute(
+                "SELECT COUNT(DISTINCT key), COUNT(DISTINCT CASE WHEN stage = 'package' THEN key END) FROM checkpoints"
+            ).fetchone()
+        return {"products": products, "packaged": packaged}
@@ -0,0 +1,130 @@
+import concurrent.futures
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import pandas as pd
+
+from naver_api import (
+    BATCH_FALLBACK_SEP,
+    HOP_COL,
+    MAX_HINTS_PER_REQUEST,
+    chunk_seeds,
+    clean_for_api,
+    normalize_keyword,
+    rows_from_keyword_list,
+)
+import profiling
+from relevance import SEED_ATTR, RankConfig, score_keywords
+
+
+@dataclass
+class ExpandConfig:
+    enabled: bool = False
+    max_depth: int = 2          # 最多拓几层：1 = 只查种子词（原行为），2 = 再拿衍生词当 hint 查一层，以此类推
+    frontier: int = 40          # 每层最多再查多少个衍生词
+    request_budget: int = 20    # 第 2 层起的总请求数上限（每个请求合并 5 个 hint）
+    min_volume: int = 100       # 月总搜索量低于此值的衍生词不再往下拓
+    min_score: float = 0.2      # 与种子词的相关性分（relevance.score_keywords）低于此值的不再往下拓
+
+
+def _origin(parent: str, origins: Dict[str, str]) -> str:
+    # 新行归属到父关键词的原词；批量归属失败（"a | b"）时取这一批父词各自的原词
+    if parent in origins:
+        return origins[parent]
+    found = dict.fromkeys(origins.get(h, h) for h in parent.split(BATCH_FALLBACK_SEP))
+    return BATCH_FALLBACK_SEP.join(found)
+
+
+def expand_market(
+    df_market: pd.DataFrame,
+    seeds: Sequence[str],
+    fetch: Callable[[str], List[Dict[str, Any]]],
+    cfg: ExpandConfig,
+    rank_cfg: RankConfig,
+    max_workers: int = 8,
+    on_progress: Optional[Callable[[int, int, int, List[str]], None]] = None,
+) -> pd.DataFrame:
+    """
+    在第一层拓词结果（fetch_naver_data 的 df_market）上做有界的广度优先多层拓词：
+    - 每层候选 = 上一层新出现的衍生词中搜索量 ≥ min_volume、相关性分 ≥ min_score 的，按分数取前 frontier 个
+      （先按搜索量粗筛到 frontier×8 个再打分）
+    - 全局去重：查过的 hint 不再查，表里已有的关键词不重复进表
+    - 候选每 5 个合并成一个请求并发查询（真实并发仍由 AIMD 控制），总请求数受 request_budget 限制
+    - 新行的 AI溯源(原词) 沿用父关键词的原词，拓展层级 = 所在层
+    on_progress(hop, completed, total, batch) 每完成一个请求回调一次（在调用线程中执行）。
+    拓展层的查询失败只计数、不影响已有结果。
+    """
+    if df_market.empty or not cfg.enabled or cfg.max_depth < 2:
+        return df_market
+
+    known = set(df_market["Naver实际搜索词"].map(normalize_keyword))
+    queried = {normalize_keyword(s) for s in seeds}
+    origins = dict(zip(df_market["Naver实际搜索词"], df_market["AI溯源(原词)"]))
+    layer = df_market[df_market["词组属性"] != SEED_ATTR]
+    budget = cfg.request_budget
+    added: List[pd.DataFrame] = []
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for hop in range(2, cfg.max_depth + 1):
+            if budget <= 0 or layer.empty:
+                break
+            with profiling.span("naver.expand", hop=hop) as attrs:
+                norm = layer["Naver实际搜索词"].map(normalize_keyword)
+                cand = layer[(layer["月总搜索量"] >= cfg.min_volume) & ~norm.isin(queried)]
+                # 相关性打分是逐词的 Python 循环：先按搜索量粗筛到 frontier 的若干倍再打分
+                cand = cand.nlargest(cfg.frontier * 8, "月总搜索量")
+                if cand.empty:
+                    break
+                scores = pd.Series(
+                    score_keywords(cand["Naver实际搜索词"].tolist(), cand["月总搜索量"].tolist(), seeds, rank_cfg), index=cand.index
+                )
+                cand = cand[scores >= cfg.min_score].assign(_score=scores).sort_values(
+                    by=["_score", "月总搜索量"], ascending=[False, False]
+                )
+                hints = cand["Naver实际搜索词"].head(min(cfg.frontier, budget * MAX_HINTS_PER_REQUEST)).tolist()
+                batches = chunk_seeds(hints, MAX_HINTS_PER_REQUEST)
+                if not batches:
+                    break
+                budget -= len(batches)
+                queried.update(normalize_keyword(h) for h in hints)
+
+                def fetch_batch(batch):
+                    return rows_from_keyword_list(fetch(",".join(clean_for_api(h) for h in batch)), batch)
+
+                rows = []
+                futures = {executor.submit(profiling.bind(fetch_batch), batch): batch for batch in batches}
+                for done, future in enumerate(concurrent.futures.as_completed(futures), start=1):
+                    batch = futures[future]
+                    try:
+                        new_rows = future.result()
+                    except Exception:
+                        profiling.count("naver.expand_failed")
+                        new_rows = []
+                    for row in new_rows:
+                        n = normalize_keyword(row["Naver实际搜索词"])
+                        if not n or n in known:
+                            continue
+                        known.add(n)
+                        row["AI溯源(原词)"] = _origin(row["AI溯源(原词)"], origins)
+                        origins[row["Naver实际搜索词"]] = row["AI溯源(原词)"]
+                        row[HOP_COL] = hop
+                        rows.append(row)
+                    if on_progress is not None:
+                        on_progress(hop, done, len(batches), batch)
+
+                layer = pd.DataFrame(rows)
+                attrs.update(hints=len(hints), requests=len(batches), rows=len(rows))
+                profiling.count("naver.expand_requests", len(batches))
+                profiling.count("naver.expand_rows", len(rows))
+                if not layer.empty:
+                    layer.insert(1, "词组属性", "💡 衍生拓展词")
+                    added.append(layer)
+
+    if not added:
+        return df_market
+    df = pd.concat([df_market, *added], ignore_index=True)
+    is_seed = df["词组属性"] == SEED_ATTR
+    return pd.concat([
+        df[is_seed].sort_values(by="月总搜索量", ascending=False),
+        df[~is_seed].sort_values(by="月总搜索量", ascending=False),
+    ])
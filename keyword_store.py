@@ -0,0 +1,197 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+from naver_api import normalize_keyword
+
+
+class KeywordMarketStore:
+    """
+    历史关键词市场数据的本地仓库（SQLite，只追加）。
+    - 每次 Naver 阶段产出的 df_market 整表写入：搜索词、月总搜索量、竞争度、来源种子词、产品、品类、快照日期
+    - 同一 (搜索词, 种子词, 产品, 快照日期) 只保留当天第一次写入，不覆盖历史
+    - 查询（查词 / 前缀、品类 Top-N、快照间搜索量变化）全部本地完成，不调用 API
+    """
+
+    def __init__(self, path: str):
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS keyword_market (
+                keyword TEXT NOT NULL,
+                keyword_norm TEXT NOT NULL,
+                monthly_total INTEGER NOT NULL,
+                comp_idx TEXT NOT NULL,
+                seed TEXT NOT NULL,
+                is_seed INTEGER NOT NULL,
+                product TEXT NOT NULL,
+                category TEXT NOT NULL,
+                snapshot TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                UNIQUE (keyword_norm, seed, product, snapshot)
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_km_norm ON keyword_market(keyword_norm, snapshot)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_km_category ON keyword_market(category, snapshot)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_km_snapshot ON keyword_market(snapshot)")
+        self._conn.commit()
+
+    def record(self, df_market: pd.DataFrame, product: str, category: str = "", fetched_at: Optional[float] = None) -> int:
+        if df_market is None or df_market.empty:
+            return 0
+        fetched_at = time.time() if fetched_at is None else fetched_at
+        snapshot = time.strftime("%Y-%m-%d", time.localtime(fetched_at))
+        rows = [
+            (
+                str(kw),
+                normalize_keyword(kw),
+                int(total),
+                str(comp),
+                str(seed),
+                int(attr == '🎯 目标原词'),
+                product,
+                category,
+                snapshot,
+                fetched_at,
+            )
+            for kw, attr, total, comp, seed in zip(
+                df_market["Naver实际搜索词"],
+                df_market["词组属性"],
+                df_market["月总搜索量"],
+                df_market["竞争度"],
+                df_market["AI溯源(原词)"],
+            )
+        ]
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO keyword_market "
+                "(keyword, keyword_norm, monthly_total, comp_idx, seed, is_seed, product, category, snapshot, fetched_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()
+            return self._conn.total_changes - before
+
+    def _query(self, sql: str, params=()) -> pd.DataFrame:
+        with self._lock:
+            cur = self._conn.execute(sql, params)
+            cols = [d[0] for d in cur.description]
+            return pd.DataFrame(cur.fetchall(), columns=cols)
+
+    @staticmethod
+    def _norm_filter(keyword: str, prefix: bool):
+        # 前缀查询用范围条件，才能走 keyword_norm 索引
+        norm = normalize_keyword(keyword)
+        if prefix:
+            return "keyword_norm >= ? AND keyword_norm < ?", (norm, norm + "\U0010ffff")
+        return "keyword_norm = ?", (norm,)
+
+    def lookup(self, keyword: str, prefix: bool = False, limit: int = 200) -> pd.DataFrame:
+        # 每个搜索词取最近一次快照（SQLite 中 MAX() 聚合时其余列取自该行）
+        where, params = self._norm_filter(keyword, prefix)
+        return self._query(
+            f"""
+            SELECT keyword, monthly_total, comp_idx, MAX(snapshot) AS snapshot,
+                   COUNT(DISTINCT snapshot) AS snapshots, GROUP_CONCAT(DISTINCT product) AS products
+            FROM keyword_market WHERE {where}
+            GROUP BY keyword_norm ORDER BY monthly_total DESC LIMIT ?
+            """,
+            params + (limit,),
+        )
+
+    def top_keywords(self, category: Optional[str] = None, n: int = 50, snapshot: Optional[str] = None) -> pd.DataFrame:
+        conds, params = [], []
+        if category is not None:
+            conds.append("category = ?")
+            params.append(category)
+        if snapshot:
+            conds.append("snapshot <= ?")
+            params.append(snapshot)
+        where = f"WHERE {' AND '.join(conds)}" if conds else ""
+        return self._query(
+            f"""
+            SELECT keyword, monthly_total, comp_idx, MAX(snapshot) AS snapshot, GROUP_CONCAT(DISTINCT seed) AS seeds
+            FROM keyword_market {where}
+            GROUP BY keyword_norm ORDER BY monthly_total DESC LIMIT ?
+            """,
+            tuple(params) + (n,),
+        )
+
+    def volume_changes(
+        self,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        category: Optional[str] = None,
+        keyword: str = "",
+        n: int = 100,
+    ) -> pd.DataFrame:
+        """
+        同一搜索词在 [since, until] 区间内最早与最晚两个快照的月搜索量对比，按变化绝对值排序。
+        只有一个快照的词不出现在结果里。
+        """
+        conds, params = [], []
+        if since:
+            conds.append("snapshot >= ?")
+            params.append(since)
+        if until:
+            conds.append("snapshot <= ?")
+            params.append(until)
+        if category is not None:
+            conds.append("category = ?")
+            params.append(category)
+        if keyword:
+            where, p = self._norm_filter(keyword, prefix=True)
+            conds.append(where)
+            params.extend(p)
+        where = f"WHERE {' AND '.join(conds)}" if conds else ""
+        df = self._query(
+            f"""
+            WITH daily AS (
+                SELECT keyword_norm, MIN(keyword) AS keyword, snapshot, MAX(monthly_total) AS monthly_total
+                FROM keyword_market {where}
+                GROUP BY keyword_norm, snapshot
+            ),
+            span AS (
+                SELECT keyword_norm, MIN(snapshot) AS first_snapshot, MAX(snapshot) AS last_snapshot
+                FROM daily GROUP BY keyword_norm HAVING COUNT(*) > 1
+            )
+            SELECT d1.keyword, s.first_snapshot, d1.monthly_total AS first_total,
+                   s.last_snapshot, d2.monthly_total AS last_total
+            FROM span s
+            JOIN daily d1 ON d1.keyword_norm = s.keyword_norm AND d1.snapshot = s.first_snapshot
+            JOIN daily d2 ON d2.keyword_norm = s.keyword_norm AND d2.snapshot = s.last_snapshot
+            """,
+            tuple(params),
+        )
+        if df.empty:
+            return df
+        df["change"] = df["last_total"] - df["first_total"]
+        df["change_pct"] = (df["change"] / df["first_total"].where(df["first_total"] > 0)).round(3)
+        return df.reindex(df["change"].abs().sort_values(ascending=False).index).head(n).reset_index(drop=True)
+
+    def snapshots(self) -> List[str]:
+        with self._lock:
+            return [r[0] for r in self._conn.execute("SELECT DISTINCT snapshot FROM keyword_market ORDER BY snapshot")]
+
+    def categories(self) -> List[str]:
+        with self._lock:
+            return [r[0] for r in self._conn.execute("SELECT DISTINCT category FROM keyword_market ORDER BY category")]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            rows, keywords, snapshots = self._conn.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT keyword_norm), COUNT(DISTINCT snapshot) FROM keyword_market"
+            ).fetchone()
+        return {"rows": rows, "keywords": keywords, "snapshots": snapshots}
@@ -1,20 +1,22 @@
 import streamlit as st
 import google.generativeai as genai
+import altair as alt
 import pandas as pd
-import time
 import os
-import re
-import requests
-import hashlib
-import hmac
-import base64
-import concurrent.futures
-import io
-import zipfile
-import markdown  # 🚀 新增：用于将文本渲染为极美网页排版
-
-# ✅ 喂料包（切片+CSV）写入（先写到单独zip，再塞进master_zip）
-from material_pack import PackConfig, write_feed_to_master_zip
+import uuid
+
+from gemini_cache import GeminiResponseCache
+from gemini_files import GeminiUploadManager
+from job_store import JobCheckpointStore
+from keyword_store import KeywordMarketStore
+from material_pack import parse_page_range
+from naver_cache import NaverKeywordCache
+from naver_api import HOP_COL, NaverClient
+from output_writer import SpooledZipWriter
+from quota import QuotaGovernor
+from scheduler import JobQueue
+# ✅ 流水线：预处理 -> 第一步 -> Naver -> 第三步 -> 打包，各阶段有界并发、产品间重叠执行
+from pipeline import CONTEXT_MODES, PipelineContext, ProductJob, stage_workers, submit_batch
 
 # ==========================================
 # 0. 页面与 Secrets 配置
@@ -31,234 +33,67 @@ if not all([GEMINI_API_KEY, NAVER_API_KEY, NAVER_SECRET_KEY, NAVER_CUSTOMER_ID])
     st.stop()
 
 genai.configure(api_key=GEMINI_API_KEY)
-SECRET_KEY_BYTES = NAVER_SECRET_KEY.encode("utf-8")
-NAVER_API_URL = "https://api.searchad.naver.com/keywordstool"
 
-# ==========================================
-# 1. 核心指令
-# ==========================================
-PROMPT_STEP_1 = """
-你是一个在韩国市场拥有多年实战经验的电商运营专家，熟悉 Coupang 与 Naver SmartStore 的搜索机制和用户点击行为。你的整个运营团队都在中国，所以你必须遵守以下极其严格的【语言输出隔离规范】：
-1. 所有的“分析过程”、“策略解释”等描述性质的文字，必须 100% 使用【简体中文】！绝对禁止使用韩文解释！
-2. 只有“韩文关键词本身”、“韩语标题”和“商品好评的韩文原文”允许出现韩文，且必须全部附带对应的【中文翻译】。
-
---- 核心任务 ---
-基于我提供的商品图片，生成能够提高点击率、语义自然、本土化表达强、突出卖点的商品标题，同时兼顾搜索匹配。
-
-【品牌与通用规则】：
-- 品牌名全部默认固定为：LxU
-- 严禁使用夸张营销词（如 최고, 1위, 완벽 等）。
-- 标题中【绝对不要使用任何标点符号】，词语之间用空格自然隔开即可。
-- 标题必须【语句通顺自然】，符合真实韩国本土买家的搜索和阅读习惯。
-
-【💡 极度重要排版要求：一键复制功能】：
-你生成的“纯韩文逗号隔开的后台关键词”以及“纯韩文评价”，必须单独放在 Markdown 代码块里面！
-**警告：代码块开头只允许写三个反引号 ``` ，绝对不允许出现 ```text 或任何字母！代码块内只有纯韩文（如果是关键词加逗号），不允许有其他多余解释！**
-
-第一部分：Coupang 专属优化 (偏转化与清晰表达)
-1. 标题公式：LxU + 核心卖点 + 关键规格或属性 + 使用场景或解决问题点。核心词必须放前面。
--> 输出带中文翻译的标题（韩文标题务必放在上述要求的代码块里）。
-2. 挖掘 20 个 Coupang 后台精准关键词（2~20字符）。
--> 必须以 Markdown 表格输出：【序号 | Coupang韩文关键词 | 中文翻译 | 纯中文策略解释】。
--> 表格下方，单独把这20个纯韩文词用逗号隔开，并务必放在上述要求的代码块里输出。
-
-第二部分：Naver 专属优化 (偏搜索覆盖与曝光)
-1. 标题规则：LxU + 核心词 + 修饰词与长尾词，加入更多用户搜索表达。
--> 输出带中文翻译的标题（韩文标题务必放在代码块里）。
-2. 挖掘 20 个 Naver 后台扩展关键词（偏搜索扩展）。
--> 必须以 Markdown 表格输出：【序号 | Naver韩文关键词 | 中文翻译 | 纯中文策略解释】。
--> 表格下方，单独把这20个纯韩文词用逗号隔开，并务必放在代码块里输出。
-
-第三部分：基于锚点闭环的“付费推广查量种子词/模板”（此阶段无真实流量数据）
-
-重要定位：
-- 本阶段的输出用于下一步送入 Naver API 做扩展与查量（种子词/组合模板）。
-- 不允许输出“最终可投结论”，不允许编造具体流量数值。
-- “预估流量”只能填：高 / 中 / 低（代表查量优先级，不是实际流量）。
-
-A) 先建立类目锚点闭环（必须先输出，且简洁）
-1) 主体锚点（1~3个，韩文+中文）：必须是商品实体名词
-2) 必须属性锚点（3~8个，韩文+中文）：决定类目边界（规格/结构/适配对象/接口等）
-3) 排他红线（至少8个，中文即可）：与本产品绝对冲突或明显跨类目的方向
-4) 高风险黑名单（至少10个，中文即可）：行业词/上位泛词/服务词（例：시공, 공사, 수리, 업체, 자재, 공구 등）
-
-B) 关键词生成范围（强制约束）
-你只能输出两类内容：
-- 类1：详情页明确出现或可直接同义替换的“主体词/属性词”
-- 类2：由【主体锚点 + 必须属性锚点】拼接形成的“查询组合模板”
-禁止：
-- 生成与主体无关的行业词/服务词/泛词
-- 拆分关键词词根后再推导、再重组生成新语义
-- 仅输出纯场景词而不含主体（如 욕실/주방 单独出现）
-
-C) 三组广告结构（本阶段仅作为“查量优先级分组”，不是最终投放组）
-广告组一：【核心出单词】（优先查量）
-- 以主体锚点/主体同义词为主
-- 若主体偏泛（如 수전/밸브 等），必须用“必须属性或适配对象”形成组合模板
-- 输出 5~8 个
-
-广告组二：【精准长尾关键词】（主力查量）
-- 主体 + 必须属性（规格/结构/接口/适配对象/连接方式）
-- 输出 8~15 个
-
-广告组三：【长尾捡漏组】（补充查量）
-- 主体 + 可选属性 + 场景（仅限详情页明确出现的场景）
-- 输出 8~15 个
-
-D) 输出格式（必须严格执行）
-用 Markdown 表格输出，表头必须中文：
-
-| 序号 | 广告组分类 | 韩文关键词（候选/模板） | 中文翻译 | 中文策略解释 | 预估流量（高/中/低） | 相关性评分(1-5) |
-
-填写要求：
-- 相关性评分只根据“锚点闭环匹配度”给分：完全命中主体+必须属性=高分
-- 中文策略解释 ≤ 20字，说明该词属于主体词/主体+结构/主体+适配对象/主体+规格等
-- 若某词为“主体泛词”，策略解释中必须标注“需属性组合”
-- 禁止出现品牌名
-- 禁止使用“/”连接关键词
-
-第四部分：提供一个产品韩语名称用于内部管理（附带中文翻译）。
-
-第五部分：按照产品卖点撰写5条商品韩文好评。
-1. 先以 Markdown 表格形式排列：【序号 | 韩文评价原文 | 纯中文翻译 | 买家痛点分析】。
-2. 表格下方，将这5条纯韩文评价原文按行隔开，单独放在 ``` 代码块中输出，方便一键复制。
-
-第六部分：AI 主图生成建议：基于场景词用纯中文建议背景和构图。
-
-【程序读取专属指令 - 极度重要】：
-将上述所有生成的【韩文关键词】进行全面去重汇总，单列横向输出，并且**必须放在以下两个标记之间**！
-⚠️ 警告：这里的关键词之间【必须使用英文逗号 (,) 隔开】！绝对不允许只用空格连在一起！
-[LXU_KEYWORDS_START]
-关键词1,关键词2,关键词3
-[LXU_KEYWORDS_END]
-"""
-
-PROMPT_STEP_3 = """
-【以下是市场核心搜索词及拓展词真实流量数据】：
-{market_data}
-
-=======================================================
-你是一位拥有10年实战经验的韩国 Coupang 跨境电商高级广告操盘手。整个团队都在中国，除韩文关键词外，所有解释分析必须用纯中文输出。绝对不要出现 LxU 的品牌词！
-请你基于我提供的【产品原图】，深度分析上方的【市场流量数据】，严格完成以下任务：
-
-第一步：产品全维度深度解析与排雷（必须纯中文）
-为了确保你对产品的理解绝对准确，并为后续广告词打分提供事实依据，请在报告最开头明确输出以下解析：
-1. 产品核心属性：精准提取该产品的真实材质、外观形态、核心卖点及适用场景。
-2. 买家痛点挖掘：深度分析目标人群购买该产品是为了解决什么痛点？
-3. 绝对红线（排雷标准）：明确列出哪些属性、材质或场景是与本产品**绝对冲突**的（如产品是塑料，红线就是金属；或者不相关的功能词等），并在后续选词中坚决屏蔽它们！
-
-第二步：基于第一步原词的“深化分类与提取”（极度重要，绝对不许偷懒！）
-上方的流量数据中，包含了我们在最初期为你提供的【目标原词】（也就是你认为最符合图片的词）以及 Naver 拓展出的大词。
-你**必须以第一步提炼的【目标原词】为核心基石进行深化**，结合高质量的 Naver 拓展词，挑选出 40-60 个最具转化价值的词。
-你**必须、绝对**要把这些词分配到以下三个【明确的广告组】中，任何一组都绝对不允许为空！
-- 【核心出单词】(1分)
-- 【精准长尾词】(2分)
-- 【捡漏与痛点组】(3分)
-
-第三步：高价值付费广告投放策略表（直接填写真实数据，绝对不要输出省略号）
-【强制表格格式】：
-请严格使用以下 Markdown 表头结构输出表格。
-**警告：不要输出任何省略号“...”或干扰虚线，请直接将挑选出的真实关键词数据一行一行填满表格！**
-必须按三大分类的顺序展示（核心出单词 ➡️ 精准长尾词 ➡️ 捡漏与痛点组），且每个分类内部按“月总搜索量”降序排列！
-
-| 序号 | 广告组分类 | 相关性评分 | 韩文关键词 | 月总搜索量 | 中文翻译 | 竞争度 | 推荐策略与说明 |
-|---|---|---|---|---|---|---|---|
-
-第四步：否定关键词列表 (Negative Keywords)
-- 建议屏蔽的词：[用逗号隔开，从数据中挑出那些触碰红线、无购物意图的垃圾拓展词。必须至少列出 10 个真实的过滤词！]
-- 屏蔽原因：[纯中文简述理由]
-"""
-
-# ==========================================
-# 2. 强力引擎：安全生成与数据抓取
-# ==========================================
-
-def safe_generate(model, contents, max_retries=3):
-    for attempt in range(1, max_retries + 1):
-        try:
-            res = model.generate_content(contents)
-            return res.text
-        except Exception as e:
-            if attempt < max_retries:
-                time.sleep(3)
-            else:
-                return f"❌ 严重错误：API 连续 {max_retries} 次无响应或被安全拦截，无法生成内容。详情：{str(e)}"
-
-def clean_for_api(keyword: str) -> str:
-    return re.sub(r"\s+", "", keyword)
-
-def make_signature(method: str, uri: str, timestamp: str) -> str:
-    message = f"{timestamp}.{method}.{uri}".encode("utf-8")
-    signature = hmac.new(SECRET_KEY_BYTES, message, hashlib.sha256).digest()
-    return base64.b64encode(signature).decode("utf-8")
-
-def normalize_count(raw):
-    if isinstance(raw, int): return raw
-    if isinstance(raw, str):
-        s = raw.strip()
-        if s.startswith("<"): return 5
-        if s.startswith(">"):
-            num = s[1:].strip()
-            return int(num) if num.isdigit() else 0
-        s = s.replace(",", "")
-        if s.isdigit(): return int(s)
-    return 0
-
-def fetch_naver_data(main_keywords, pb, st_text):
-    all_rows = []
-    total = len(main_keywords)
-
-    def fetch_single(mk):
-        rows = []
-        try:
-            timestamp = str(int(time.time() * 1000))
-            sig = make_signature("GET", "/keywordstool", timestamp)
-            headers = {"X-Timestamp": timestamp, "X-API-KEY": NAVER_API_KEY, "X-Customer": NAVER_CUSTOMER_ID, "X-Signature": sig}
-            res = requests.get(NAVER_API_URL, headers=headers, params={"hintKeywords": clean_for_api(mk), "showDetail": 1}, timeout=8)
-            if res.status_code == 200:
-                data = res.json()
-                for item in data.get("keywordList", []):
-                    pc = normalize_count(item.get("monthlyPcQcCnt", 0))
-                    mob = normalize_count(item.get("monthlyMobileQcCnt", 0))
-                    rows.append({
-                        "Naver实际搜索词": item.get("relKeyword", ""),
-                        "月总搜索量": pc + mob,
-                        "竞争度": item.get("compIdx", "-"),
-                        "AI溯源(原词)": mk
-                    })
-        except Exception:
-            pass
-        return rows
-
-    completed = 0
-    with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-        future_to_mk = {executor.submit(fetch_single, mk): mk for mk in main_keywords}
-        for future in concurrent.futures.as_completed(future_to_mk):
-            mk = future_to_mk[future]
-            completed += 1
-            st_text.text(f"📊 Naver 极速并发拓词中 [{completed}/{total}]: {mk}")
-            pb.progress(completed / total)
-            try:
-                all_rows.extend(future.result())
-            except Exception:
-                pass
-            time.sleep(0.05)
-
-    df = pd.DataFrame(all_rows)
-    if not df.empty:
-        df = df.drop_duplicates(subset=["Naver实际搜索词"])
-
-        seed_no_space = [str(k).replace(" ", "") for k in main_keywords]
-        df['is_seed'] = df['Naver实际搜索词'].apply(lambda x: str(x).replace(" ", "") in seed_no_space)
-
-        df.insert(1, '词组属性', df['is_seed'].apply(lambda x: '🎯 目标原词' if x else '💡 衍生拓展词'))
-        df = df.sort_values(by=["is_seed", "月总搜索量"], ascending=[False, False])
-        df = df.drop(columns=['is_seed'])
-
-    return df
+# ♻️ 本地缓存目录（Naver 拓词结果等），可用环境变量覆盖
+CACHE_DIR = os.environ.get("LXU_CACHE_DIR", ".lxu_cache")
+
+@st.cache_resource
+def get_naver_cache():
+    return NaverKeywordCache(os.path.join(CACHE_DIR, "naver_keywordstool.sqlite3"), max_entries=20000)
+
+@st.cache_resource
+def get_gemini_cache():
+    return GeminiResponseCache(os.path.join(CACHE_DIR, "gemini_responses.sqlite3"), max_bytes=200 * 1024 * 1024)
+
+@st.cache_resource
+def get_upload_manager():
+    # 📤 按文件哈希复用云端文件，整批并发上传
+    return GeminiUploadManager(os.path.join(CACHE_DIR, "gemini_uploads.sqlite3"), max_workers=4)
+
+@st.cache_resource
+def get_keyword_store():
+    return KeywordMarketStore(os.path.join(CACHE_DIR, "keyword_market.sqlite3"))
+
+@st.cache_resource
+def get_job_store():
+    # 💾 断点续跑：各阶段产出按文件哈希保存，rerun / 断线重连后重跑同一批文件直接续上
+    return JobCheckpointStore(os.path.join(CACHE_DIR, "job_checkpoints.sqlite3"))
+
+@st.cache_resource
+def get_job_queue():
+    # 🧵 整个进程共用一组按阶段划分的工作线程：多人同时跑批时总并发固定，各会话轮转取任务
+    return JobQueue(stage_workers(
+        gemini_workers=int(os.environ.get("LXU_GEMINI_WORKERS", 2)),
+        package_workers=int(os.environ.get("LXU_PACKAGE_WORKERS", 1)),
+        prepare_workers=int(os.environ.get("LXU_PREPARE_WORKERS", 1)),
+    ))
+
+@st.cache_resource
+def get_quota_governor():
+    # 🚦 按凭据共享的限速令牌桶 + 每日调用计数（所有会话共用，计数落盘）
+    return QuotaGovernor(os.path.join(CACHE_DIR, "api_quota.sqlite3"))
+
+def get_gemini_quota():
+    return get_quota_governor().limiter(
+        "gemini", GEMINI_API_KEY,
+        rate=float(os.environ.get("LXU_GEMINI_RPM", 60)) / 60.0,
+        burst=float(os.environ.get("LXU_GEMINI_BURST", 5)),
+        daily_limit=int(os.environ.get("LXU_GEMINI_DAILY", 0)),
+    )
+
+@st.cache_resource
+def get_naver_client():
+    # 🔌 连接池 + AIMD 并发控制 + 按 CUSTOMER_ID 的限速/日配额，在所有会话之间共享
+    quota = get_quota_governor().limiter(
+        "naver", NAVER_CUSTOMER_ID,
+        rate=float(os.environ.get("LXU_NAVER_RPS", 10)),
+        burst=float(os.environ.get("LXU_NAVER_BURST", 10)),
+        daily_limit=int(os.environ.get("LXU_NAVER_DAILY", 0)),
+    )
+    return NaverClient(NAVER_API_KEY, NAVER_SECRET_KEY, NAVER_CUSTOMER_ID, quota=quota)
 
 # ==========================================
-# 3. 主 UI 与全自动工作流
+# 1. 主 UI 与全自动工作流
 # ==========================================
 st.title("⚡ LxU 测品策略生成器")
 st.info("💡 提示：运行中如需紧急终止，请点击页面右上角自带的圆形 Stop 按钮。")
@@ -269,308 +104,409 @@ if st.sidebar.button("🗑️ 清理云端垃圾文件"):
         for f in genai.list_files():
             genai.delete_file(f.name)
             count += 1
+        get_upload_manager().forget_all()
         st.sidebar.success(f"清理了 {count} 个缓存文件！")
     except Exception as e:
         st.sidebar.error(f"清理失败: {e}")
 
-files = st.file_uploader("📥 请上传产品详情页 (强烈建议截图，保持在2MB内)", type=["pdf", "png", "jpg", "jpeg"], accept_multiple_files=True)
-
-if files and st.button("🚀 启动全自动闭环", use_container_width=True):
-    model = genai.GenerativeModel("gemini-2.5-flash")
-
-    master_zip_buffer = io.BytesIO()
-    master_zip = zipfile.ZipFile(master_zip_buffer, 'w', zipfile.ZIP_DEFLATED)
-
-    for file in files:
-        st.divider()
-        st.header(f"📦 正在自动处理产品：{file.name}")
-        temp_path = f"temp_{file.name}"
-        with open(temp_path, "wb") as f:
-            f.write(file.getbuffer())
-
-        res1_text = ""
-        res3_text = ""
-        kw_list = []
-        market_csv = ""
-        folder_name = os.path.splitext(file.name)[0]
-
-        # ------------------ 第一步：自动识图与提取 ------------------
-        with st.status("🔍 第一步：AI 视觉提炼与本地化分析...", expanded=True) as s1:
-            try:
-                gen_file = genai.upload_file(path=temp_path)
-                while gen_file.state.name == "PROCESSING":
-                    time.sleep(2)
-                    gen_file = genai.get_file(gen_file.name)
-
-                res1_text = safe_generate(model, [gen_file, PROMPT_STEP_1])
-
-                if res1_text.startswith("❌"):
-                    s1.update(label="❌ 第一步 AI 生成彻底失败", state="error")
-                    st.error(res1_text)
-                    continue
-
+st.sidebar.divider()
+st.sidebar.markdown("#### ♻️ Naver 拓词缓存")
+naver_cache = get_naver_cache()
+cache_ttl_hours = st.sidebar.number_input("缓存有效期 (小时)", min_value=1, max_value=24 * 30, value=72, step=1)
+force_refresh = st.sidebar.checkbox("🔄 强制刷新 (忽略缓存重新查询)", value=False)
+cache_stats = naver_cache.stats()
+st.sidebar.caption(f"已缓存 {cache_stats['entries']} / {cache_stats['max_entries']} 个种子词结果")
+batch_mode = st.sidebar.checkbox("📦 批量查询 (每次请求合并 5 个种子词)", value=False, help="请求量约降为 1/5；衍生词按字面匹配归属原词，无法判断来源的行会标注整批种子词（用 | 隔开）")
+expand_keywords = st.sidebar.checkbox("🕸️ 多层拓词 (拿最相关的衍生词再查一层，补长尾)", value=False, help="按搜索量 + 与种子词的相关度挑选衍生词继续查询，查过的词不会重复查")
+expand_depth = st.sidebar.slider("拓词层数", min_value=2, max_value=4, value=2, disabled=not expand_keywords)
+expand_frontier = st.sidebar.number_input("每层最多再查的衍生词数", min_value=5, max_value=200, value=40, step=5, disabled=not expand_keywords)
+expand_budget = st.sidebar.number_input("多层拓词请求上限 (每个请求 5 个词)", min_value=1, max_value=200, value=20, step=1, disabled=not expand_keywords)
+if st.sidebar.button("🧹 清空 Naver 缓存"):
+    naver_cache.clear()
+    st.sidebar.success("Naver 缓存已清空！")
+
+st.sidebar.divider()
+st.sidebar.markdown("#### 📚 历史关键词库")
+keyword_store = get_keyword_store()
+category = st.sidebar.text_input("本批品类标签 (可选)", value="", placeholder="例如 수전 / 收纳", help="写入历史库时附带，用于按品类查 Top-N")
+store_stats = keyword_store.stats()
+st.sidebar.caption(f"已收录 {store_stats['keywords']} 个搜索词，{store_stats['snapshots']} 个快照日期")
+
+st.sidebar.divider()
+st.sidebar.markdown("#### 🧠 Gemini 结果缓存")
+gemini_cache = get_gemini_cache()
+use_gemini_cache = st.sidebar.checkbox("复用相同文件 + 相同指令的 AI 结果", value=True, help="关闭后每次都重新生成（想要新的创意输出时关闭）；失败结果从不缓存")
+gemini_stats = gemini_cache.stats()
+st.sidebar.caption(f"已缓存 {gemini_stats['entries']} 条结果，占用 {gemini_stats['bytes'] / 1024 / 1024:.1f} / {gemini_stats['max_bytes'] / 1024 / 1024:.0f} MB")
+if st.sidebar.button("🧹 清空 Gemini 缓存"):
+    gemini_cache.clear()
+    st.sidebar.success("Gemini 缓存已清空！")
+
+st.sidebar.divider()
+st.sidebar.markdown("#### 💾 断点续跑")
+job_store = get_job_store()
+resume_jobs = st.sidebar.checkbox("从上次中断处继续 (相同文件 + 相同设置)", value=True, help="已完成的阶段直接复用，已打包的产品直接拷贝产物；强制刷新 Naver 或关闭 Gemini 结果缓存时不读取断点")
+job_stats = job_store.stats()
+st.sidebar.caption(f"已保存 {job_stats['products']} 个产品的断点，其中 {job_stats['packaged']} 个已打包完成")
+if st.sidebar.button("🧹 清空断点"):
+    job_store.clear()
+    st.sidebar.success("断点已清空！")
+
+st.sidebar.divider()
+st.sidebar.markdown("#### ⚙️ 流水线并发")
+job_queue = get_job_queue()
+queue_stats = job_queue.stats()
+st.sidebar.caption(
+    f"全局并发（所有会话共享）：Gemini {queue_stats['workers']['step1']} / 打包 {queue_stats['workers']['package']}，"
+    f"由环境变量 LXU_GEMINI_WORKERS / LXU_PACKAGE_WORKERS 设置"
+)
+st.sidebar.caption(f"当前 {queue_stats['sessions']} 个会话的 {queue_stats['batches']} 个批次在跑，排队 {sum(queue_stats['queued'].values())} 个产品阶段")
+
+st.sidebar.divider()
+st.sidebar.markdown("#### 🚦 API 配额（所有会话共享）")
+get_naver_client()
+get_gemini_quota()
+for quota_name, u in sorted(get_quota_governor().usage().items()):
+    limit_txt = f" / {u['daily_limit']}" if u["daily_limit"] > 0 else "（不限）"
+    rate_txt = f"{u['rate']:.1f} 次/秒" if u["rate"] >= 1 else f"{u['rate'] * 60:.0f} 次/分"
+    st.sidebar.caption(f"{'Naver' if quota_name == 'naver' else 'Gemini'}：今日 {u['today']}{limit_txt} 次，限速 {rate_txt}，排队 {u['waiting']}")
+    if u["daily_limit"] > 0:
+        st.sidebar.progress(min(1.0, u["today"] / u["daily_limit"]))
+context_mode = st.sidebar.radio(
+    "第一步 / 第三步的产品图上下文",
+    CONTEXT_MODES,
+    format_func=lambda x: {"separate": "两次独立调用 (原方式)", "chat": "💬 多轮对话：第三步接着第一步", "cached": "🗂️ 缓存上下文：产品图只处理一次"}[x],
+    help="缓存上下文对大 PDF 最省；文件太小达不到 Gemini 缓存下限时自动退回两次独立调用"
+)
+use_rank = st.sidebar.checkbox("🎯 第三步本地相关性预筛", value=True, help="按与种子词的字面相关度 + 搜索量打分，只把预算内最相关的词以紧凑格式交给 AI")
+rank_budget = st.sidebar.number_input("第三步市场数据 token 预算", min_value=500, max_value=20000, value=2500, step=500, disabled=not use_rank)
+optimize_upload = st.sidebar.checkbox("🖼️ 上传前压缩拼版产品图", value=True, help="每个产品只解码/渲染一次：缩到统一栏宽、长图折栏拼成至多 4 张再上传 Gemini，同一份解码结果直接用于喂料包切片；PDF 会转成图片（不保留文字层）")
+stream_step1 = st.sidebar.checkbox("⚡ 第一步流式输出 (边生成边提前查 Naver)", value=True, help="仅逐词查询模式下提前查 Naver；批量查询模式只流式显示")
+pdf_page_range = st.sidebar.text_input("喂料包 PDF 页码范围 (可选)", value="", placeholder="例如 1-5,8；留空 = 全部页")
+try:
+    parse_page_range(pdf_page_range, 10 ** 6)
+except ValueError:
+    st.sidebar.error("页码范围格式错误，已忽略（示例：1-5,8）")
+    pdf_page_range = ""
+feed_layout = st.sidebar.radio("FEED 喂料包存放方式", ["dir", "zip"], format_func=lambda x: {"dir": "📁 总包内文件夹 (推荐)", "zip": "🗜️ 独立 FEED.zip (旧版)"}[x])
+spool_mb = st.sidebar.number_input("结果包内存阈值 (MB，超过后写入临时文件)", min_value=8, max_value=2048, value=64, step=8)
+slice_codec = st.sidebar.selectbox("喂料包切片格式", ["png", "webp", "jpeg"], index=0, help="PNG 无损但最慢最大；WebP/JPEG 体积小、编码快")
+slice_quality = st.sidebar.slider("WebP / JPEG 质量", min_value=50, max_value=95, value=85, disabled=slice_codec == "png")
+slice_dedupe = st.sidebar.checkbox("🧩 合并近似重复切片 (横幅 / 尺码表 / 认证等只保留一张)", value=True)
+dedupe_hamming = st.sidebar.slider("重复粗筛阈值 (感知哈希差异位数，越大候选越多)", min_value=0, max_value=48, value=16, disabled=not slice_dedupe)
+dedupe_max_diff = st.sidebar.slider("重复复核阈值 (缩略图块灰度差，越大合并越激进)", min_value=0.0, max_value=20.0, value=5.0, step=0.5, disabled=not slice_dedupe)
+
+with st.expander("📚 历史关键词库查询（本地数据，不调用 API）", expanded=False):
+    tab_lookup, tab_top, tab_change = st.tabs(["🔎 查词", "🏆 品类 Top-N", "📈 搜索量变化"])
+    with tab_lookup:
+        q = st.text_input("韩文搜索词", key="store_q")
+        q_prefix = st.checkbox("前缀匹配", value=True, key="store_prefix")
+        if q.strip():
+            st.dataframe(keyword_store.lookup(q, prefix=q_prefix), hide_index=True)
+    with tab_top:
+        cats = keyword_store.categories()
+        if cats:
+            top_cat = st.selectbox("品类", ["(全部)"] + cats, format_func=lambda c: c or "(未标注)", key="store_cat")
+            top_n = st.number_input("Top N", min_value=10, max_value=1000, value=50, step=10, key="store_n")
+            st.dataframe(keyword_store.top_keywords(None if top_cat == "(全部)" else top_cat, n=int(top_n)), hide_index=True)
+        else:
+            st.caption("历史库还是空的，跑完一批产品后自动收录。")
+    with tab_change:
+        snaps = keyword_store.snapshots()
+        if len(snaps) >= 2:
+            since, until = st.select_slider("快照区间", options=snaps, value=(snaps[0], snaps[-1]), key="store_range")
+            change_kw = st.text_input("只看以此开头的搜索词 (可选)", key="store_change_kw")
+            st.dataframe(keyword_store.volume_changes(since=since, until=until, keyword=change_kw.strip()), hide_index=True)
+        else:
+            st.caption("至少需要两个不同日期的快照才能对比搜索量变化。")
+
+files = st.file_uploader("📥 请上传产品详情页 (PDF / 长截图均可，上传 AI 前自动压缩拼版)", type=["pdf", "png", "jpg", "jpeg"], accept_multiple_files=True)
+
+def create_product_panel(job):
+    # 预先为每个产品占好位置：流水线并行推进，事件到达时再往对应位置填内容
+    st.divider()
+    st.header(f"📦 正在自动处理产品：{job.file_name}")
+    s1 = st.status("⏳ 第一步：排队中...", expanded=False)
+    with s1:
+        stream_box = st.empty()
+    s2 = st.status("⏳ 第二步：等待第一步完成...", expanded=False)
+    with s2:
+        pb = st.progress(0)
+        status_txt = st.empty()
+    s3 = st.status("⏳ 第三步：等待 Naver 数据...", expanded=False)
+    return {"s1": s1, "s2": s2, "s3": s3, "pb": pb, "status_txt": status_txt, "stream_box": stream_box, "result": st.empty(), "download": st.empty(), "profile": st.empty()}
+
+
+def part_download_button(file_name, folder_name, part, key):
+    # 单个产品的分包：打包完成即可下载（延迟读取 + ignore，不打断正在跑的批次）
+    st.download_button(
+        label=f"📥 下载【{file_name}】的结果 (Excel + 视觉报告 + 喂料包)",
+        data=part.getvalue,
+        file_name=f"LxU_{folder_name}.zip",
+        mime="application/zip",
+        on_click="ignore",
+        key=key,
+    )
+
+
+def render_profile(job, slot):
+    # ⏱️ 耗时瀑布图：每行一种操作（按嵌套缩进），同一行多段 = 多次调用/重试
+    prof = job.profile.to_dict()
+    spans = prof["spans"]
+    if not spans:
+        return
+    by_id = {s["id"]: s for s in spans}
+
+    def root_and_depth(s):
+        depth = 0
+        while s["parent"] is not None:
+            s = by_id[s["parent"]]
+            depth += 1
+        return s["name"], depth
+
+    rows = []
+    for s in spans:
+        stage, depth = root_and_depth(s)
+        rows.append({
+            "操作": "\u3000" * depth + s["name"],
+            "阶段": stage,
+            "开始(s)": s["start"],
+            "结束(s)": s["end"],
+            "耗时(s)": round(s["end"] - s["start"], 3),
+            "详情": ", ".join(f"{k}={v}" for k, v in s["attrs"].items()),
+        })
+    df = pd.DataFrame(rows)
+    lanes = list(dict.fromkeys(df["操作"]))
+    chart = alt.Chart(df).mark_bar().encode(
+        x=alt.X("开始(s):Q", title="秒"),
+        x2="结束(s):Q",
+        y=alt.Y("操作:N", sort=lanes, title=None),
+        color=alt.Color("阶段:N", legend=None),
+        tooltip=["操作", "耗时(s)", "开始(s)", "详情"],
+    ).properties(height=max(120, 22 * len(lanes)))
+    with slot.container():
+        with st.expander(f"⏱️ 耗时瀑布图 (总计 {prof['wall_s']:.1f}s：" + "，".join(f"{k} {v:.1f}s" for k, v in prof["stages_s"].items()) + ")", expanded=False):
+            st.altair_chart(chart, use_container_width=True)
+            if prof["counters"]:
+                st.dataframe(pd.DataFrame({"计数项": list(prof["counters"].keys()), "值": list(prof["counters"].values())}), hide_index=True)
+
+
+def render_event(event, panel):
+    job = event.job
+    resumed = "♻️ 断点恢复 · " if event.stage in job.resumed else ""
+    if event.kind == "stage_start":
+        if event.stage == "prepare":
+            panel["s1"].update(label="🖼️ 预处理：解码详情页并压缩拼版...", state="running")
+        elif event.stage == "step1":
+            panel["s1"].update(label="🔍 第一步：AI 视觉提炼与本地化分析...", state="running", expanded=True)
+        elif event.stage == "naver":
+            panel["s2"].update(label="📊 第二步：连接 Naver 获取真实搜索数据 (自动跳转)...", state="running", expanded=True)
+        elif event.stage == "step3":
+            panel["s3"].update(label="🧠 第三步：主客观数据融合，生成终极策略 (自动跳转)...", state="running", expanded=True)
+        elif event.stage == "package":
+            panel["result"].info(f"🗜️ 【{job.file_name}】 正在生成报告与喂料包...")
+
+    elif event.kind == "progress" and event.stage == "step1":
+        # ⚡ 流式输出：边生成边显示，已识别的种子词在后台提前查 Naver
+        d = event.data
+        panel["stream_box"].markdown(d["text"])
+        if d["seeds"]:
+            panel["s1"].update(label=f"🔍 第一步：AI 生成中... 已识别 {d['seeds']} 个种子词，Naver 提前查询中")
+
+    elif event.kind == "progress" and event.stage == "prepare":
+        d = event.data
+        with panel["s1"]:
+            st.caption(f"🖼️ 上传文件 {d['bytes_in'] / 1024 / 1024:.1f} MB ➡️ {d['bytes_out'] / 1024 / 1024:.1f} MB（拼版 {d['sheets']} 张）")
+
+    elif event.kind == "progress" and event.stage == "step3":
+        d = event.data
+        with panel["s3"]:
+            st.caption(f"🎯 本地预筛：{d['rows_in']} 行 ➡️ {d['rows_kept']} 行，市场数据约 {d['tokens_before']} ➡️ {d['tokens']} tokens")
+
+    elif event.kind == "progress" and event.stage == "naver":
+        d = event.data
+        layer = f"第 {d['hop']} 层" if d.get("hop", 1) > 1 else ""
+        panel["status_txt"].text(f"📊 Naver 极速并发{layer}拓词中 [{d['done']}/{d['total']}] (并发 {d['limit']}): {'、'.join(d['batch'])}")
+        panel["pb"].progress(d["done"] / d["total"])
+
+    elif event.kind == "stage_done":
+        if event.stage == "prepare":
+            panel["s1"].update(label="⏳ 第一步：排队中...", state="running")
+        elif event.stage == "step1":
+            panel["stream_box"].empty()
+            with panel["s1"]:
+                if job.context_error:
+                    st.caption(f"ℹ️ 缓存上下文创建失败，已退回两次独立调用：{job.context_error}")
                 with st.expander("👉 查看第一步完整报告 (已强制纯中文隔离)", expanded=False):
-                    st.write(res1_text)
-
-                match = re.search(r"\[LXU_KEYWORDS_START\](.*?)\[LXU_KEYWORDS_END\]", res1_text, re.DOTALL | re.IGNORECASE)
-                if match:
-                    raw_block = match.group(1)
-                    raw_block = re.sub(r'[，\n、|]', ',', raw_block)
-                    for kw in raw_block.split(','):
-                        clean_word = re.sub(r'[^가-힣a-zA-Z0-9\s]', '', kw).strip()
-                        clean_word = re.sub(r'\s+', ' ', clean_word)
-                        if clean_word and clean_word not in kw_list:
-                            kw_list.append(clean_word)
-                else:
-                    tail_text = res1_text[-800:]
-                    tail_text = re.sub(r'[，\n、|]', ',', tail_text)
-                    for kw in tail_text.split(','):
-                        clean_word = re.sub(r'[^가-힣a-zA-Z0-9\s]', '', kw).strip()
-                        clean_word = re.sub(r'\s+', ' ', clean_word)
-                        if clean_word and clean_word not in kw_list:
-                            kw_list.append(clean_word)
-                    kw_list = kw_list[:25]
-
-                if kw_list:
-                    s1.update(label=f"✅ 第一步完成！成功截获 {len(kw_list)} 个纯正韩文词组", state="complete")
+                    st.write(job.res1_text)
+            panel["s1"].update(label=f"{resumed}✅ 第一步完成！成功截获 {len(job.kw_list)} 个纯正韩文词组", state="complete", expanded=False)
+        elif event.stage == "naver":
+            with panel["s2"]:
+                if job.naver_failures:
+                    st.warning(f"⚠️ {len(job.naver_failures)} 个种子词查询失败（已自动重试），以下词缺少 Naver 数据：")
+                    st.dataframe(pd.DataFrame({"种子词": list(job.naver_failures.keys()), "失败原因": list(job.naver_failures.values())}))
+                if HOP_COL in job.df_market and job.df_market[HOP_COL].max() > 1:
+                    hops = job.df_market[HOP_COL].value_counts().sort_index()
+                    st.caption("🕸️ 多层拓词：" + "，".join(f"第 {h} 层 {n} 个" for h, n in hops.items() if h > 0))
+                st.dataframe(job.df_market)
+            target_count = len(job.kw_list)
+            derived_count = len(job.df_market)
+            panel["s2"].update(label=f"{resumed}✅ 第二步完成！已获取最新韩国市场客观数据 (目标词：{target_count} 个 ➡️ 衍生词：{derived_count} 个)", state="complete", expanded=False)
+        elif event.stage == "step3":
+            with panel["s3"]:
+                if job.res3_text.startswith("❌"):
+                    st.error(job.res3_text)
                 else:
-                    s1.update(label="❌ 第一步提取失败，未能找到韩文", state="error")
-                    continue
-            except Exception as e:
-                s1.update(label=f"❌ 本地系统逻辑错误: {e}", state="error")
-                continue
-
-        # ------------------ 第二步：自动触发 Naver 流量回测 ------------------
-        with st.status("📊 第二步：连接 Naver 获取真实搜索数据 (自动跳转)...", expanded=True) as s2:
-            pb = st.progress(0)
-            status_txt = st.empty()
-
-            df_market = fetch_naver_data(kw_list, pb, status_txt)
-
-            if not df_market.empty:
-                st.dataframe(df_market)
-                target_count = len(kw_list)
-                derived_count = len(df_market)
-                s2.update(label=f"✅ 第二步完成！已获取最新韩国市场客观数据 (目标词：{target_count} 个 ➡️ 衍生词：{derived_count} 个)", state="complete")
+                    st.markdown("### 🏆 LxU 终极测品策略报告")
+                    st.success(job.res3_text)
+            if job.res3_text.startswith("❌"):
+                panel["s3"].update(label="❌ 第三步 AI 生成彻底失败", state="error")
             else:
-                s2.update(label="❌ 第二步失败，Naver 未返回有效数据", state="error")
-                continue
-
-        # ------------------ 第三步：自动触发终极策略推演 ------------------
-        with st.status("🧠 第三步：主客观数据融合，生成终极策略 (自动跳转)...", expanded=True) as s3:
-            try:
-                seed_df = df_market[df_market["词组属性"] == '🎯 目标原词']
-                expanded_df = df_market[df_market["词组属性"] == '💡 衍生拓展词'].head(250)
-
-                final_df = pd.concat([
-                    seed_df.sort_values(by="月总搜索量", ascending=False),
-                    expanded_df.sort_values(by="月总搜索量", ascending=False)
-                ]).drop_duplicates(subset=["Naver实际搜索词"])
-
-                market_csv = final_df.to_csv(index=False)
-                final_prompt = PROMPT_STEP_3.format(market_data=market_csv)
+                panel["s3"].update(label=f"{resumed}✅ 第三步完成！终极排兵布阵已生成", state="complete")
+        elif event.stage == "package":
+            panel["result"].success(f"{resumed}📦 【{job.file_name}】 处理完毕！已写入结果总包，也可以先单独下载。")
+            if job.part is not None:
+                with panel["download"]:
+                    part_download_button(job.file_name, job.folder_name, job.part, key=f"part_live_{id(job)}")
+
+    elif event.kind == "job_failed":
+        label, detail = event.data["label"], event.data["detail"]
+        if event.stage == "package":
+            panel["result"].error(label)
+            return
+        box = {"prepare": "s1", "step1": "s1", "naver": "s2", "step3": "s3"}[event.stage]
+        panel[box].update(label=label, state="error", expanded=True)
+        if detail:
+            with panel[box]:
+                st.error(detail)
+        for later in {"s1": ("s2", "s3"), "s2": ("s3",), "s3": ()}[box]:
+            panel[later].update(label="⏭️ 已跳过", state="error", expanded=False)
+
+    elif event.kind == "job_done":
+        render_profile(job, panel["profile"])
+
+
+session_id = st.session_state.setdefault("session_id", uuid.uuid4().hex)
+running = "batch" in st.session_state
+
+if files and st.button("🚀 启动全自动闭环", use_container_width=True, disabled=running):
+    model = genai.GenerativeModel("gemini-2.5-flash")
 
-                res3_text = safe_generate(model, [gen_file, final_prompt])
+    # 上一次运行的结果包不再需要，释放其临时文件
+    if "master_output" in st.session_state:
+        st.session_state.pop("master_output").discard()
+    for _, _, part in st.session_state.pop("product_parts", []):
+        part.discard()
+    master_output = SpooledZipWriter(max_memory_bytes=int(spool_mb) * 1024 * 1024)
+
+    ctx = PipelineContext(
+        model=model,
+        naver_client=get_naver_client(),
+        naver_cache=naver_cache,
+        force_refresh=force_refresh,
+        cache_ttl=cache_ttl_hours * 3600,
+        batch_size=5 if batch_mode else 1,
+        response_cache=gemini_cache if use_gemini_cache else None,
+        upload_manager=get_upload_manager(),
+        output=master_output,
+        product_parts=True,
+        feed_layout=feed_layout,
+        stream_step1=stream_step1,
+        context_mode=context_mode,
+        keyword_store=keyword_store,
+        category=category.strip(),
+        checkpoints=job_store,
+        gemini_quota=get_gemini_quota(),
+        resume=resume_jobs and not force_refresh and use_gemini_cache
+    )
+    ctx.pack_cfg.page_range = pdf_page_range.strip()
+    ctx.rank_cfg.enabled = use_rank
+    ctx.rank_cfg.token_budget = int(rank_budget)
+    ctx.expand_cfg.enabled = expand_keywords
+    ctx.expand_cfg.max_depth = int(expand_depth)
+    ctx.expand_cfg.frontier = int(expand_frontier)
+    ctx.expand_cfg.request_budget = int(expand_budget)
+    ctx.pack_cfg.codec = slice_codec
+    ctx.pack_cfg.quality = slice_quality
+    ctx.pack_cfg.dedupe = slice_dedupe
+    ctx.pack_cfg.dedupe_hamming = int(dedupe_hamming)
+    ctx.pack_cfg.dedupe_max_diff = float(dedupe_max_diff)
+    ctx.upload_cfg.enabled = optimize_upload
+    jobs = [ProductJob(file_name=file.name, data=file.getvalue()) for file in files]
+    # 提交到全局作业队列后立即返回，工作不在本脚本线程里跑
+    handle = submit_batch(jobs, ctx, job_queue, session=session_id)
+    st.session_state["batch"] = {"handle": handle, "output": master_output, "ctx": ctx}
+
+def replay_events(handle):
+    # 回放事件日志：覆盖式的进度事件（流式文本 / Naver 进度条）只需画每个产品每个阶段的最后一条
+    events = handle.poll(0)
+    last = {(id(e.job), e.stage): i for i, e in enumerate(events) if e.kind == "progress"}
+    return [e for i, e in enumerate(events) if e.kind != "progress" or last[(id(e.job), e.stage)] == i]
+
+
+def finish_batch(batch):
+    handle = batch["handle"]
+    master_output = batch["output"]
+    master_output.close()
+    st.session_state.pop("batch")
+    st.session_state["master_output"] = master_output
+    st.session_state["product_parts"] = [(job.file_name, job.folder_name, job.part) for job in handle.jobs if job.part is not None]
+    st.session_state["run_summary"] = {
+        "products": len(handle.jobs),
+        "resumed": sum(1 for job in handle.jobs if "package" in job.resumed),
+        "naver": batch["ctx"].naver_lookup.stats(),
+    }
+
+
+@st.fragment(run_every=1.0)
+def batch_progress():
+    # 只有这一块定时重画：每次画出各产品面板、回放已有事件后立即返回，不阻塞脚本，
+    # 取消按钮和其他控件随时可以响应；批次结束后整页 rerun 一次，显示下载区
+    batch = st.session_state.get("batch")
+    if batch is None:
+        return
+    handle = batch["handle"]
+    done = handle.done   # 先取状态再回放：判定结束时回放到的事件一定完整
+    panels = {id(job): create_product_panel(job) for job in handle.jobs}
+    for event in replay_events(handle):
+        render_event(event, panels[id(event.job)])
+    if done:
+        finish_batch(batch)
+        st.rerun()
+
+
+# 本会话有在跑的批次：进度由 batch_progress 片段定时刷新，后台工作不受 rerun / 断线影响
+if "batch" in st.session_state:
+    handle = st.session_state["batch"]["handle"]
+    if not handle.done and st.button("⏹️ 取消本批次（排队中的产品不再处理）", use_container_width=True):
+        job_queue.cancel(handle)
+    batch_progress()
 
-                if res3_text.startswith("❌"):
-                    s3.update(label="❌ 第三步 AI 生成彻底失败", state="error")
-                    st.error(res3_text)
-                else:
-                    st.markdown("### 🏆 LxU 终极测品策略报告")
-                    st.success(res3_text)
-                    s3.update(label="✅ 第三步完成！终极排兵布阵已生成", state="complete")
-            except Exception as e:
-                s3.update(label=f"❌ 第三步系统逻辑错误: {e}", state="error")
-
-        # ------------------ 收尾与文件生成 (🚀 升级为高定网页版报告) ------------------
-        os.remove(temp_path)
-        try:
-            genai.delete_file(gen_file.name)
-        except:
-            pass
-
-        try:
-            # === 解析与提炼 ===
-            def parse_md_table(md_text, keyword):
-                lines = md_text.split('\n')
-                table_data = []
-                is_table = False
-                for line in lines:
-                    line = line.strip()
-                    if '|' in line and keyword in line:
-                        is_table = True
-                        table_data.append(line)
-                        continue
-                    if is_table:
-                        if line.startswith('|') or line.endswith('|') or '|' in line:
-                            if '---' not in line:
-                                table_data.append(line)
-                        else:
-                            if len(line.strip()) > 0:
-                                break
-                if not table_data:
-                    return pd.DataFrame()
-                parsed_rows = []
-                for row in table_data:
-                    cols = [col.strip() for col in row.split('|')]
-                    if cols and not cols[0]:
-                        cols = cols[1:]
-                    if cols and not cols[-1]:
-                        cols = cols[:-1]
-                    parsed_rows.append(cols)
-                if len(parsed_rows) > 1:
-                    return pd.DataFrame(parsed_rows[1:], columns=parsed_rows[0])
-                return pd.DataFrame()
-
-            raw_titles = []
-            for line in res1_text.split('\n'):
-                line_clean = line.strip()
-                if 'LxU' in line_clean and not any(x in line_clean for x in ['公式', '规则', '卖点', '核心词', '翻译', '中文']):
-                    clean_t = re.sub(r'```[a-zA-Z]*', '', line_clean)
-                    clean_t = clean_t.strip('`*>- \t')
-                    if clean_t.startswith('LxU') and clean_t not in raw_titles:
-                        raw_titles.append(clean_t)
-
-            coupang_title = raw_titles[0] if len(raw_titles) > 0 else "未提取到 Coupang 标题，请查阅全景报告"
-            naver_title = raw_titles[1] if len(raw_titles) > 1 else "未提取到 Naver 标题，请查阅全景报告"
-
-            kw_lines = []
-            for line in res1_text.split('\n'):
-                if ('，' in line or ',' in line) and '|' not in line and re.search(r'[가-힣]', line):
-                    if line.count(',') + line.count('，') >= 5:
-                        clean_kw = re.sub(r'```[a-zA-Z]*', '', line).strip()
-                        clean_kw = clean_kw.strip('`').strip()
-                        if clean_kw and clean_kw not in kw_lines:
-                            kw_lines.append(clean_kw)
-
-            coupang_kws = kw_lines[0] if len(kw_lines) > 0 else "未提取到 Coupang 关键词，请查阅全景报告"
-            naver_kws = kw_lines[1] if len(kw_lines) > 1 else "未提取到 Naver 关键词，请查阅全景报告"
-
-            df_sheet1 = pd.DataFrame({
-                "信息维度": ["Coupang 标题", "Coupang 后台关键词", "Naver 标题", "Naver 后台关键词"],
-                "提炼内容": [coupang_title, coupang_kws, naver_title, naver_kws]
-            })
-
-            df_comments = parse_md_table(res1_text, "韩文评价原文")
-            df_ads = parse_md_table(res3_text, "广告组分类")
-
-            # === 写入 Excel (内存) ===
-            excel_buffer = io.BytesIO()
-            with pd.ExcelWriter(excel_buffer, engine='xlsxwriter') as writer:
-                df_sheet1.to_excel(writer, index=False, sheet_name='登品标题')
-                if not df_comments.empty:
-                    df_comments.to_excel(writer, index=False, sheet_name='评论区内容')
-                else:
-                    pd.DataFrame([{"提示": "未找到规范的评价表格"}]).to_excel(writer, index=False, sheet_name='评论区内容')
-                if not df_ads.empty:
-                    df_ads.to_excel(writer, index=False, sheet_name='广告投放关键词')
-                else:
-                    pd.DataFrame([{"提示": "未找到规范的广告策略表"}]).to_excel(writer, index=False, sheet_name='广告投放关键词')
-            excel_data = excel_buffer.getvalue()
-
-            # === 🚀 写入精美 HTML 网页报告 (完美替代容易乱码的 Word) ===
-            css_style = """
-            <style>
-                body { font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, "Malgun Gothic", "Microsoft YaHei", sans-serif; padding: 40px; max-width: 1000px; margin: auto; line-height: 1.6; color: #333; background-color: #f4f6f9; }
-                .container { background: #ffffff; padding: 40px; border-radius: 12px; box-shadow: 0 4px 12px rgba(0,0,0,0.05); }
-                h1 { color: #1E3A8A; border-bottom: 2px solid #e2e8f0; padding-bottom: 10px; text-align: center; }
-                h2 { color: #2563eb; margin-top: 30px; }
-                h3 { color: #475569; }
-                table { border-collapse: collapse; width: 100%; margin: 20px 0; font-size: 14px; border-radius: 8px; overflow: hidden; }
-                th, td { border: 1px solid #e2e8f0; padding: 12px 15px; text-align: left; }
-                th { background-color: #f8fafc; color: #1e293b; font-weight: 600; }
-                tr:nth-child(even) { background-color: #f1f5f9; }
-                pre { background-color: #1e293b; padding: 20px; border-radius: 8px; overflow-x: auto; color: #f8fafc; font-family: monospace; }
-                code { background-color: #e2e8f0; padding: 2px 6px; border-radius: 4px; color: #b91c1c; font-size: 0.9em; }
-                .print-btn { display: block; width: 200px; margin: 20px auto; padding: 10px; background-color: #2563eb; color: white; text-align: center; text-decoration: none; border-radius: 5px; font-weight: bold; cursor: pointer; border: none; }
-                @media print { .print-btn { display: none; } body { background-color: white; } .container { box-shadow: none; padding: 0; } }
-            </style>
-            """
-
-            html_part1 = markdown.markdown(res1_text, extensions=['tables', 'fenced_code'])
-            html_part3 = markdown.markdown(res3_text, extensions=['tables', 'fenced_code'])
-
-            html_content = f"""
-            <!DOCTYPE html>
-            <html lang="zh-CN">
-            <head>
-                <meta charset="utf-8">
-                <title>LxU 测品全景报告 - {folder_name}</title>
-                {css_style}
-            </head>
-            <body>
-                <div class="container">
-                    <button class="print-btn" onclick="window.print()">🖨️ 保存为高质量 PDF</button>
-                    <h1>📊 LxU 测品全景报告</h1>
-                    <p style="text-align: center; color: #64748b;">报告归属产品：{folder_name} | 生成日期：自动记录</p>
-
-                    <h2>🔍 第一步：AI 视觉提炼与本地化分析</h2>
-                    {html_part1}
-
-                    <hr style="border: 1px dashed #cbd5e1; margin: 40px 0;">
-
-                    <h2>🧠 第三步：产品深度解析与终极广告策略</h2>
-                    {html_part3}
-                </div>
-            </body>
-            </html>
-            """
-
-            # ✅ 生成 FEED_{folder}.zip（在内存里先打一个zip，再写入 master_zip）
-            feed_buffer = io.BytesIO()
-            feed_zip = zipfile.ZipFile(feed_buffer, 'w', zipfile.ZIP_DEFLATED)
-
-            pack_cfg = PackConfig(
-                target_w=1400,
-                max_h=1600,
-                min_h=900,
-                overlap=0.12,
-                skip_blank=True,
-                pdf_scale=2.0
-            )
-
-            # ✅ 关键修改：out_root="" 写入 FEED.zip 根目录
-            write_feed_to_master_zip(
-                master_zip=feed_zip,
-                folder_name=folder_name,
-                uploaded_filename=file.name,
-                uploaded_bytes=file.getvalue(),
-                cfg=pack_cfg,
-                kw_list=kw_list,
-                df_market=df_market,
-                final_df=final_df,
-                res1_text=res1_text,
-                res3_text=res3_text,
-                out_root=""
-            )
-
-            feed_zip.close()
-
-            master_zip.writestr(
-                f"{folder_name}/FEED_{folder_name}.zip",
-                feed_buffer.getvalue()
-            )
-
-            # === 将生成的 Excel 和 HTML 网页写入主 ZIP 包 ===
-            master_zip.writestr(f"{folder_name}/LxU_数据表_{folder_name}.xlsx", excel_data)
-            master_zip.writestr(f"{folder_name}/LxU_视觉报告_{folder_name}.html", html_content.encode('utf-8'))
-
-            st.success(f"📦 【{file.name}】 处理完毕！已打包存入内存。")
-
-        except Exception as e:
-            st.error(f"处理 {file.name} 构建导出文件时发生错误: {e}")
-
-    # ==========================================
-    # 4. 循环结束后，提供统一大压缩包下载
-    # ==========================================
-    master_zip.close()
-    if files:
-        st.divider()
-        st.markdown("### 🎉 全部产品处理完成！")
-        st.download_button(
-            label="📥 一键下载全部结果 (ZIP 压缩包)",
-            data=master_zip_buffer.getvalue(),
-            file_name="LxU_批量测品结果合集.zip",
-            mime="application/zip",
-            use_container_width=True
-        )
+# ==========================================
+# 2. 全部产品结束后，提供统一大压缩包下载（结果包存在 session_state，任何 rerun 后都还在）
+# ==========================================
+if "master_output" in st.session_state:
+    master_output = st.session_state["master_output"]
+    summary = st.session_state.get("run_summary", {})
+    st.divider()
+    st.markdown("### 🎉 全部产品处理完成！")
+    st.caption(f"结果总包 {master_output.size / 1024 / 1024:.1f} MB（{'临时文件' if master_output.on_disk else '内存'}）")
+    if summary.get("resumed"):
+        st.caption(f"♻️ {summary['resumed']} / {summary['products']} 个产品直接从断点拷贝产物，未重新计算")
+    lookup_stats = summary.get("naver", {})
+    if lookup_stats.get("coalesced"):
+        st.caption(f"🔗 Naver 查询合并：{lookup_stats['requested']} 次查询中 {lookup_stats['coalesced']} 次与其他产品共用结果")
+    # 延迟读取：点击下载时才从临时文件读出；ignore 避免点击下载触发 rerun
+    st.download_button(
+        label="📥 一键下载全部结果 (ZIP 压缩包)",
+        data=master_output.getvalue,
+        file_name="LxU_批量测品结果合集.zip",
+        mime="application/zip",
+        on_click="ignore",
+        use_container_width=True
+    )
+    product_parts = st.session_state.get("product_parts", [])
+    if product_parts:
+        with st.expander(f"📂 按产品单独下载（{len(product_parts)} 个）", expanded=False):
+            for i, (file_name, folder_name, part) in enumerate(product_parts):
+                part_download_button(file_name, folder_name, part, key=f"part_done_{i}")
@@ -1,13 +1,28 @@
 import io
+import os
 import csv
 import json
+import multiprocessing
+import threading
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from dataclasses import dataclass
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple
 
+try:
+    import resource  # 仅 Unix；Windows 上不报告进程峰值内存
+except ImportError:
+    resource = None
+
+import numpy as np
 from PIL import Image, ImageStat
 import pypdfium2 as pdfium
 import pandas as pd
 
+import profiling
+
 
 @dataclass
 class PackConfig:
@@ -17,13 +32,30 @@ class PackConfig:
     overlap: float = 0.12
     skip_blank: bool = True
     blank_std_threshold: float = 6.0
+    row_std_threshold: float = 2.0   # 行标准差低于此值、且颜色与页面背景一致，才视为留白行
+    bg_tolerance: float = 16.0       # 与背景色（纯色行里最常见的颜色）各通道最大差在此以内算同色；整行纯色的色块不算留白
+    min_gap: int = 12                # 至少连续多少留白行才算可切的留白带
     pdf_scale: float = 2.0
+    page_range: str = ""       # 仅 PDF：如 "1-5,8"，空 = 全部页
+    codec: str = "png"         # 切片编码：png / webp / jpeg
+    quality: int = 85          # webp / jpeg 质量
+    png_optimize: bool = True
+    encode_workers: int = 0    # 切片编码进程数：0 = 自动（CPU 核数，最多 8），1 = 主线程串行
+    dedupe: bool = True        # 同一产品内（跨页）近似重复的切片只保留第一张
+    dedupe_hamming: int = 16   # 感知哈希（256 位）汉明距离 ≤ 此值才进入像素复核；0 = 仅哈希完全相同
+    dedupe_max_diff: float = 5.0  # 像素复核：128 像素宽灰度缩略图上 4×4 块平均灰度差的最大值 ≤ 此值才合并
 
 
-def is_blank(im: Image.Image, std_threshold: float) -> bool:
+def is_blank(im: Image.Image, std_threshold: float, background: Optional[np.ndarray] = None, tolerance: float = 16.0) -> bool:
+    # 整片近似纯色；给了背景色时还要求颜色与背景一致（整片纯色的色块 / 色卡不算空白）
     g = im.convert("L")
     stat = ImageStat.Stat(g)
-    return (stat.stddev[0] if stat.stddev else 0.0) < std_threshold
+    if (stat.stddev[0] if stat.stddev else 0.0) >= std_threshold:
+        return False
+    if background is None:
+        return True
+    mean = np.asarray(ImageStat.Stat(im.convert("RGB")).mean)
+    return bool(np.abs(mean - background).max() <= tolerance)
 
 
 def resize_to_width(im: Image.Image, target_w: int) -> Image.Image:
@@ -35,41 +67,395 @@ def resize_to_width(im: Image.Image, target_w: int) -> Image.Image:
     return im.resize((target_w, new_h), Image.LANCZOS)
 
 
-def pdf_to_images(pdf_bytes: bytes, scale: float):
+def parse_page_range(spec: str, n_pages: int) -> List[int]:
+    # "1-3,5" -> [1, 2, 3, 5]（1 起始，越界页忽略，保持升序去重）
+    if not spec or not spec.strip():
+        return list(range(1, n_pages + 1))
+    pages = set()
+    for part in spec.replace("，", ",").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            a, b = part.split("-", 1)
+            lo = int(a) if a.strip() else 1
+            hi = int(b) if b.strip() else n_pages
+            pages.update(range(max(1, lo), min(n_pages, hi) + 1))
+        else:
+            n = int(part)
+            if 1 <= n <= n_pages:
+                pages.add(n)
+    return sorted(pages)
+
+
+def iter_pdf_pages(pdf_bytes: bytes, scale: float, page_range: str = "") -> Iterator[Tuple[int, Image.Image]]:
+    # 逐页渲染：同一时刻只持有一页位图，页对象用完即关闭
     pdf = pdfium.PdfDocument(pdf_bytes)
-    images = []
-    for i in range(len(pdf)):
-        page = pdf[i]
-        pil = page.render(scale=scale).to_pil()
-        images.append(pil.convert("RGB"))
-    return images
+    try:
+        for pi in parse_page_range(page_range, len(pdf)):
+            page = pdf[pi - 1]
+            try:
+                with profiling.span("pdf.render", page=pi):
+                    bitmap = page.render(scale=scale)
+                    held = [bitmap.to_pil().convert("RGB")]
+                    bitmap.close()
+            finally:
+                page.close()
+            # pop 出去后生成器帧内不再引用该页，调用方 del 即可释放
+            yield pi, held.pop()
+    finally:
+        pdf.close()
 
 
-def slice_vertical(im: Image.Image, cfg: PackConfig):
-    slices = []
+def iter_image_pages(image_bytes: bytes) -> Iterator[Tuple[str, Image.Image]]:
+    # 普通图片视为单页，page 号为空串（与旧版 index_images.csv 保持一致）
+    with profiling.span("image.decode"):
+        held = [Image.open(io.BytesIO(image_bytes)).convert("RGB")]
+    yield "", held.pop()
+
+
+def pdf_to_images(pdf_bytes: bytes, scale: float, page_range: str = ""):
+    return [pil for _, pil in iter_pdf_pages(pdf_bytes, scale, page_range)]
+
+
+def row_profile(im: Image.Image) -> Tuple[np.ndarray, np.ndarray]:
+    # 整页只转一次灰度：返回每行标准差 + 每行平均颜色（BOX 缩成 1 像素宽，不展开整页 RGB 浮点数组）
+    row_std = np.asarray(im.convert("L"), dtype=np.float32).std(axis=1)
+    row_rgb = np.asarray(im.convert("RGB").resize((1, im.size[1]), Image.BOX), dtype=np.float32)[:, 0, :]
+    return row_std, row_rgb
+
+
+def page_background(row_std: np.ndarray, row_rgb: np.ndarray, std_threshold: float) -> Optional[np.ndarray]:
+    """
+    背景色：纯色行按颜色（8 级量化）分组，取“连续段数”最多的颜色，段数相同再比行数。
+    背景夹在每个区块之间，段数多；通栏色块再高也只是一两段。没有纯色行时返回 None（整页都不算留白）。
+    """
+    flat = row_std < std_threshold
+    if not flat.any():
+        return None
+    q = (row_rgb // 8).astype(np.int32)
+    key = (q[:, 0] << 16) | (q[:, 1] << 8) | q[:, 2]
+    starts = flat & np.concatenate(([True], (~flat[:-1]) | (key[1:] != key[:-1])))
+    colors, rows = np.unique(key[flat], return_counts=True)
+    run_colors, run_counts = np.unique(key[starts], return_counts=True)
+    runs = run_counts[np.searchsorted(run_colors, colors)]
+    best = colors[np.lexsort((rows, runs))[-1]]
+    return row_rgb[flat & (key == best)].mean(axis=0)
+
+
+def _whitespace_cut(ws: np.ndarray, lo: int, hi: int, min_gap: int) -> Optional[int]:
+    # 在 [lo, hi) 内找留白带（连续 ≥ min_gap 行低方差），取最靠下的一段的中线作为切点
+    window = ws[lo:hi].astype(np.int8)
+    if window.size == 0 or not window.any():
+        return None
+    edges = np.diff(np.concatenate(([0], window, [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    keep = (ends - starts) >= min_gap
+    if not keep.any():
+        return None
+    s, e = starts[keep][-1], ends[keep][-1]
+    return lo + int((s + e) // 2)
+
+
+def plan_cuts(im: Image.Image, cfg: PackConfig) -> List[Tuple[int, int, str]]:
+    """
+    基于行方差剖面规划切片 [(y0, y1, 切点原因)]：
+    - 每片高度在 [min_h, max_h] 内，优先切在留白带中间（whitespace），不把文字块/产品图切开
+    - 窗口内找不到留白时在 max_h 处硬切（max_h），下一片回退 overlap 保证内容不丢
+    - 页尾剩余部分直接收尾（end）；片与片之间的整段空白直接跳过
+    - 留白行 = 行内近似纯色且颜色与页面背景一致；通栏的纯色色块 / 色带是内容，不会被当成留白切掉
+    - skip_blank 时 is_blank（整片近似纯色且为背景色）的片不输出
+    """
     w, h = im.size
-    slice_h = max(cfg.min_h, min(cfg.max_h, cfg.max_h))
-    ov = int(round(slice_h * cfg.overlap))
-    step = max(1, slice_h - ov)
+    row_std, row_rgb = row_profile(im)
+    background = page_background(row_std, row_rgb, cfg.row_std_threshold)
+    if background is None:
+        ws = np.zeros(h, dtype=bool)
+    else:
+        ws = (row_std < cfg.row_std_threshold) & (np.abs(row_rgb - background).max(axis=1) <= cfg.bg_tolerance)
+    active = np.flatnonzero(~ws)
+    min_h = max(1, min(cfg.min_h, cfg.max_h))
+    ov = int(round(cfg.max_h * cfg.overlap))
 
+    cuts: List[Tuple[int, int, str]] = []
     y = 0
     while y < h:
-        y2 = min(h, y + slice_h)
-        crop = im.crop((0, y, w, y2))
-        if (not cfg.skip_blank) or (not is_blank(crop, cfg.blank_std_threshold)):
-            slices.append((y, crop))
-        if y2 >= h:
+        if cfg.skip_blank:
+            # 跳过片首的空白带，保留少量上边距
+            k = np.searchsorted(active, y)
+            if k >= active.size:
+                break
+            y = max(y, int(active[k]) - cfg.min_gap)
+
+        if h - y <= cfg.max_h:
+            y1, reason = h, "end"
+        else:
+            cut = _whitespace_cut(ws, y + min_h, y + cfg.max_h + 1, cfg.min_gap)
+            if cut is not None:
+                y1, reason = cut, "whitespace"
+            else:
+                y1, reason = y + cfg.max_h, "max_h"
+
+        if not cfg.skip_blank or not is_blank(im.crop((0, y, w, y1)), cfg.blank_std_threshold, background, cfg.bg_tolerance):
+            cuts.append((y, y1, reason))
+        if y1 >= h:
             break
-        y += step
-    return slices
+        y = max(y + 1, y1 - ov) if reason == "max_h" else y1
+    return cuts
+
+
+def iter_slices(im: Image.Image, cfg: PackConfig) -> Iterator[Tuple[int, Image.Image, str]]:
+    w, _ = im.size
+    for y0, y1, reason in plan_cuts(im, cfg):
+        yield y0, im.crop((0, y0, w, y1)), reason
+
+
+def slice_vertical(im: Image.Image, cfg: PackConfig):
+    return [(y0, crop) for y0, crop, _ in iter_slices(im, cfg)]
+
+
+def content_gray(im: Image.Image, row_std_threshold: float = 2.0) -> Image.Image:
+    # 灰度并去掉上下留白（切点落在留白带里的位置不同，边距会差几十行）
+    g = im.convert("L")
+    rows = np.flatnonzero(np.asarray(g, dtype=np.float32).std(axis=1) >= row_std_threshold)
+    if rows.size:
+        g = g.crop((0, int(rows[0]), g.size[0], int(rows[-1]) + 1))
+    return g
+
+
+def _dhash(g: Image.Image, hash_size: int = 16) -> np.ndarray:
+    # dHash：灰度缩到 (hash_size+1)×hash_size，比较左右相邻像素，得到 hash_size² 位的布尔数组
+    a = np.asarray(g.resize((hash_size + 1, hash_size), Image.BILINEAR), dtype=np.int16)
+    return (a[:, 1:] > a[:, :-1]).ravel()
+
+
+def slice_hash(im: Image.Image, row_std_threshold: float = 2.0, hash_size: int = 16) -> Tuple[np.ndarray, int]:
+    # 去留白后的 dHash 与内容高度
+    g = content_gray(im, row_std_threshold)
+    return _dhash(g, hash_size), g.size[1]
+
+
+def thumb_diff(a: np.ndarray, b: np.ndarray, block: int = 4) -> float:
+    # 两张同尺寸灰度缩略图逐 block×block 块求平均绝对差，取最大块：
+    # 只改了一格数字的尺码表整体平均差很小，但那一块会明显突出；JPEG 噪声则分散在各块里
+    d = np.abs(a.astype(np.float32) - b.astype(np.float32))
+    bh, bw = (d.shape[0] // block) * block, (d.shape[1] // block) * block
+    if bh == 0 or bw == 0:
+        return float(d.mean()) if d.size else 0.0
+    return float(d[:bh, :bw].reshape(bh // block, block, bw // block, block).mean(axis=(1, 3)).max())
+
+
+class _SliceDeduper:
+    """
+    产品内近似重复切片去重（反复出现的横幅、尺码表、认证块，以及跨页重复的内容）：
+    - 每张切片算 dHash（不含上下留白），与已保留的切片逐一比较汉明距离，只用来粗筛候选
+    - 内容高度相差超过 15% 的不算重复（dHash 对纵横比不敏感，避免把拉伸后相似的图合并）
+    - 候选再做像素复核：缩到 128 像素宽的灰度图上比 4×4 块平均差（thumb_diff），≤ max_diff 才合并。
+      16×16 的 dHash 分不出同版式、不同数字的尺码表（汉明距离常在 0–2），复核宁可漏合并也不误合并
+    """
+
+    THUMB_W = 128
+
+    def __init__(self, max_distance: int, row_std_threshold: float, max_diff: float = 5.0):
+        self.max_distance = max_distance
+        self.row_std_threshold = row_std_threshold
+        self.max_diff = max_diff
+        self._hashes: List[np.ndarray] = []
+        self._heights: List[int] = []
+        self._thumbs: List[np.ndarray] = []
+        self._files: List[str] = []
+
+    def _thumb(self, g: Image.Image, size: Optional[Tuple[int, int]] = None) -> np.ndarray:
+        if size is None:
+            w, h = g.size
+            size = (min(self.THUMB_W, w), max(1, round(h * min(self.THUMB_W, w) / w)))
+        return np.asarray(g.resize(size, Image.BOX), dtype=np.uint8)
 
+    def match(self, im: Image.Image) -> Tuple[np.ndarray, int, np.ndarray, Optional[str], Optional[int], Optional[float]]:
+        # 返回 (哈希, 内容高度, 缩略图, 重复的代表切片文件, 汉明距离, 像素差)；不重复时后三项为 None
+        with profiling.timed("pack.phash"):
+            g = content_gray(im, self.row_std_threshold)
+            h, height = _dhash(g), g.size[1]
+            thumb = self._thumb(g)
+            if self._hashes:
+                dist = np.count_nonzero(np.stack(self._hashes) != h, axis=1)
+                heights = np.asarray(self._heights)
+                ok = (dist <= self.max_distance) & (np.abs(heights - height) <= 0.15 * np.maximum(heights, height))
+                for i in np.flatnonzero(ok)[np.argsort(dist[ok], kind="stable")]:
+                    rep = self._thumbs[i]
+                    cand = thumb if rep.shape == thumb.shape else self._thumb(g, (rep.shape[1], rep.shape[0]))
+                    diff = thumb_diff(rep, cand)
+                    if diff <= self.max_diff:
+                        return h, height, thumb, self._files[i], int(dist[i]), round(diff, 2)
+                    profiling.count("pack.dedupe_rejected")
+        return h, height, thumb, None, None, None
 
-def _img_to_png_bytes(img: Image.Image) -> bytes:
+    def keep(self, h: np.ndarray, height: int, thumb: np.ndarray, file: str):
+        self._hashes.append(h)
+        self._heights.append(height)
+        self._thumbs.append(thumb)
+        self._files.append(file)
+
+
+def _hash_hex(h: np.ndarray) -> str:
+    return np.packbits(h).tobytes().hex()
+
+
+class _MemoryTracker:
+    # 统计同时驻留的解码图像字节数峰值（宽×高×通道），用于确认“约一页驻留”
+    def __init__(self):
+        self.current = 0
+        self.peak = 0
+
+    def hold(self, im: Image.Image) -> int:
+        n = im.size[0] * im.size[1] * len(im.getbands())
+        self.current += n
+        self.peak = max(self.peak, self.current)
+        return n
+
+    def drop(self, n: int):
+        self.current -= n
+
+
+def _process_peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    # Linux 上 ru_maxrss 单位是 KB
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0, 1)
+
+
+CODEC_EXT = {"png": "png", "webp": "webp", "jpeg": "jpg"}
+
+
+def encode_image(img: Image.Image, codec: str = "png", quality: int = 85, png_optimize: bool = True) -> bytes:
     buf = io.BytesIO()
-    img.save(buf, format="PNG", optimize=True)
+    if codec == "png":
+        img.save(buf, format="PNG", optimize=png_optimize)
+    elif codec == "webp":
+        img.save(buf, format="WEBP", quality=quality, method=4)
+    elif codec == "jpeg":
+        img.save(buf, format="JPEG", quality=quality, optimize=True, progressive=True)
+    else:
+        raise ValueError(f"不支持的切片编码: {codec}")
     return buf.getvalue()
 
 
+def _encode_raw(mode: str, size: Tuple[int, int], raw: bytes, codec: str, quality: int, png_optimize: bool) -> bytes:
+    # 进程池入口：只传原始像素，避免序列化 PIL 对象
+    return encode_image(Image.frombytes(mode, size, raw), codec, quality, png_optimize)
+
+
+_ENCODE_POOLS: Dict[int, ProcessPoolExecutor] = {}
+_ENCODE_POOL_LOCK = threading.Lock()
+
+
+def _encode_workers(cfg: PackConfig) -> int:
+    if cfg.encode_workers > 0:
+        return cfg.encode_workers
+    return max(1, min(8, os.cpu_count() or 1))
+
+
+def _encode_mp_context():
+    # 不用 fork：Streamlit / 调度器里有大量线程和锁，fork 出的子进程可能拿到被持有的锁而卡死
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+def _get_encode_pool(workers: int) -> Optional[ProcessPoolExecutor]:
+    # 每种进程数一个进程池，全局复用（多个产品并行打包时共享）；
+    # 不会关掉别的产品可能正在用的池。创建失败则退回串行编码
+    with _ENCODE_POOL_LOCK:
+        pool = _ENCODE_POOLS.get(workers)
+        if pool is None:
+            try:
+                pool = _ENCODE_POOLS[workers] = ProcessPoolExecutor(max_workers=workers, mp_context=_encode_mp_context())
+            except (OSError, NotImplementedError, ValueError):
+                return None
+        return pool
+
+
+def _discard_encode_pool(pool: ProcessPoolExecutor):
+    # 子进程异常退出后池不可再用：从缓存里摘掉，下一个产品会新建
+    with _ENCODE_POOL_LOCK:
+        for workers, cached in list(_ENCODE_POOLS.items()):
+            if cached is pool:
+                del _ENCODE_POOLS[workers]
+    pool.shutdown(wait=False)
+
+
+class _OrderedSliceWriter:
+    """
+    切片编码 + 写 zip：
+    - 编码放进进程池并行，写入严格按提交顺序（index_images.csv 与 zip 内顺序稳定）
+    - 在途切片数有上限（2×进程数），配合逐页渲染把内存控制在常数级
+    - 图片本身已压缩，zip 内用 ZIP_STORED 存放，不再二次 deflate
+    - 进程池坏掉（BrokenProcessPool，如子进程被 OOM kill）时，未完成的切片改在本进程编码
+    """
+
+    def __init__(self, master_zip, cfg: PackConfig, mem: "_MemoryTracker"):
+        self.master_zip = master_zip
+        self.cfg = cfg
+        self.mem = mem
+        self.bytes_written = 0
+        workers = _encode_workers(cfg)
+        self.pool = _get_encode_pool(workers) if workers > 1 else None
+        self.max_inflight = 2 * workers
+        self._pending = deque()
+
+    def _encode_here(self, img: Image.Image) -> bytes:
+        with profiling.timed("pack.encode"):
+            return encode_image(img, self.cfg.codec, self.cfg.quality, self.cfg.png_optimize)
+
+    def _pool_broken(self):
+        profiling.count("pack.encode_pool_broken")
+        _discard_encode_pool(self.pool)
+        self.pool = None
+
+    def submit(self, arcname: str, img: Image.Image):
+        held = self.mem.hold(img)
+        if self.pool is not None:
+            try:
+                fut = self.pool.submit(
+                    _encode_raw, img.mode, img.size, img.tobytes(), self.cfg.codec, self.cfg.quality, self.cfg.png_optimize
+                )
+            except BrokenProcessPool:
+                self._pool_broken()
+            else:
+                self._pending.append((arcname, fut, held, img))
+                while len(self._pending) > self.max_inflight:
+                    self._write_head()
+                return
+        # 串行：先把进程池里在途的写完，保证写入顺序
+        while self._pending:
+            self._write_head()
+        self._write(arcname, self._encode_here(img), held)
+
+    def _write_head(self):
+        arcname, fut, held, img = self._pending.popleft()
+        # 进程池编码：这里只能量到主线程等待编码结果的时间
+        try:
+            with profiling.timed("pack.encode_wait"):
+                data = fut.result()
+        except BrokenProcessPool:
+            if self.pool is not None:
+                self._pool_broken()
+            data = self._encode_here(img)
+        self._write(arcname, data, held)
+
+    def _write(self, arcname: str, data: bytes, held: int):
+        with profiling.timed("pack.zip_write"):
+            self.master_zip.writestr(arcname, data, compress_type=zipfile.ZIP_STORED)
+        self.bytes_written += len(data)
+        profiling.count("pack.bytes_encoded", len(data))
+        profiling.count("pack.slices")
+        self.mem.drop(held)
+
+    def close(self):
+        while self._pending:
+            self._write_head()
+
+
 def _df_to_csv_bytes(df: pd.DataFrame) -> bytes:
     return df.to_csv(index=False).encode("utf-8-sig")
 
@@ -95,24 +481,56 @@ def write_feed_to_master_zip(
     res1_text: str,
     res3_text: str,
     out_root: str = "",        # ✅ 新增：控制写入 zip 的根目录
+    pages: Optional[Iterable[Tuple[Any, Image.Image]]] = None,   # 预处理阶段已解码好的页（PageStore），有则不再渲染/解码
 ):
     # out_root="" => 写到zip根目录；out_root="xxx" => 写到 xxx/ 下
     prefix = out_root.strip("/").strip()
     def p(path: str) -> str:
         return f"{prefix}/{path}" if prefix else path
 
-    # 1) 切片（基于最初上传文件）
+    # 1) 切片（基于最初上传文件）：逐页 渲染 -> 缩放 -> 切片 -> 编码 -> 写入，写完即释放
     index_rows: List[Dict[str, Any]] = []
     ext = uploaded_filename.lower().split(".")[-1]
+    mem = _MemoryTracker()
+
+    if pages is None:
+        if ext == "pdf":
+            pages = iter_pdf_pages(uploaded_bytes, scale=cfg.pdf_scale, page_range=cfg.page_range)
+        else:
+            pages = iter_image_pages(uploaded_bytes)
 
-    if ext == "pdf":
-        pages = pdf_to_images(uploaded_bytes, scale=cfg.pdf_scale)
-        for pi, pim in enumerate(pages, start=1):
-            rim = resize_to_width(pim, cfg.target_w)
-            sl = slice_vertical(rim, cfg)
-            for si, (y0, simg) in enumerate(sl, start=1):
-                out_name = f"{folder_name}__p{pi:03d}__s{si:03d}.png"
-                master_zip.writestr(p(f"slices/{out_name}"), _img_to_png_bytes(simg))
+    writer = _OrderedSliceWriter(master_zip, cfg, mem)
+    deduper = _SliceDeduper(cfg.dedupe_hamming, cfg.row_std_threshold, cfg.dedupe_max_diff) if cfg.dedupe else None
+    ext_out = CODEC_EXT[cfg.codec]
+    pages_done = 0
+    merged = 0
+    for pi, pim in pages:
+        with profiling.span("pack.page", page=pi):
+            held = mem.hold(pim)
+            with profiling.timed("pack.resize"):
+                rim = resize_to_width(pim, cfg.target_w)
+            if rim is not pim:
+                resized = mem.hold(rim)
+                mem.drop(held)
+                held = resized
+            del pim
+            for si, (y0, simg, reason) in enumerate(iter_slices(rim, cfg), start=1):
+                if pi == "":
+                    out_name = f"{folder_name}__s{si:03d}.{ext_out}"
+                else:
+                    out_name = f"{folder_name}__p{pi:03d}__s{si:03d}.{ext_out}"
+                file, phash, dup_of, dist, diff = f"slices/{out_name}", "", "", "", ""
+                if deduper is not None:
+                    h, content_h, thumb, rep_file, rep_dist, rep_diff = deduper.match(simg)
+                    phash = _hash_hex(h)
+                    if rep_file is None:
+                        deduper.keep(h, content_h, thumb, file)
+                    else:
+                        # 重复切片不编码、不写入，file 指向保留下来的那张
+                        file, dup_of, dist, diff = rep_file, rep_file, rep_dist, rep_diff
+                        merged += 1
+                if not dup_of:
+                    writer.submit(p(file), simg)
                 index_rows.append({
                     "source": folder_name,
                     "page": pi,
@@ -120,28 +538,27 @@ def write_feed_to_master_zip(
                     "y0": y0,
                     "width": simg.size[0],
                     "height": simg.size[1],
-                    "file": f"slices/{out_name}"
+                    "cut": reason,
+                    "file": file,
+                    "phash": phash,
+                    "merged_into": dup_of,
+                    "hamming": dist,
+                    "pixel_diff": diff,
                 })
-    else:
-        im = Image.open(io.BytesIO(uploaded_bytes)).convert("RGB")
-        rim = resize_to_width(im, cfg.target_w)
-        sl = slice_vertical(rim, cfg)
-        for si, (y0, simg) in enumerate(sl, start=1):
-            out_name = f"{folder_name}__s{si:03d}.png"
-            master_zip.writestr(p(f"slices/{out_name}"), _img_to_png_bytes(simg))
-            index_rows.append({
-                "source": folder_name,
-                "page": "",
-                "slice": si,
-                "y0": y0,
-                "width": simg.size[0],
-                "height": simg.size[1],
-                "file": f"slices/{out_name}"
-            })
+                del simg
+            del rim
+            mem.drop(held)
+            pages_done += 1
+    with profiling.span("pack.flush"):
+        writer.close()
+    profiling.count("pack.pages", pages_done)
+    profiling.count("pack.slices_merged", merged)
 
     master_zip.writestr(
         p("index_images.csv"),
-        _dicts_to_csv_bytes(index_rows, ["source", "page", "slice", "y0", "width", "height", "file"])
+        _dicts_to_csv_bytes(
+            index_rows, ["source", "page", "slice", "y0", "width", "height", "cut", "file", "phash", "merged_into", "hamming", "pixel_diff"]
+        )
     )
 
     # 2) 表格数据化（你前面已要求：只保留最终表 + seed）
@@ -159,7 +576,10 @@ def write_feed_to_master_zip(
         },
         "images": {
             "index": "index_images.csv",
-            "slices_dir": "slices/"
+            "slices_dir": "slices/",
+            "slice_count": len(index_rows) - merged,
+            "slices_merged": merged,
+            "slice_bytes": writer.bytes_written
         },
         "slice_config": {
             "target_w": cfg.target_w,
@@ -168,7 +588,21 @@ def write_feed_to_master_zip(
             "overlap": cfg.overlap,
             "skip_blank": cfg.skip_blank,
             "blank_std_threshold": cfg.blank_std_threshold,
-            "pdf_scale": cfg.pdf_scale
+            "row_std_threshold": cfg.row_std_threshold,
+            "bg_tolerance": cfg.bg_tolerance,
+            "min_gap": cfg.min_gap,
+            "pdf_scale": cfg.pdf_scale,
+            "page_range": cfg.page_range,
+            "codec": cfg.codec,
+            "quality": cfg.quality,
+            "dedupe": cfg.dedupe,
+            "dedupe_hamming": cfg.dedupe_hamming,
+            "dedupe_max_diff": cfg.dedupe_max_diff
+        },
+        "memory": {
+            "pages_rendered": pages_done,
+            "peak_decoded_image_mb": round(mem.peak / 1024.0 / 1024.0, 1),
+            "process_peak_rss_mb": _process_peak_rss_mb()
         }
     }
     master_zip.writestr(p("schema.json"), json.dumps(schema, ensure_ascii=False, indent=2).encode("utf-8"))
@@ -182,7 +616,7 @@ def write_feed_to_master_zip(
         "【如何用这个喂料包给GPT分析】\n"
         "1) tables/market_top.csv：最终可用的核心数据表（优先读这个）。\n"
         "2) tables/keywords_seed.csv：第一步AI种子词（需要时参考）。\n"
-        "3) slices/：原始详情页切片（按 index_images.csv 顺序看）。\n"
+        "3) slices/：原始详情页切片（按 index_images.csv 顺序看；merged_into 非空的行是近似重复切片，已合并到该文件，不必重复看）。\n"
         "4) reports/：Gemini原报告（用于校验理解）。\n"
     )
     master_zip.writestr(p("HOW_TO_USE_WITH_GPT.txt"), howto.encode("utf-8"))
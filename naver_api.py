@@ -0,0 +1,459 @@
+import base64
+import concurrent.futures
+import hashlib
+import hmac
+import random
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+import profiling
+
+NAVER_API_BASE = "https://api.searchad.naver.com"
+KEYWORDSTOOL_URI = "/keywordstool"
+
+# keywordstool 单次请求最多接受 5 个 hintKeywords（英文逗号隔开）
+MAX_HINTS_PER_REQUEST = 5
+
+# 批量模式下无法归属到具体种子词的行，AI溯源(原词) 写成整批种子词用该分隔符拼接
+BATCH_FALLBACK_SEP = " | "
+
+# df_market 的拓展层级列：目标原词 0，种子词直接拓出的 1，多层拓词（keyword_expand）再往下递增
+HOP_COL = "拓展层级"
+
+
+def clean_for_api(keyword: str) -> str:
+    return re.sub(r"\s+", "", keyword)
+
+
+def normalize_count(raw):
+    if isinstance(raw, int): return raw
+    if isinstance(raw, str):
+        s = raw.strip()
+        if s.startswith("<"): return 5
+        if s.startswith(">"):
+            num = s[1:].strip()
+            return int(num) if num.isdigit() else 0
+        s = s.replace(",", "")
+        if s.isdigit(): return int(s)
+    return 0
+
+
+def normalize_keyword(keyword: str) -> str:
+    # 用于归属比对：去空白 + 小写（韩文不受影响，英文大小写统一）
+    return clean_for_api(str(keyword)).lower()
+
+
+def chunk_seeds(seeds: Sequence[str], size: int = MAX_HINTS_PER_REQUEST) -> List[List[str]]:
+    """
+    把种子词分成每批最多 size 个。clean_for_api 后相同的种子词只占一个名额
+    （后出现的并入同一批，归属时仍按第一次出现的原词）。
+    """
+    size = max(1, min(size, MAX_HINTS_PER_REQUEST))
+    batches: List[List[str]] = []
+    seen = set()
+    current: List[str] = []
+    for mk in seeds:
+        hint = clean_for_api(mk)
+        if not hint or hint in seen:
+            continue
+        seen.add(hint)
+        current.append(mk)
+        if len(current) == size:
+            batches.append(current)
+            current = []
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _bigrams(s: str) -> set:
+    return {s[i:i + 2] for i in range(len(s) - 1)} if len(s) > 1 else {s}
+
+
+def attribute_seed(rel_keyword: str, seeds: Sequence[str]) -> Tuple[str, str]:
+    """
+    批量请求时把返回的 relKeyword 归属回种子词，返回 (原词, 匹配方式)：
+    1) exact    ：去空白/小写后完全相同
+    2) contains ：relKeyword 包含种子词（取最长的那个种子词）
+    3) bigram   ：字符二元组 Jaccard 相似度最高且 > 0 的种子词
+    4) batch    ：以上都不命中（如中英混写、完全无字面重叠的联想词），
+                  无法判断来源，原词写为整批种子词用 " | " 拼接
+    """
+    rk = normalize_keyword(rel_keyword)
+    normed = [(mk, normalize_keyword(mk)) for mk in seeds]
+
+    for mk, n in normed:
+        if n == rk:
+            return mk, "exact"
+
+    contained = [(mk, n) for mk, n in normed if n and n in rk]
+    if contained:
+        return max(contained, key=lambda t: len(t[1]))[0], "contains"
+
+    rk_grams = _bigrams(rk)
+    best_mk, best_score = None, 0.0
+    for mk, n in normed:
+        grams = _bigrams(n)
+        union = rk_grams | grams
+        score = len(rk_grams & grams) / len(union) if union else 0.0
+        if score > best_score:
+            best_mk, best_score = mk, score
+    if best_mk is not None:
+        return best_mk, "bigram"
+
+    return BATCH_FALLBACK_SEP.join(seeds), "batch"
+
+
+def rows_from_keyword_list(keyword_list: List[Dict[str, Any]], seeds: Sequence[str]) -> List[Dict[str, Any]]:
+    # 单个种子词直接归属；多个种子词（批量请求）逐行做 attribute_seed
+    rows = []
+    for item in keyword_list:
+        rel = item.get("relKeyword", "")
+        if len(seeds) == 1:
+            origin = seeds[0]
+        else:
+            origin, _ = attribute_seed(rel, seeds)
+        pc = normalize_count(item.get("monthlyPcQcCnt", 0))
+        mob = normalize_count(item.get("monthlyMobileQcCnt", 0))
+        rows.append({
+            "Naver实际搜索词": rel,
+            "月总搜索量": pc + mob,
+            "竞争度": item.get("compIdx", "-"),
+            "AI溯源(原词)": origin
+        })
+    return rows
+
+
+def make_signature(secret_key_bytes: bytes, method: str, uri: str, timestamp: str) -> str:
+    message = f"{timestamp}.{method}.{uri}".encode("utf-8")
+    signature = hmac.new(secret_key_bytes, message, hashlib.sha256).digest()
+    return base64.b64encode(signature).decode("utf-8")
+
+
+class NaverFetchError(Exception):
+    # reason 是给运营看的失败原因（会逐词展示在 UI 上），status 为最后一次 HTTP 状态码
+    def __init__(self, reason: str, status: Optional[int] = None, attempts: int = 0):
+        super().__init__(reason)
+        self.reason = reason
+        self.status = status
+        self.attempts = attempts
+
+
+class AIMDLimiter:
+    """
+    并发上限的 AIMD 自适应控制：
+    - 每成功 limit 次请求（约一轮并发），上限 +1（加性增）
+    - 遇到 429 / 5xx 限流，上限减半（乘性减），不低于 min_limit
+    """
+
+    def __init__(self, initial: int = 5, min_limit: int = 1, max_limit: int = 16, decrease: float = 0.5):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease = decrease
+        self._limit = float(max(min_limit, min(initial, max_limit)))
+        self._in_flight = 0
+        self._successes = 0
+        self._cond = threading.Condition()
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    def acquire(self):
+        with self._cond:
+            while self._in_flight >= int(self._limit):
+                self._cond.wait()
+            self._in_flight += 1
+
+    def release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def on_success(self):
+        with self._cond:
+            self._successes += 1
+            if self._successes >= int(self._limit):
+                self._successes = 0
+                self._limit = min(self.max_limit, self._limit + 1)
+                self._cond.notify_all()
+
+    def on_throttle(self):
+        with self._cond:
+            self._successes = 0
+            self._limit = max(self.min_limit, self._limit * self.decrease)
+
+
+class NaverClient:
+    """
+    keywordstool 客户端：
+    - 复用带连接池的 keep-alive Session
+    - 429 / 5xx / 网络异常按指数退避 + 随机抖动重试（优先遵循 Retry-After）
+    - 并发由 AIMDLimiter 根据限流情况自动调节
+    - quota（QuotaLimiter，可选）：按 CUSTOMER_ID 跨会话共享的请求速率 / 日配额，额度不够时排队而不是失败
+    - 最终失败抛 NaverFetchError（带原因），不再静默吞掉
+    """
+
+    RETRY_STATUS = {429, 500, 502, 503, 504}
+
+    def __init__(
+        self,
+        api_key: str,
+        secret_key: str,
+        customer_id: str,
+        base_url: str = NAVER_API_BASE,
+        timeout: float = 8,
+        max_retries: int = 4,
+        backoff_base: float = 0.5,
+        backoff_cap: float = 8.0,
+        limiter: Optional[AIMDLimiter] = None,
+        pool_size: int = 16,
+        quota=None,
+    ):
+        self.api_key = api_key
+        self.secret_key_bytes = secret_key.encode("utf-8")
+        self.customer_id = customer_id
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.limiter = limiter or AIMDLimiter(max_limit=pool_size)
+        self.quota = quota
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _headers(self) -> Dict[str, str]:
+        timestamp = str(int(time.time() * 1000))
+        return {
+            "X-Timestamp": timestamp,
+            "X-API-KEY": self.api_key,
+            "X-Customer": self.customer_id,
+            "X-Signature": make_signature(self.secret_key_bytes, "GET", KEYWORDSTOOL_URI, timestamp),
+        }
+
+    def _backoff(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        if retry_after:
+            try:
+                return min(self.backoff_cap, float(retry_after))
+            except ValueError:
+                pass
+        # full jitter：0 ~ min(cap, base * 2^attempt)
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+
+    def fetch_keyword_list(self, hint: str) -> List[Dict[str, Any]]:
+        params = {"hintKeywords": hint, "showDetail": 1}
+        reason, status = "未知错误", None
+        for attempt in range(self.max_retries + 1):
+            res, retry_after = None, None
+            if self.quota is not None:
+                self.quota.acquire()
+            with profiling.timed("naver.limiter_wait"):
+                self.limiter.acquire()
+            try:
+                with profiling.span("naver.request", hint=hint, attempt=attempt + 1) as attrs:
+                    profiling.count("naver.requests")
+                    res = self.session.get(self.base_url + KEYWORDSTOOL_URI, headers=self._headers(), params=params, timeout=self.timeout)
+                    attrs["status"] = res.status_code
+                profiling.count(f"naver.http.{res.status_code}")
+            except (requests.ConnectionError, requests.Timeout) as e:
+                status, reason = None, f"网络异常: {type(e).__name__}"
+                profiling.count("naver.network_errors")
+            finally:
+                self.limiter.release()
+
+            if res is None:
+                self.limiter.on_throttle()
+            elif res.status_code == 200:
+                self.limiter.on_success()
+                try:
+                    return res.json().get("keywordList", [])
+                except ValueError:
+                    raise NaverFetchError("响应不是合法 JSON", 200, attempt + 1)
+            elif res.status_code in self.RETRY_STATUS:
+                status = res.status_code
+                reason = "HTTP 429 限流" if status == 429 else f"HTTP {status} 服务端错误"
+                retry_after = res.headers.get("Retry-After")
+                self.limiter.on_throttle()
+            else:
+                raise NaverFetchError(f"HTTP {res.status_code}: {res.text[:200]}", res.status_code, attempt + 1)
+
+            if attempt < self.max_retries:
+                profiling.count("naver.retries")
+                with profiling.timed("naver.backoff"):
+                    time.sleep(self._backoff(attempt, retry_after))
+        raise NaverFetchError(f"{reason}（已重试 {self.max_retries} 次）", status, self.max_retries + 1)
+
+
+def fetch_hint(hint, client, cache=None, force_refresh=False, cache_ttl=None):
+    # ♻️ 先查本地缓存，未命中/强制刷新时才真正请求 Naver
+    if cache is not None and not force_refresh:
+        cached = cache.get(hint, ttl_seconds=cache_ttl)
+        if cached is not None:
+            profiling.count("naver.cache_hit")
+            return cached
+        profiling.count("naver.cache_miss")
+    keyword_list = client.fetch_keyword_list(hint)
+    if cache is not None:
+        cache.put(hint, keyword_list)
+    return keyword_list
+
+
+class NaverLookup:
+    """
+    单次运行（一批产品）内的 Naver 查询合并（single-flight）：
+    - hint 归一化（去空白、小写）后作为 key，同一 key 同时只有一个真实请求，其余调用方等它的结果
+    - 成功结果在本次运行内记住，后到的产品直接复用（跨运行的复用交给 NaverKeywordCache）
+    - 失败不记住：后来的调用方会重新请求
+    - 返回的是原始 keywordList，各产品再按自己的原词做 AI溯源(原词) 归属
+    """
+
+    def __init__(self, client, cache=None, force_refresh=False, cache_ttl=None):
+        self.client = client
+        self.cache = cache
+        self.force_refresh = force_refresh
+        self.cache_ttl = cache_ttl
+        self._futures: Dict[str, concurrent.futures.Future] = {}
+        self._lock = threading.Lock()
+        self.requested = 0
+        self.coalesced = 0
+
+    @staticmethod
+    def key(hint: str) -> str:
+        return ",".join(normalize_keyword(h) for h in hint.split(","))
+
+    def fetch(self, hint: str) -> List[Dict[str, Any]]:
+        key = self.key(hint)
+        with self._lock:
+            self.requested += 1
+            fut = self._futures.get(key)
+            owner = fut is None
+            if owner:
+                fut = self._futures[key] = concurrent.futures.Future()
+            else:
+                self.coalesced += 1
+        if not owner:
+            profiling.count("naver.coalesced")
+            return fut.result()
+        try:
+            keyword_list = fetch_hint(hint, self.client, self.cache, self.force_refresh, self.cache_ttl)
+        except BaseException as e:
+            with self._lock:
+                self._futures.pop(key, None)
+            fut.set_exception(e)
+            raise
+        fut.set_result(keyword_list)
+        return keyword_list
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"requested": self.requested, "coalesced": self.coalesced, "unique": len(self._futures)}
+
+
+class NaverPrefetcher:
+    """
+    投机预取：第一步还在流式输出时，种子词一出现就提交 Naver 查询（仅逐词模式）。
+    - 同一 hint 只提交一次；fetch_naver_data 通过 take() 直接取用结果，只补查缺口
+    - 最终关键词里没有的投机词结果不进表（已写入本地缓存，不算白查）
+    - close() 取消尚未开始的查询
+    """
+
+    def __init__(self, lookup: NaverLookup):
+        self.lookup = lookup
+        self._futures: Dict[str, concurrent.futures.Future] = {}
+        self._lock = threading.Lock()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=lookup.client.limiter.max_limit, thread_name_prefix="naver-prefetch")
+
+    def submit(self, seeds: Sequence[str]) -> int:
+        submitted = 0
+        with self._lock:
+            for mk in seeds:
+                hint = clean_for_api(mk)
+                if not hint or hint in self._futures:
+                    continue
+                self._futures[hint] = self._executor.submit(profiling.bind(self.lookup.fetch), hint)
+                submitted += 1
+        profiling.count("naver.speculative_seeds", submitted)
+        return submitted
+
+    def take(self, hint: str) -> Optional[concurrent.futures.Future]:
+        with self._lock:
+            fut = self._futures.get(hint)
+        if fut is None or fut.cancelled():
+            return None
+        return fut
+
+    def __len__(self):
+        with self._lock:
+            return len(self._futures)
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def fetch_naver_data(main_keywords, client, cache=None, force_refresh=False, cache_ttl=None, batch_size=1, on_progress=None, prefetched=None, lookup=None):
+    """
+    种子词 -> Naver 拓词表 (df_market) + 失败词 {原词: 原因}。
+    on_progress(completed, total, batch, concurrency) 每完成一批回调一次（在调用线程中执行）。
+    prefetched：NaverPrefetcher，逐词模式下已投机提交过的种子词直接取结果。
+    lookup：NaverLookup，跨产品合并相同查询；给了它就不再单独使用 client/cache 参数。
+    """
+    all_rows = []
+    failures = {}
+
+    def fetch_batch(batch):
+        # batch_size=1 时每批只有一个种子词，与逐词查询完全一致
+        hint = ",".join(clean_for_api(mk) for mk in batch)
+        fut = prefetched.take(hint) if prefetched is not None and len(batch) == 1 else None
+        if fut is not None:
+            profiling.count("naver.speculative_used")
+            keyword_list = fut.result()
+        elif lookup is not None:
+            keyword_list = lookup.fetch(hint)
+        else:
+            keyword_list = fetch_hint(hint, client, cache, force_refresh, cache_ttl)
+        return rows_from_keyword_list(keyword_list, batch)
+
+    # 去空白后相同的种子词只查一次（逐词模式同样适用，归属按第一次出现的原词）
+    batches = chunk_seeds(main_keywords, batch_size)
+    total = max(1, sum(len(b) for b in batches))
+
+    completed = 0
+    # 线程数按上限开足，真实并发由 client.limiter (AIMD) 控制
+    with concurrent.futures.ThreadPoolExecutor(max_workers=client.limiter.max_limit) as executor:
+        future_to_batch = {executor.submit(profiling.bind(fetch_batch), batch): batch for batch in batches}
+        for future in concurrent.futures.as_completed(future_to_batch):
+            batch = future_to_batch[future]
+            completed += len(batch)
+            try:
+                all_rows.extend(future.result())
+            except NaverFetchError as e:
+                for mk in batch:
+                    failures[mk] = e.reason
+            except Exception as e:
+                for mk in batch:
+                    failures[mk] = f"本地异常: {e}"
+            if on_progress is not None:
+                on_progress(completed, total, batch, client.limiter.limit)
+
+    df = pd.DataFrame(all_rows)
+    if not df.empty:
+        df = df.drop_duplicates(subset=["Naver实际搜索词"])
+
+        seed_no_space = [str(k).replace(" ", "") for k in main_keywords]
+        df['is_seed'] = df['Naver实际搜索词'].apply(lambda x: str(x).replace(" ", "") in seed_no_space)
+
+        df.insert(1, '词组属性', df['is_seed'].apply(lambda x: '🎯 目标原词' if x else '💡 衍生拓展词'))
+        df[HOP_COL] = (~df['is_seed']).astype(int)
+        df = df.sort_values(by=["is_seed", "月总搜索量"], ascending=[False, False])
+        df = df.drop(columns=['is_seed'])
+
+    return df, failures
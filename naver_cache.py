@@ -0,0 +1,97 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+
+class NaverKeywordCache:
+    """
+    Naver keywordstool 原始响应的本地持久缓存（SQLite）。
+    - key：clean_for_api 之后的 hintKeywords 字符串
+    - value：接口返回的原始 keywordList + 抓取时间
+    - 超过 TTL 视为失效；条目数超过 max_entries 时按最近访问时间淘汰（LRU）
+    """
+
+    def __init__(self, path: str, ttl_seconds: float = 72 * 3600, max_entries: int = 20000):
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # 抓取是多线程并发的，连接跨线程共享，由 _lock 串行化
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS keywordstool (
+                hint TEXT PRIMARY KEY,
+                payload TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_kt_accessed ON keywordstool(accessed_at)")
+        self._conn.commit()
+
+    def get(self, hint: str, ttl_seconds: Optional[float] = None) -> Optional[List[Dict[str, Any]]]:
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload, fetched_at FROM keywordstool WHERE hint = ?", (hint,)
+            ).fetchone()
+            if row is None:
+                return None
+            payload, fetched_at = row
+            if now - fetched_at > ttl:
+                self._conn.execute("DELETE FROM keywordstool WHERE hint = ?", (hint,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE keywordstool SET accessed_at = ? WHERE hint = ?", (now, hint))
+            self._conn.commit()
+        return json.loads(payload)
+
+    def put(self, hint: str, keyword_list: List[Dict[str, Any]]):
+        now = time.time()
+        payload = json.dumps(keyword_list, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO keywordstool (hint, payload, fetched_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (hint, payload, now, now),
+            )
+            self._evict_locked()
+            self._conn.commit()
+
+    def _evict_locked(self):
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM keywordstool").fetchone()
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM keywordstool WHERE hint IN "
+                "(SELECT hint FROM keywordstool ORDER BY accessed_at ASC LIMIT ?)",
+                (overflow,),
+            )
+
+    def purge_expired(self, ttl_seconds: Optional[float] = None) -> int:
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        with self._lock:
+            cur = self._conn.execute("DELETE FROM keywordstool WHERE fetched_at < ?", (time.time() - ttl,))
+            self._conn.commit()
+            return cur.rowcount
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM keywordstool")
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            count, oldest = self._conn.execute(
+                "SELECT COUNT(*), MIN(fetched_at) FROM keywordstool"
+            ).fetchone()
+        return {"entries": count, "max_entries": self.max_entries, "oldest_fetched_at": oldest}
@@ -0,0 +1,134 @@
+import copy
+import os
+import shutil
+import struct
+import tempfile
+import threading
+import zipfile
+from typing import Optional
+
+
+class SpooledZipWriter:
+    """
+    结果总包的流式写入：
+    - 底层是 SpooledTemporaryFile，小于 max_memory_bytes 时在内存，超过后自动落到临时文件
+    - 每个条目写完即压缩落盘，不再先在内存里攒完整个 zip
+    - writestr 带锁，多个打包线程可以同时往同一个总包里写（每个条目原子写入）
+    """
+
+    def __init__(self, max_memory_bytes: int = 64 * 1024 * 1024, spool_dir: Optional[str] = None):
+        self.max_memory_bytes = max_memory_bytes
+        self._file = tempfile.SpooledTemporaryFile(max_size=max_memory_bytes, dir=spool_dir)
+        self._zip = zipfile.ZipFile(self._file, "w", zipfile.ZIP_DEFLATED)
+        self._lock = threading.Lock()
+        self.closed = False
+
+    def writestr(self, arcname: str, data, compress_type: Optional[int] = None):
+        with self._lock:
+            self._zip.writestr(arcname, data, compress_type=compress_type)
+
+    def namelist(self):
+        with self._lock:
+            return self._zip.namelist()
+
+    def merge(self, part: "SpooledZipWriter") -> int:
+        """
+        把另一个已写完的 zip（单个产品的分包）整体并入：条目按原压缩数据直接拷贝，
+        不解压、不重新压缩。返回拷贝的条目数。
+        """
+        if not part.closed:
+            raise RuntimeError("分包尚未写完，不能合并")
+        n = 0
+        with part._lock, zipfile.ZipFile(part._file) as src:
+            for info in src.infolist():
+                part._file.seek(info.header_offset)
+                header = part._file.read(30)
+                name_len, extra_len = struct.unpack("<HH", header[26:30])
+                part._file.seek(info.header_offset + 30 + name_len + extra_len)
+                raw = part._file.read(info.compress_size)
+                with self._lock:
+                    self._write_raw(info, raw)
+                n += 1
+        return n
+
+    def _write_raw(self, info: zipfile.ZipInfo, raw: bytes):
+        # zipfile 没有公开的“写入已压缩数据”接口：手写本地文件头 + 数据，登记到中央目录（close 时统一写出）
+        zf = self._zip
+        zi = copy.copy(info)
+        zi.flag_bits &= ~0x08   # CRC / 大小已知，写在文件头里，不带 data descriptor
+        zf.fp.seek(zf.start_dir)
+        zi.header_offset = zf.fp.tell()
+        zf.fp.write(zi.FileHeader())
+        zf.fp.write(raw)
+        zf.start_dir = zf.fp.tell()
+        zf.filelist.append(zi)
+        zf.NameToInfo[zi.filename] = zi
+        zf._didModify = True
+
+    def close(self):
+        with self._lock:
+            if not self.closed:
+                self._zip.close()
+                self.closed = True
+
+    @property
+    def on_disk(self) -> bool:
+        return bool(getattr(self._file, "_rolled", False))
+
+    @property
+    def size(self) -> int:
+        with self._lock:
+            pos = self._file.tell()
+            self._file.seek(0, 2)
+            end = self._file.tell()
+            self._file.seek(pos)
+        return end
+
+    def getvalue(self) -> bytes:
+        # 仅在真正下载时读取一次（配合 st.download_button 的延迟回调）
+        if not self.closed:
+            raise RuntimeError("zip 尚未写完，不能读取")
+        with self._lock:
+            self._file.seek(0)
+            return self._file.read()
+
+    def save_to(self, path: str):
+        # 直接按块拷贝到目标文件，不在内存里整体读出
+        if not self.closed:
+            raise RuntimeError("zip 尚未写完，不能保存")
+        with self._lock, open(path, "wb") as f:
+            self._file.seek(0)
+            shutil.copyfileobj(self._file, f, 1024 * 1024)
+
+    def discard(self):
+        self.close()
+        self._file.close()
+
+
+def merge_part(target, part: SpooledZipWriter) -> int:
+    # 目标也是 zip 时原样拷贝压缩数据；写目录时逐个解压写出（图片本身已编码，不会重新编码）
+    if isinstance(target, SpooledZipWriter):
+        return target.merge(part)
+    with part._lock, zipfile.ZipFile(part._file) as src:
+        for info in src.infolist():
+            target.writestr(info.filename, src.read(info))
+        return len(src.infolist())
+
+
+class DirectoryWriter:
+    # 与 SpooledZipWriter 相同的 writestr 接口，但直接写成目录树（命令行批处理默认用这个）
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def writestr(self, arcname: str, data, compress_type: Optional[int] = None):
+        parts = [x for x in arcname.strip("/").split("/") if x not in ("", ".", "..")]
+        path = os.path.join(self.root, *parts)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        with open(path, "wb") as f:
+            f.write(data)
+
+    def close(self):
+        pass
@@ -0,0 +1,728 @@
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+import zipfile
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+import google.generativeai as genai
+import pandas as pd
+
+from gemini_api import safe_generate, stream_generate
+from gemini_cache import GeminiResponseCache
+from gemini_files import GeminiUploadManager, create_cached_context, upload_bytes
+from job_store import JobCheckpointStore
+from keyword_expand import ExpandConfig, expand_market
+from keyword_store import KeywordMarketStore
+from material_pack import PackConfig, write_feed_to_master_zip
+from naver_api import NaverClient, NaverLookup, NaverPrefetcher, fetch_naver_data
+from naver_cache import NaverKeywordCache
+from output_writer import SpooledZipWriter, merge_part
+from preprocess import UploadImageConfig, prepare_product, upload_hash
+import profiling
+from prompts import PROMPT_STEP_1, PROMPT_STEP_3
+from quota import QuotaLimiter
+from relevance import RankConfig, estimate_tokens, prune_to_budget, rank_market
+from reports import build_excel_bytes, build_html_report
+from scheduler import BatchHandle, JobQueue, PipelineEvent, StagedScheduler, StageError
+
+SUPPORTED_EXTENSIONS = (".pdf", ".png", ".jpg", ".jpeg")
+
+# 第一步 / 第三步如何共享产品文件：
+# separate = 两次独立调用，各自附带文件（原行为，也是其他模式失败时的退路）
+# chat     = 第三步以多轮对话形式接在第一步后面（带上第一步的指令与回答）
+# cached   = 文件做成 Gemini 缓存上下文，两步都只发文字指令
+CONTEXT_MODES = ("separate", "chat", "cached")
+
+
+@dataclass
+class ProductJob:
+    # 一个上传文件 = 一个产品；各阶段产出都挂在 job 上，供后续阶段和 UI 使用
+    file_name: str
+    data: bytes
+    folder_name: str = ""
+    data_hash: str = ""
+    # 实际上传给 Gemini 的内容（预处理后的拼版图 / PDF）；None = 直接上传原文件
+    upload_bytes: Optional[bytes] = None
+    upload_name: str = ""
+    # 上传去重与结果缓存用的 key：原文件哈希 + 预处理参数
+    upload_hash: str = ""
+    # 预处理阶段解码好的页面（PageStore），打包阶段切片直接复用
+    pages: Any = None
+    # 本产品独占的临时目录（解码页面落盘等），产品结束时整个删除
+    scratch_dir: str = ""
+    gen_file: Any = None
+    # 直接上传（未经 GeminiUploadManager）的云端文件归本产品所有，结束时删除
+    owns_gen_file: bool = False
+    res1_text: str = ""
+    kw_list: List[str] = field(default_factory=list)
+    df_market: Optional[pd.DataFrame] = None
+    naver_failures: Dict[str, str] = field(default_factory=dict)
+    # cached 模式下绑定缓存上下文的模型与缓存句柄；创建失败时记录原因并退回 separate
+    context_model: Any = None
+    cached_context: Any = None
+    context_error: str = ""
+    # 第一步流式输出期间投机提交的 Naver 查询（NaverPrefetcher），Naver 阶段结束后关闭
+    naver_prefetch: Any = None
+    final_df: Optional[pd.DataFrame] = None
+    res3_text: str = ""
+    # 已写入结果总包的产物路径（FEED 包 / Excel / HTML / profile.json）
+    artifacts: List[str] = field(default_factory=list)
+    # product_parts 模式下本产品的结果分包（打包完成即可单独下载）
+    part: Optional[SpooledZipWriter] = None
+    # 各阶段计时与计数（写入 profile.json，UI 画瀑布图）
+    profile: Optional[profiling.RunProfile] = None
+    # 断点续跑：本产品的断点 key、已保存的各阶段产出、本次直接从断点恢复的阶段
+    checkpoint_key: str = ""
+    checkpoint: Dict[str, Any] = field(default_factory=dict)
+    resumed: List[str] = field(default_factory=list)
+    # 打包产物的断点暂存写入器：打包阶段断点保存时才换成正式产物目录
+    staged_artifacts: Any = None
+
+    def __post_init__(self):
+        if not self.folder_name:
+            self.folder_name = os.path.splitext(self.file_name)[0]
+        if not self.data_hash:
+            self.data_hash = hashlib.sha256(self.data).hexdigest()
+        if not self.upload_hash:
+            self.upload_hash = self.data_hash
+        if self.profile is None:
+            self.profile = profiling.RunProfile(self.file_name)
+
+
+@dataclass
+class PipelineContext:
+    model: Any
+    naver_client: NaverClient
+    naver_cache: Optional[NaverKeywordCache] = None
+    force_refresh: bool = False
+    cache_ttl: Optional[float] = None
+    batch_size: int = 1
+    # 为 None 时不读也不写缓存（侧边栏关闭缓存 = 强制重新生成）
+    response_cache: Optional[GeminiResponseCache] = None
+    # 有则按文件哈希去重/复用云端文件；None 时每个产品单独上传、用完即删
+    upload_manager: Optional[GeminiUploadManager] = None
+    # 结果总包（需支持 writestr(arcname, data, compress_type=None)，可被多个打包线程同时写入）
+    output: Any = None
+    # 每个产品先写进自己的分包（job.part），打包完成后原样并入 output：
+    # 第一个产品完成即可下载，不必等整批结束；总包只需在最后 close
+    product_parts: bool = False
+    part_spool_bytes: int = 8 * 1024 * 1024
+    # FEED 喂料包：dir = 总包内的 FEED_xxx/ 文件夹；zip = 旧版嵌套的 FEED_xxx.zip
+    feed_layout: str = "dir"
+    # 第一步流式生成：边出字边解析关键词，逐词模式下提前开始查 Naver
+    stream_step1: bool = True
+    context_mode: str = "separate"
+    context_ttl: float = 1800
+    pack_cfg: PackConfig = field(default_factory=lambda: PackConfig(
+        target_w=1400,
+        max_h=1600,
+        min_h=900,
+        overlap=0.12,
+        skip_blank=True,
+        pdf_scale=2.0
+    ))
+    # 历史关键词库：每个产品的 df_market 都追加写入（None = 不记录）；category 为本批的品类标签
+    keyword_store: Optional[KeywordMarketStore] = None
+    category: str = ""
+    # 第三步 market_data 的本地相关性预筛与 token 预算
+    rank_cfg: RankConfig = field(default_factory=RankConfig)
+    # 可选的多层拓词：第一层结果里最有希望的衍生词再当 hint 查（默认关闭）
+    expand_cfg: ExpandConfig = field(default_factory=ExpandConfig)
+    # 上传前预处理：解码/渲染一次，压缩拼版后再上传，解码结果留给打包阶段切片
+    upload_cfg: UploadImageConfig = field(default_factory=UploadImageConfig)
+    # 断点续跑：每个阶段完成即保存产出；resume=False 时只写不读（强制整条重跑）
+    checkpoints: Optional[JobCheckpointStore] = None
+    resume: bool = True
+    # Gemini 生成调用的跨会话限速 / 日配额（Naver 的挂在 naver_client.quota 上）
+    gemini_quota: Optional[QuotaLimiter] = None
+    # 本次运行内跨产品合并相同的 Naver 查询；None 时按 client/cache 等字段自动创建
+    naver_lookup: Optional[NaverLookup] = None
+
+    def __post_init__(self):
+        if self.naver_lookup is None:
+            self.naver_lookup = NaverLookup(self.naver_client, self.naver_cache, self.force_refresh, self.cache_ttl)
+
+
+def _clean_keyword(kw: str) -> str:
+    clean_word = re.sub(r'[^가-힣a-zA-Z0-9\s]', '', kw).strip()
+    return re.sub(r'\s+', ' ', clean_word)
+
+
+class KeywordStreamParser:
+    """
+    第一步流式输出的增量解析：只处理完整的行，返回新出现的韩文种子词。
+    - 表头含“韩文关键词”的 Markdown 表格（Coupang / Naver / 查量种子词三张表），取该列
+    - [LXU_KEYWORDS_START] ... [LXU_KEYWORDS_END] 标记块内的逗号分隔词
+    这里只用于投机预取；最终关键词仍以 extract_keywords(完整文本) 为准。
+    """
+
+    def __init__(self):
+        self.seeds: List[str] = []
+        self._seen = set()
+        self.reset()
+
+    def reset(self):
+        # 重试时从头再来一遍流；已发现的种子词保留
+        self._buf = ""
+        self._col = None
+        self._in_block = False
+
+    def _add(self, raw: str, found: List[str]):
+        kw = _clean_keyword(raw)
+        if kw and re.search(r'[가-힣]', kw) and kw not in self._seen:
+            self._seen.add(kw)
+            self.seeds.append(kw)
+            found.append(kw)
+
+    def feed(self, delta: str) -> List[str]:
+        found: List[str] = []
+        self._buf += delta
+        *lines, self._buf = self._buf.split("\n")
+        for line in lines:
+            line = line.strip()
+            upper = line.upper()
+            if "[LXU_KEYWORDS_START]" in upper:
+                self._in_block = True
+                line = line[upper.index("[LXU_KEYWORDS_START]") + len("[LXU_KEYWORDS_START]"):]
+                upper = line.upper()
+            if self._in_block:
+                if "[LXU_KEYWORDS_END]" in upper:
+                    self._in_block = False
+                    line = line[:upper.index("[LXU_KEYWORDS_END]")]
+                for kw in re.sub(r'[，、|]', ',', line).split(','):
+                    self._add(kw, found)
+                continue
+            if not line.startswith("|"):
+                self._col = None
+                continue
+            cells = [c.strip() for c in line.strip("|").split("|")]
+            header = [i for i, c in enumerate(cells) if "韩文关键词" in c]
+            if header:
+                self._col = header[0]
+            elif self._col is not None and self._col < len(cells) and not set(line) <= set("|-: "):
+                self._add(cells[self._col], found)
+        return found
+
+
+def extract_keywords(res1_text: str) -> List[str]:
+    kw_list = []
+    match = re.search(r"\[LXU_KEYWORDS_START\](.*?)\[LXU_KEYWORDS_END\]", res1_text, re.DOTALL | re.IGNORECASE)
+    if match:
+        raw_block = match.group(1)
+        raw_block = re.sub(r'[，\n、|]', ',', raw_block)
+        for kw in raw_block.split(','):
+            clean_word = _clean_keyword(kw)
+            if clean_word and clean_word not in kw_list:
+                kw_list.append(clean_word)
+    else:
+        tail_text = res1_text[-800:]
+        tail_text = re.sub(r'[，\n、|]', ',', tail_text)
+        for kw in tail_text.split(','):
+            clean_word = _clean_keyword(kw)
+            if clean_word and clean_word not in kw_list:
+                kw_list.append(clean_word)
+        kw_list = kw_list[:25]
+    return kw_list
+
+
+def build_final_df(df_market: pd.DataFrame) -> pd.DataFrame:
+    seed_df = df_market[df_market["词组属性"] == '🎯 目标原词']
+    expanded_df = df_market[df_market["词组属性"] == '💡 衍生拓展词'].head(250)
+
+    return pd.concat([
+        seed_df.sort_values(by="月总搜索量", ascending=False),
+        expanded_df.sort_values(by="月总搜索量", ascending=False)
+    ]).drop_duplicates(subset=["Naver实际搜索词"])
+
+
+def step1_cache_key(job: ProductJob, ctx: PipelineContext) -> str:
+    return GeminiResponseCache.make_key(job.upload_hash, PROMPT_STEP_1, getattr(ctx.model, "model_name", ""))
+
+
+def upload_source(job: ProductJob):
+    # (去重 key, 上传内容, 文件名)；未做预处理时就是原文件
+    if job.upload_bytes is None:
+        return job.upload_hash, job.data, job.file_name
+    return job.upload_hash, job.upload_bytes, job.upload_name
+
+
+def prefetch_upload(job: ProductJob, ctx: PipelineContext):
+    # 预处理完立刻在后台开始上传；第一步已有缓存结果的产品先不传（第三步真正需要时再懒上传）
+    if ctx.upload_manager is None:
+        return
+    if ctx.response_cache is not None and ctx.response_cache.get(step1_cache_key(job, ctx)) is not None:
+        return
+    ctx.upload_manager.prefetch([upload_source(job)])
+
+
+def ensure_uploaded(job: ProductJob, ctx: PipelineContext):
+    if job.gen_file is not None:
+        return
+    key, data, name = upload_source(job)
+    if ctx.upload_manager is not None:
+        with profiling.span("gemini.upload_wait"):
+            job.gen_file = ctx.upload_manager.get(key, data, name)
+    else:
+        job.gen_file = upload_bytes(data, name)
+        job.owns_gen_file = True
+
+
+def ensure_context(job: ProductJob, ctx: PipelineContext):
+    # 只在第一步真正调用 Gemini 前创建：第一步命中结果缓存时，单独为第三步建缓存上下文并不划算
+    if ctx.context_mode != "cached" or job.context_model is not None or job.context_error:
+        return
+    ensure_uploaded(job, ctx)
+    try:
+        if ctx.gemini_quota is not None:
+            ctx.gemini_quota.acquire()
+        with profiling.span("gemini.context_create"):
+            job.context_model, job.cached_context = create_cached_context(ctx.model, job.gen_file, ctx.context_ttl, job.file_name)
+    except Exception as e:
+        job.context_error = f"{type(e).__name__}: {e}"
+        profiling.count("gemini.context_fallback")
+
+
+def uses_history(job: ProductJob, ctx: PipelineContext, prompt: str) -> bool:
+    # chat 模式下的第三步：接在第一步的对话后面
+    return ctx.context_mode == "chat" and prompt != PROMPT_STEP_1 and bool(job.res1_text)
+
+
+def response_cache_key(job: ProductJob, ctx: PipelineContext, prompt: str) -> str:
+    # chat 模式的第三步结果还取决于第一步的回答，key 里要带上；其余模式与原来的 key 一致
+    if uses_history(job, ctx, prompt):
+        prompt = f"{PROMPT_STEP_1}\x00{job.res1_text}\x00{prompt}"
+    return GeminiResponseCache.make_key(job.upload_hash, prompt, getattr(ctx.model, "model_name", ""))
+
+
+def build_request(job: ProductJob, ctx: PipelineContext, prompt: str):
+    # 返回 (模型, contents)；调用前文件必须已上传
+    if job.context_model is not None:
+        return job.context_model, [prompt]
+    if uses_history(job, ctx, prompt):
+        return ctx.model, [
+            {"role": "user", "parts": [job.gen_file, PROMPT_STEP_1]},
+            {"role": "model", "parts": [job.res1_text]},
+            {"role": "user", "parts": [prompt]},
+        ]
+    return ctx.model, [job.gen_file, prompt]
+
+
+def generate(job: ProductJob, ctx: PipelineContext, prompt: str) -> str:
+    # 缓存命中时连文件都不用上传；未命中才上传并真正调用 Gemini
+    key = None
+    if ctx.response_cache is not None:
+        key = response_cache_key(job, ctx, prompt)
+        cached = ctx.response_cache.get(key)
+        if cached is not None:
+            profiling.count("gemini.cache_hit")
+            return cached
+    ensure_uploaded(job, ctx)
+    if prompt == PROMPT_STEP_1:
+        ensure_context(job, ctx)
+    model, contents = build_request(job, ctx, prompt)
+    return safe_generate(model, contents, cache=ctx.response_cache, cache_key=key, quota=ctx.gemini_quota)
+
+
+def generate_step1_streaming(job: ProductJob, ctx: PipelineContext, report) -> str:
+    key = None
+    if ctx.response_cache is not None:
+        key = step1_cache_key(job, ctx)
+        cached = ctx.response_cache.get(key)
+        if cached is not None:
+            profiling.count("gemini.cache_hit")
+            return cached
+    ensure_uploaded(job, ctx)
+    ensure_context(job, ctx)
+
+    parser = KeywordStreamParser()
+    # 批量模式下投机的逐词请求会抵消合并请求的意义，只在逐词模式预取
+    if ctx.batch_size <= 1:
+        job.naver_prefetch = NaverPrefetcher(ctx.naver_lookup)
+    last_report = [0.0]
+
+    def on_chunk(delta, text):
+        new_seeds = parser.feed(delta)
+        if new_seeds and job.naver_prefetch is not None:
+            job.naver_prefetch.submit(new_seeds)
+        # 限制 UI 刷新频率，避免事件队列被逐字刷屏
+        now = time.monotonic()
+        if new_seeds or now - last_report[0] > 0.3:
+            last_report[0] = now
+            report(text=text, seeds=len(parser.seeds))
+
+    model, contents = build_request(job, ctx, PROMPT_STEP_1)
+    return stream_generate(
+        model, contents,
+        on_chunk=on_chunk, on_restart=parser.reset,
+        cache=ctx.response_cache, cache_key=key, quota=ctx.gemini_quota
+    )
+
+
+# ==========================================
+# 各阶段：fn(job, ctx, report)；失败抛 StageError
+# ==========================================
+
+def run_prepare(job: ProductJob, ctx: PipelineContext, report):
+    if ctx.upload_cfg.enabled:
+        job.upload_hash = upload_hash(job.data_hash, ctx.upload_cfg, ctx.pack_cfg.pdf_scale)
+        try:
+            prepared = prepare_product(job.data, job.file_name, ctx.pack_cfg, ctx.upload_cfg, scratch_dir=job.scratch_dir or None)
+        except Exception:
+            # 预处理失败（如文件损坏）不在这里判死：退回上传原文件，打包阶段照旧自行解码
+            profiling.count("prepare.errors")
+            job.upload_hash = job.data_hash
+        else:
+            job.upload_bytes, job.upload_name, job.pages = prepared.upload_bytes, prepared.upload_name, prepared.pages
+            report(bytes_in=len(job.data), bytes_out=len(job.upload_bytes), sheets=prepared.sheets)
+    # 第三步已有断点时 Gemini 用不到文件，不必提前上传
+    if "step3" not in job.checkpoint:
+        prefetch_upload(job, ctx)
+
+
+def run_step1(job: ProductJob, ctx: PipelineContext, report):
+    if ctx.stream_step1:
+        job.res1_text = generate_step1_streaming(job, ctx, report)
+    else:
+        job.res1_text = generate(job, ctx, PROMPT_STEP_1)
+    if job.res1_text.startswith("❌"):
+        raise StageError("❌ 第一步 AI 生成彻底失败", job.res1_text)
+
+    job.kw_list = extract_keywords(job.res1_text)
+    if not job.kw_list:
+        raise StageError("❌ 第一步提取失败，未能找到韩文")
+
+
+def run_naver(job: ProductJob, ctx: PipelineContext, report):
+    try:
+        job.df_market, job.naver_failures = fetch_naver_data(
+            job.kw_list,
+            client=ctx.naver_client,
+            cache=ctx.naver_cache,
+            force_refresh=ctx.force_refresh,
+            cache_ttl=ctx.cache_ttl,
+            batch_size=ctx.batch_size,
+            on_progress=lambda done, total, batch, limit: report(done=done, total=total, batch=batch, limit=limit),
+            prefetched=job.naver_prefetch,
+            lookup=ctx.naver_lookup,
+        )
+    finally:
+        # 最终关键词里没有的投机查询不再需要
+        if job.naver_prefetch is not None:
+            job.naver_prefetch.close()
+    if job.df_market.empty:
+        raise StageError("❌ 第二步失败，Naver 未返回有效数据")
+
+    if ctx.expand_cfg.enabled:
+        job.df_market = expand_market(
+            job.df_market,
+            job.kw_list,
+            fetch=ctx.naver_lookup.fetch,
+            cfg=ctx.expand_cfg,
+            rank_cfg=ctx.rank_cfg,
+            max_workers=ctx.naver_client.limiter.max_limit,
+            on_progress=lambda hop, done, total, batch: report(hop=hop, done=done, total=total, batch=batch, limit=ctx.naver_client.limiter.limit),
+        )
+
+    if ctx.keyword_store is not None:
+        # 历史库写入失败不影响本产品继续往下走
+        try:
+            with profiling.span("store.record"):
+                ctx.keyword_store.record(job.df_market, product=job.folder_name, category=ctx.category)
+        except Exception:
+            profiling.count("store.errors")
+
+
+def run_step3(job: ProductJob, ctx: PipelineContext, report):
+    # 第三步失败不中断：错误文本照常写进报告，继续打包
+    try:
+        job.final_df = build_final_df(job.df_market)
+        market_data = job.final_df.to_csv(index=False)
+        if ctx.rank_cfg.enabled:
+            # 🎯 本地打分 + 按预算截断 + 紧凑编码；final_df 换成实际喂给 AI 的那部分（带相关性列）
+            tokens_before, rows_in = estimate_tokens(market_data), len(job.df_market)
+            with profiling.span("step3.rank"):
+                ranked = rank_market(job.df_market, job.kw_list, ctx.rank_cfg)
+                job.final_df, market_data = prune_to_budget(ranked, job.kw_list, ctx.rank_cfg.token_budget)
+            tokens_after = estimate_tokens(market_data)
+            profiling.count("step3.rows_in", rows_in)
+            profiling.count("step3.rows_kept", len(job.final_df))
+            profiling.count("step3.tokens_est_before", tokens_before)
+            profiling.count("step3.tokens_est", tokens_after)
+            report(rows_in=rows_in, rows_kept=len(job.final_df), tokens_before=tokens_before, tokens=tokens_after)
+        final_prompt = PROMPT_STEP_3.format(market_data=market_data)
+        job.res3_text = generate(job, ctx, final_prompt)
+    except Exception as e:
+        job.res3_text = f"❌ 第三步系统逻辑错误: {e}"
+
+
+def _package_target(ctx: PipelineContext):
+    # 打包产物写到哪：分包模式写进新的分包，否则直接写结果总包
+    return SpooledZipWriter(max_memory_bytes=ctx.part_spool_bytes) if ctx.product_parts else ctx.output
+
+
+def _deliver_part(job: ProductJob, ctx: PipelineContext, part):
+    # 分包写完即关闭（可供下载），再按原压缩数据并入结果总包
+    if part is ctx.output:
+        return
+    part.close()
+    with profiling.span("zip.merge") as attrs:
+        attrs["entries"] = merge_part(ctx.output, part)
+    job.part = part
+
+
+def run_package(job: ProductJob, ctx: PipelineContext, report):
+    folder = job.folder_name
+    part = _package_target(ctx)
+    # 有断点库时产物同时另存一份，之后重跑可直接拷回结果总包
+    output = part if ctx.checkpoints is None else ctx.checkpoints.artifact_writer(job.checkpoint_key, part)
+    feed_args = dict(
+        folder_name=folder,
+        uploaded_filename=job.file_name,
+        uploaded_bytes=job.data,
+        cfg=ctx.pack_cfg,
+        kw_list=job.kw_list,
+        df_market=job.df_market,
+        final_df=job.final_df,
+        res1_text=job.res1_text,
+        res3_text=job.res3_text,
+        pages=job.pages,
+    )
+    try:
+        with profiling.span("reports.build"):
+            excel_data = build_excel_bytes(job.res1_text, job.res3_text)
+            html_content = build_html_report(folder, job.res1_text, job.res3_text)
+
+        if ctx.feed_layout == "dir":
+            # ✅ 直接流式写进总包的 FEED_{folder}/ 目录，不再 zip 套 zip
+            feed_path = f"{folder}/FEED_{folder}/"
+            with profiling.span("pack.feed"):
+                write_feed_to_master_zip(master_zip=output, out_root=feed_path, **feed_args)
+        else:
+            feed_path = f"{folder}/FEED_{folder}.zip"
+            feed_buffer = io.BytesIO()
+            with profiling.span("pack.feed"), zipfile.ZipFile(feed_buffer, 'w', zipfile.ZIP_DEFLATED) as feed_zip:
+                write_feed_to_master_zip(master_zip=feed_zip, out_root="", **feed_args)
+                # 嵌套 zip 关闭后无法追加，这里写入的是截至此刻的画像
+                feed_zip.writestr("profile.json", profile_bytes(job))
+            # 内层 zip 已压缩过，外层直接存储
+            output.writestr(feed_path, feed_buffer.getvalue(), compress_type=zipfile.ZIP_STORED)
+            del feed_buffer
+
+        excel_path = f"{folder}/LxU_数据表_{folder}.xlsx"
+        html_path = f"{folder}/LxU_视觉报告_{folder}.html"
+        with profiling.span("zip.reports"):
+            output.writestr(excel_path, excel_data)
+            output.writestr(html_path, html_content.encode('utf-8'))
+
+        # 最后写画像：总包里一份，dir 布局的 FEED 目录里再放一份
+        profile_path = f"{folder}/profile.json"
+        data = profile_bytes(job)
+        output.writestr(profile_path, data)
+        if ctx.feed_layout == "dir":
+            output.writestr(f"{feed_path}profile.json", data)
+    except Exception as e:
+        if part is not ctx.output:
+            part.discard()
+        if output is not part:
+            ctx.checkpoints.discard_artifacts(output)
+        raise StageError(f"处理 {job.file_name} 构建导出文件时发生错误: {e}")
+
+    _deliver_part(job, ctx, part)
+    job.artifacts = [feed_path, excel_path, html_path, profile_path]
+    if output is not part:
+        job.staged_artifacts = output
+
+
+def checkpoint_key(job: ProductJob, ctx: PipelineContext) -> str:
+    # 影响产出的设置都进 key：改了模型 / 指令 / 拓词 / 预筛 / 切片参数就不会误用旧断点
+    settings = {
+        "model": getattr(ctx.model, "model_name", ""),
+        "prompts": hashlib.sha256(f"{PROMPT_STEP_1}\x00{PROMPT_STEP_3}".encode("utf-8")).hexdigest(),
+        "batch_size": ctx.batch_size,
+        "context_mode": ctx.context_mode,
+        "feed_layout": ctx.feed_layout,
+        "rank": asdict(ctx.rank_cfg),
+        "pack": asdict(ctx.pack_cfg),
+        "expand": asdict(ctx.expand_cfg),
+        "upload": asdict(ctx.upload_cfg),
+    }
+    return JobCheckpointStore.make_key(job.data_hash, job.file_name, settings)
+
+
+def _df_to_json(df: Optional[pd.DataFrame]) -> Optional[str]:
+    return None if df is None else df.to_json(orient="split", force_ascii=False)
+
+
+def _df_from_json(text: Optional[str]) -> Optional[pd.DataFrame]:
+    # dtype=False：韩文搜索词里的纯数字 / 日期样式不被自动转换类型
+    return None if text is None else pd.read_json(io.StringIO(text), orient="split", dtype=False, convert_dates=False)
+
+
+def checkpoint_payload(job: ProductJob, stage: str) -> Optional[Dict[str, Any]]:
+    if stage == "step1":
+        return {"res1_text": job.res1_text, "kw_list": job.kw_list}
+    if stage == "naver":
+        return {"df_market": _df_to_json(job.df_market), "naver_failures": job.naver_failures}
+    if stage == "step3":
+        # 第三步失败不中断流程，但失败文本不存断点，下次重跑时重新生成
+        if job.res3_text.startswith("❌"):
+            return None
+        return {"res3_text": job.res3_text, "final_df": _df_to_json(job.final_df)}
+    if stage == "package":
+        return {"artifacts": job.artifacts}
+    return None
+
+
+def restore_stage(job: ProductJob, ctx: PipelineContext, stage: str) -> bool:
+    # 从断点恢复该阶段的产出；返回 False 表示没有可用断点，需要正常执行
+    if stage == "prepare":
+        # 打包已完成的产品不再需要解码页面和上传文件
+        return "package" in job.checkpoint
+    payload = job.checkpoint.get(stage)
+    if payload is None:
+        return False
+    if stage == "step1":
+        job.res1_text, job.kw_list = payload["res1_text"], payload["kw_list"]
+    elif stage == "naver":
+        job.df_market, job.naver_failures = _df_from_json(payload["df_market"]), payload["naver_failures"]
+    elif stage == "step3":
+        job.res3_text, job.final_df = payload["res3_text"], _df_from_json(payload["final_df"])
+    elif stage == "package":
+        part = _package_target(ctx)
+        with profiling.span("checkpoint.copy") as attrs:
+            attrs["files"] = ctx.checkpoints.copy_artifacts(job.checkpoint_key, part)
+        _deliver_part(job, ctx, part)
+        job.artifacts = payload["artifacts"]
+    return True
+
+
+def profile_bytes(job: ProductJob) -> bytes:
+    return json.dumps(job.profile.to_dict(), ensure_ascii=False, indent=2).encode("utf-8")
+
+
+def cleanup_job(job: ProductJob):
+    # 无论成功失败都清理本产品独占的云端文件（UploadManager 管理的文件留给后续复用）
+    if job.cached_context is not None:
+        try:
+            job.cached_context.delete()
+        except Exception:
+            pass
+    if job.naver_prefetch is not None:
+        job.naver_prefetch.close()
+    if job.pages is not None:
+        job.pages.close()
+    if job.scratch_dir:
+        shutil.rmtree(job.scratch_dir, ignore_errors=True)
+    if job.staged_artifacts is not None:
+        # 打包完成但断点没保存上（如被取消）：暂存的产物不再有用
+        shutil.rmtree(job.staged_artifacts.staging, ignore_errors=True)
+    if job.gen_file is not None and job.owns_gen_file:
+        try:
+            genai.delete_file(job.gen_file.name)
+        except Exception:
+            pass
+
+
+def stage_workers(gemini_workers: int = 2, naver_workers: int = 1, package_workers: int = 1, prepare_workers: int = 1):
+    # Naver 阶段内部已有并发（AIMD），这里只限制同时拓词的产品数
+    return [
+        ("prepare", prepare_workers),
+        ("step1", gemini_workers),
+        ("naver", naver_workers),
+        ("step3", gemini_workers),
+        ("package", package_workers),
+    ]
+
+
+def build_stages(ctx: PipelineContext, gemini_workers: int = 2, naver_workers: int = 1, package_workers: int = 1, prepare_workers: int = 1):
+    # 每个阶段在工作线程里激活本产品的 profile，并以阶段名作为顶层 span
+    # 有断点的阶段直接恢复产出；正常跑完的阶段立即保存断点
+    def bind(name, fn):
+        def run(job, report):
+            with profiling.activate(job.profile), profiling.span(name) as attrs:
+                if restore_stage(job, ctx, name):
+                    attrs["resumed"] = True
+                    job.resumed.append(name)
+                    profiling.count("checkpoint.resumed")
+                    return
+                fn(job, ctx, report)
+                payload = checkpoint_payload(job, name)
+                if ctx.checkpoints is not None and payload is not None:
+                    staged, job.staged_artifacts = job.staged_artifacts, None
+                    ctx.checkpoints.save(job.checkpoint_key, name, payload, artifacts=staged)
+        return run
+
+    fns = {"prepare": run_prepare, "step1": run_step1, "naver": run_naver, "step3": run_step3, "package": run_package}
+    return [
+        (name, bind(name, fns[name]), workers)
+        for name, workers in stage_workers(gemini_workers, naver_workers, package_workers, prepare_workers)
+    ]
+
+
+def load_jobs(input_dir: str) -> List[ProductJob]:
+    # 读取目录下所有详情页文件（按文件名排序，保证批次顺序稳定）
+    jobs = []
+    for name in sorted(os.listdir(input_dir)):
+        path = os.path.join(input_dir, name)
+        if os.path.isfile(path) and name.lower().endswith(SUPPORTED_EXTENSIONS):
+            with open(path, "rb") as f:
+                jobs.append(ProductJob(file_name=name, data=f.read()))
+    return jobs
+
+
+def setup_jobs(jobs: List[ProductJob], ctx: PipelineContext):
+    # 每个产品一个独立临时目录（多个会话/批次同时跑互不干扰），并载入已有断点
+    for job in jobs:
+        if not job.scratch_dir:
+            job.scratch_dir = tempfile.mkdtemp(prefix="lxu_job_")
+        if ctx.checkpoints is not None:
+            job.checkpoint_key = checkpoint_key(job, ctx)
+            if ctx.resume:
+                job.checkpoint = ctx.checkpoints.load(job.checkpoint_key)
+
+
+def submit_batch(jobs: List[ProductJob], ctx: PipelineContext, job_queue: JobQueue, session: str = "") -> BatchHandle:
+    """
+    提交到进程级作业队列后立即返回（Streamlit 用）：并发由队列全局控制，进度用 handle.poll() 取回。
+    """
+    setup_jobs(jobs, ctx)
+    return job_queue.submit(jobs, build_stages(ctx), session=session, on_finish=cleanup_job)
+
+
+def run_batch(
+    jobs: List[ProductJob],
+    ctx: PipelineContext,
+    on_event: Optional[Callable[[PipelineEvent], None]] = None,
+    gemini_workers: int = 2,
+    naver_workers: int = 1,
+    package_workers: int = 1,
+    prepare_workers: int = 1,
+) -> Dict[str, Optional[str]]:
+    """
+    与 UI 无关的整批执行入口（Streamlit 与 cli.py 共用）。
+    on_event 在调用线程中逐个收到调度事件；返回 {文件名: None(成功) / 失败原因}。
+    """
+    results: Dict[str, Optional[str]] = {job.file_name: None for job in jobs}
+    setup_jobs(jobs, ctx)
+    scheduler = StagedScheduler(
+        build_stages(
+            ctx,
+            gemini_workers=gemini_workers,
+            naver_workers=naver_workers,
+            package_workers=package_workers,
+            prepare_workers=prepare_workers,
+        ),
+        on_finish=cleanup_job
+    )
+    for event in scheduler.run(jobs):
+        if event.kind == "job_failed":
+            results[event.job.file_name] = event.data.get("label", "失败")
+        if on_event is not None:
+            on_event(event)
+    return results
@@ -0,0 +1,256 @@
+import hashlib
+import io
+import json
+import math
+import tempfile
+import threading
+from dataclasses import asdict, dataclass
+from typing import Any, Iterator, List, Optional, Tuple
+
+from PIL import Image
+import pypdfium2 as pdfium
+
+from material_pack import PackConfig, encode_image, iter_image_pages, iter_pdf_pages, parse_page_range, resize_to_width
+import profiling
+
+
+@dataclass
+class UploadImageConfig:
+    enabled: bool = True
+    sheet_px: int = 3072          # 每张上传图的长宽上限（Gemini 处理图片 / PDF 页时也会缩到这个尺寸以内）
+    column_w: int = 1024          # 拼版每栏宽度上限；原图更窄时保持原宽，不放大
+    min_column_w: int = 640       # 为了压进 max_sheets 张最多缩到多窄；再窄文字看不清，宁可多出几张
+    max_sheets: int = 4
+    codec: str = "jpeg"           # 单张输出时的格式：jpeg / webp；多张时统一 JPEG 装进一个 PDF
+    quality: int = 82
+    min_quality: int = 60
+    max_bytes: int = 4 * 1024 * 1024   # 超出则逐级降低质量重新编码
+
+
+def upload_hash(data_hash: str, cfg: UploadImageConfig, pdf_scale: float) -> str:
+    # 上传内容由 原文件 + 预处理参数 决定；不必真的跑一遍预处理就能算出结果缓存 / 上传去重用的 key
+    sig = json.dumps(dict(asdict(cfg), pdf_scale=pdf_scale), sort_keys=True)
+    return hashlib.sha256(f"{data_hash}\x00{sig}".encode("utf-8")).hexdigest()
+
+
+def pdf_page_sizes(pdf_bytes: bytes, scale: float) -> List[Tuple[float, float]]:
+    # 只读页面尺寸（pt × scale = 渲染后的像素），不渲染
+    pdf = pdfium.PdfDocument(pdf_bytes)
+    try:
+        sizes = []
+        for i in range(len(pdf)):
+            page = pdf[i]
+            try:
+                w, h = page.get_size()
+            finally:
+                page.close()
+            sizes.append((w * scale, h * scale))
+        return sizes
+    finally:
+        pdf.close()
+
+
+def plan_column_width(page_sizes: List[Tuple[float, float]], cfg: UploadImageConfig) -> Tuple[int, int]:
+    """
+    所有页按同一栏宽首尾相接成一条长带，再按 sheet_px 折成多栏、多张。
+    返回 (栏宽, 预计张数)：栏宽从 column_w 起逐步收窄，直到张数 ≤ max_sheets 或到 min_column_w。
+    """
+    widest = max(w for w, _ in page_sizes)
+    col_w = int(min(cfg.column_w, cfg.sheet_px, widest))
+    while True:
+        strip_h = sum(h * col_w / w for w, h in page_sizes)
+        cols = max(1, cfg.sheet_px // col_w)
+        sheets = max(1, math.ceil(strip_h / (cols * cfg.sheet_px)))
+        if sheets <= cfg.max_sheets or col_w <= cfg.min_column_w:
+            return col_w, sheets
+        col_w = max(cfg.min_column_w, int(col_w * 0.85))
+
+
+class _SheetPacker:
+    # 逐页往画布里填：一栏填满 sheet_px 高换下一栏，栏数用完就编码成一张并释放画布（同一时刻只持有一张画布）
+    def __init__(self, col_w: int, cfg: UploadImageConfig, codec: str):
+        self.col_w = col_w
+        self.cfg = cfg
+        self.codec = codec
+        self.cols = max(1, cfg.sheet_px // col_w)
+        self.sheets: List[Tuple[bytes, Tuple[int, int]]] = []
+        self._canvas: Optional[Image.Image] = None
+        self._col = 0
+        self._y = 0
+
+    def add(self, im: Image.Image):
+        y = 0
+        while y < im.height:
+            if self._canvas is None:
+                self._canvas = Image.new("RGB", (self.cols * self.col_w, self.cfg.sheet_px), "white")
+                self._col, self._y = 0, 0
+            take = min(im.height - y, self.cfg.sheet_px - self._y)
+            self._canvas.paste(im.crop((0, y, self.col_w, y + take)), (self._col * self.col_w, self._y))
+            y += take
+            self._y += take
+            if self._y >= self.cfg.sheet_px:
+                self._col, self._y = self._col + 1, 0
+                if self._col >= self.cols:
+                    self._flush()
+
+    def _flush(self):
+        if self._canvas is None:
+            return
+        # 最后一张没填满：裁掉空栏和第一栏以下的空白
+        used_cols = self._col + (1 if self._y > 0 else 0)
+        used_h = self.cfg.sheet_px if self._col > 0 else self._y
+        sheet = self._canvas.crop((0, 0, used_cols * self.col_w, used_h))
+        self._canvas = None
+        with profiling.timed("prepare.encode"):
+            self.sheets.append((encode_image(sheet, self.codec, self.cfg.quality), sheet.size))
+
+    def close(self) -> List[Tuple[bytes, Tuple[int, int]]]:
+        self._flush()
+        return self.sheets
+
+
+def jpegs_to_pdf(sheets: List[Tuple[bytes, Tuple[int, int]]]) -> bytes:
+    # 把已编码好的 JPEG 原样装进 PDF（每张一页，DCTDecode），不解码、不二次压缩
+    objs: List[bytes] = [b"", b""]   # 1 = Catalog, 2 = Pages，最后回填
+    kids = []
+    for data, (w, h) in sheets:
+        img_id, content_id, page_id = len(objs) + 1, len(objs) + 2, len(objs) + 3
+        content = f"q {w} 0 0 {h} 0 0 cm /Im0 Do Q".encode("ascii")
+        objs.append(
+            f"<< /Type /XObject /Subtype /Image /Width {w} /Height {h} /ColorSpace /DeviceRGB "
+            f"/BitsPerComponent 8 /Filter /DCTDecode /Length {len(data)} >>\nstream\n".encode("ascii") + data + b"\nendstream"
+        )
+        objs.append(f"<< /Length {len(content)} >>\nstream\n".encode("ascii") + content + b"\nendstream")
+        objs.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {w} {h}] "
+            f"/Resources << /XObject << /Im0 {img_id} 0 R >> >> /Contents {content_id} 0 R >>".encode("ascii")
+        )
+        kids.append(f"{page_id} 0 R")
+    objs[0] = b"<< /Type /Catalog /Pages 2 0 R >>"
+    objs[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>".encode("ascii")
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for i, body in enumerate(objs, start=1):
+        offsets.append(out.tell())
+        out.write(f"{i} 0 obj\n".encode("ascii") + body + b"\nendobj\n")
+    xref = out.tell()
+    out.write(f"xref\n0 {len(objs) + 1}\n0000000000 65535 f \n".encode("ascii"))
+    for off in offsets:
+        out.write(f"{off:010d} 00000 n \n".encode("ascii"))
+    out.write(f"trailer\n<< /Size {len(objs) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("ascii"))
+    return out.getvalue()
+
+
+class PageStore:
+    """
+    预处理阶段解码好的页面（已缩放到切片宽度），原始像素顺序写入临时文件（小文件留在内存）。
+    打包阶段按页读回直接切片，不再重复渲染 PDF / 解码图片；迭代时同一时刻只持有一页。
+    """
+
+    def __init__(self, max_memory_bytes: int = 32 * 1024 * 1024, scratch_dir: Optional[str] = None):
+        self._file = tempfile.SpooledTemporaryFile(max_size=max_memory_bytes, dir=scratch_dir)
+        self._index: List[Tuple[Any, str, Tuple[int, int], int, int]] = []
+        self._lock = threading.Lock()
+
+    def put(self, page: Any, im: Image.Image):
+        raw = im.tobytes()
+        with self._lock:
+            self._file.seek(0, io.SEEK_END)
+            offset = self._file.tell()
+            self._file.write(raw)
+            self._index.append((page, im.mode, im.size, offset, len(raw)))
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __iter__(self) -> Iterator[Tuple[Any, Image.Image]]:
+        for page, mode, size, offset, length in list(self._index):
+            with self._lock:
+                self._file.seek(offset)
+                raw = self._file.read(length)
+            yield page, Image.frombytes(mode, size, raw)
+
+    def close(self):
+        self._file.close()
+
+
+@dataclass
+class PreparedProduct:
+    upload_bytes: bytes
+    upload_name: str
+    pages: PageStore
+    sheets: int
+    column_w: int
+
+
+def _fit_budget(sheets: List[Tuple[bytes, Tuple[int, int]]], codec: str, cfg: UploadImageConfig):
+    # 总字节超出 max_bytes 时逐级降质量（解码已编码的拼版图再编码，只在超限时发生）
+    quality = cfg.quality
+    while sum(len(b) for b, _ in sheets) > cfg.max_bytes and quality - 10 >= cfg.min_quality:
+        quality -= 10
+        profiling.count("prepare.requality")
+        sheets = [(encode_image(Image.open(io.BytesIO(b)).convert("RGB"), codec, quality), size) for b, size in sheets]
+    return sheets
+
+
+def prepare_product(
+    data: bytes, file_name: str, pack_cfg: PackConfig, cfg: UploadImageConfig, scratch_dir: Optional[str] = None
+) -> PreparedProduct:
+    """
+    每个产品只解码 / 渲染一次，同时产出：
+    - 给 Gemini 的上传文件：所有页缩到统一栏宽后拼版成至多 max_sheets 张（长截图折成多栏），
+      一张时直接是 JPEG/WebP，多张时装进一个 PDF
+    - 给打包阶段切片用的页面（PageStore，已按 page_range 过滤并缩放到 target_w）
+    """
+    stem = file_name.rsplit(".", 1)[0]
+    is_pdf = file_name.lower().endswith(".pdf")
+    store = PageStore(scratch_dir=scratch_dir)
+    try:
+        if is_pdf:
+            sizes = pdf_page_sizes(data, pack_cfg.pdf_scale)
+            keep = set(parse_page_range(pack_cfg.page_range, len(sizes)))
+            pages = iter_pdf_pages(data, scale=pack_cfg.pdf_scale)
+        else:
+            sizes, keep = None, None
+            pages = iter_image_pages(data)
+
+        packer = None
+        for pi, pim in pages:
+            if packer is None:
+                col_w, expected = plan_column_width(sizes or [pim.size], cfg)
+                # PDF 容器里只能放 JPEG；预计只有一张时才用配置的格式
+                packer = _SheetPacker(col_w, cfg, cfg.codec if expected == 1 else "jpeg")
+            with profiling.timed("prepare.sheet"):
+                packer.add(resize_to_width(pim, packer.col_w))
+            if keep is None or pi in keep:
+                with profiling.timed("prepare.store"):
+                    store.put(pi, resize_to_width(pim, pack_cfg.target_w))
+            del pim
+        if packer is None:
+            raise ValueError("文件中没有可渲染的页面")
+
+        sheets = packer.close()
+        codec = packer.codec if len(sheets) == 1 else "jpeg"
+        if codec != packer.codec:
+            sheets = [(encode_image(Image.open(io.BytesIO(b)).convert("RGB"), "jpeg", cfg.quality), size) for b, size in sheets]
+        sheets = _fit_budget(sheets, codec, cfg)
+        if len(sheets) == 1:
+            upload, name = sheets[0][0], f"{stem}.{'webp' if codec == 'webp' else 'jpg'}"
+        else:
+            upload, name = jpegs_to_pdf(sheets), f"{stem}.pdf"
+        # 图片输入（单张或折成多张 PDF 都算）重新编码后没有变小、原图又在上传字节上限内：直接传原图。
+        # 长 PNG 截图这类本身压缩得很好的图，拼版成 JPEG / PDF 反而会变大
+        if not is_pdf and len(upload) >= len(data) and len(data) <= cfg.max_bytes:
+            with profiling.span("prepare.keep_original", reason="reencode_not_smaller", reencoded_bytes=len(upload), original_bytes=len(data)):
+                profiling.count("prepare.kept_original")
+            upload, name = data, file_name
+    except Exception:
+        store.close()
+        raise
+
+    profiling.count("prepare.bytes_in", len(data))
+    profiling.count("prepare.bytes_out", len(upload))
+    profiling.count("prepare.sheets", len(sheets))
+    return PreparedProduct(upload_bytes=upload, upload_name=name, pages=store, sheets=len(sheets), column_w=packer.col_w)
@@ -0,0 +1,145 @@
+import contextlib
+import functools
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+# 当前线程正在记录的 RunProfile（未激活时所有埋点都是空操作，开销可忽略）
+_local = threading.local()
+
+
+class RunProfile:
+    """
+    单个产品的运行画像：
+    - span：嵌套计时区间（阶段 -> 上传/轮询/生成/单次 Naver 请求/逐页渲染 ...），按线程维护父子关系
+    - counter：计数与累计值（重试次数、HTTP 状态码分布、编码字节数、累计耗时 *_s ...）
+    多个线程可同时写入同一个 RunProfile。
+    """
+
+    def __init__(self, name: str = ""):
+        self.name = name
+        self.started_at = time.time()
+        self._t0 = time.perf_counter()
+        self._lock = threading.Lock()
+        self._spans: List[Dict[str, Any]] = []
+        self._counters: Dict[str, float] = defaultdict(float)
+        self._stacks = threading.local()
+
+    def _stack(self) -> List[int]:
+        stack = getattr(self._stacks, "ids", None)
+        if stack is None:
+            stack = self._stacks.ids = []
+        return stack
+
+    @contextlib.contextmanager
+    def span(self, name: str, parent: Optional[int] = None, **attrs):
+        stack = self._stack()
+        if parent is None and stack:
+            parent = stack[-1]
+        start = time.perf_counter() - self._t0
+        with self._lock:
+            sid = len(self._spans)
+            self._spans.append({
+                "id": sid,
+                "parent": parent,
+                "name": name,
+                "thread": threading.current_thread().name,
+                "start": start,
+                "end": None,
+                "attrs": attrs,
+            })
+        stack.append(sid)
+        try:
+            yield self._spans[sid]["attrs"]
+        finally:
+            stack.pop()
+            self._spans[sid]["end"] = time.perf_counter() - self._t0
+
+    def count(self, key: str, n: float = 1):
+        with self._lock:
+            self._counters[key] += n
+
+    def current_span(self) -> Optional[int]:
+        stack = self._stack()
+        return stack[-1] if stack else None
+
+    def to_dict(self) -> Dict[str, Any]:
+        now = time.perf_counter() - self._t0
+        with self._lock:
+            spans = [
+                dict(s, start=round(s["start"], 4), end=round(s["end"] if s["end"] is not None else now, 4), open=s["end"] is None)
+                for s in self._spans
+            ]
+            counters = {k: (round(v, 4) if isinstance(v, float) and not v.is_integer() else int(v)) for k, v in sorted(self._counters.items())}
+        stages = {s["name"]: round(s["end"] - s["start"], 4) for s in spans if s["parent"] is None}
+        return {
+            "product": self.name,
+            "started_at": self.started_at,
+            "wall_s": round(max([s["end"] for s in spans] or [0.0]), 4),
+            "stages_s": stages,
+            "counters": counters,
+            "spans": spans,
+        }
+
+
+def current() -> Optional[RunProfile]:
+    return getattr(_local, "profile", None)
+
+
+@contextlib.contextmanager
+def activate(profile: Optional[RunProfile], parent: Optional[int] = None):
+    # 在当前线程激活 profile；parent 用于把其他线程里的 span 挂到发起方的 span 下面
+    prev = getattr(_local, "profile", None)
+    prev_parent = getattr(_local, "parent", None)
+    _local.profile, _local.parent = profile, parent
+    try:
+        yield profile
+    finally:
+        _local.profile, _local.parent = prev, prev_parent
+
+
+@contextlib.contextmanager
+def span(name: str, **attrs):
+    profile = current()
+    if profile is None:
+        yield attrs
+        return
+    parent = None if profile.current_span() is not None else getattr(_local, "parent", None)
+    with profile.span(name, parent=parent, **attrs) as a:
+        yield a
+
+
+def count(key: str, n: float = 1):
+    profile = current()
+    if profile is not None:
+        profile.count(key, n)
+
+
+@contextlib.contextmanager
+def timed(key: str):
+    # 只累计耗时到计数器 {key}_s，不单独生成 span（用于每个切片这类高频小操作）
+    profile = current()
+    if profile is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.count(f"{key}_s", time.perf_counter() - t0)
+        profile.count(f"{key}_n", 1)
+
+
+def bind(fn):
+    # 提交到其他线程池的函数用它包一层，继承调用方的 profile 与当前 span
+    profile = current()
+    if profile is None:
+        return fn
+    parent = profile.current_span()
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with activate(profile, parent):
+            return fn(*args, **kwargs)
+    return wrapper
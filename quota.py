@@ -0,0 +1,165 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import profiling
+
+
+class QuotaExhausted(RuntimeError):
+    pass
+
+
+class TokenBucket:
+    """
+    令牌桶（预约式）：每次调用预约一个令牌，令牌不足时返回需要等待的秒数。
+    预约按到达顺序排队，多个线程同时等待时先到先得，不会有人一直抢不到。
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self._tokens = self.burst
+        self._stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._stamp) * self.rate)
+            self._stamp = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+
+def _today() -> str:
+    return time.strftime("%Y-%m-%d")
+
+
+def _seconds_until_tomorrow() -> float:
+    now = time.localtime()
+    return 86400 - (now.tm_hour * 3600 + now.tm_min * 60 + now.tm_sec)
+
+
+class QuotaLimiter:
+    """
+    单个凭据的调用闸门：先占日配额（本地 SQLite 计数，跨重启保留），再按令牌桶限速。
+    配额用完时排队等到次日（或 max_wait 秒后抛 QuotaExhausted），不直接报错。
+    """
+
+    def __init__(self, governor: "QuotaGovernor", kind: str, key: str, rate: float, burst: float, daily_limit: int):
+        self.governor = governor
+        self.kind = kind
+        self.key = key
+        self.bucket = TokenBucket(rate, burst)
+        self.daily_limit = daily_limit
+        self._waiting = 0
+        self._lock = threading.Lock()
+
+    def _set_waiting(self, delta: int):
+        with self._lock:
+            self._waiting += delta
+
+    def acquire(self, max_wait: Optional[float] = None):
+        deadline = None if max_wait is None else time.monotonic() + max_wait
+        if not self.governor._consume(self.key, self.daily_limit):
+            profiling.count(f"quota.{self.kind}.exhausted")
+            self._set_waiting(1)
+            try:
+                with profiling.timed(f"quota.{self.kind}.daily_wait"):
+                    while not self.governor._consume(self.key, self.daily_limit):
+                        if deadline is not None and time.monotonic() >= deadline:
+                            raise QuotaExhausted(f"{self.kind} 今日配额 {self.daily_limit} 次已用完")
+                        time.sleep(min(30.0, _seconds_until_tomorrow() + 1))
+            finally:
+                self._set_waiting(-1)
+
+        delay = self.bucket.reserve()
+        if delay > 0:
+            self._set_waiting(1)
+            try:
+                with profiling.timed(f"quota.{self.kind}.rate_wait"):
+                    time.sleep(delay)
+            finally:
+                self._set_waiting(-1)
+
+    def usage(self) -> Dict[str, Any]:
+        with self._lock:
+            waiting = self._waiting
+        return {
+            "kind": self.kind,
+            "today": self.governor.used(self.key),
+            "daily_limit": self.daily_limit,
+            "rate": self.bucket.rate,
+            "waiting": waiting,
+        }
+
+
+class QuotaGovernor:
+    """
+    进程级 API 配额管理（Streamlit 里用 st.cache_resource 共享）：
+    - 按 (接口类型, 凭据) 各一个 QuotaLimiter，同一个 API Key / CUSTOMER_ID 在所有会话间共用一个令牌桶
+    - 每日调用次数写入本地 SQLite（凭据只存哈希），重启后当天的计数仍然有效
+    - daily_limit <= 0 表示不限次数，只计数
+    """
+
+    def __init__(self, path: str):
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._limiters: Dict[str, QuotaLimiter] = {}
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS usage (
+                key TEXT NOT NULL,
+                day TEXT NOT NULL,
+                calls INTEGER NOT NULL,
+                PRIMARY KEY (key, day)
+            )
+            """
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(kind: str, credential: str) -> str:
+        return f"{kind}:{hashlib.sha256(credential.encode('utf-8')).hexdigest()[:16]}"
+
+    def limiter(self, kind: str, credential: str, rate: float, burst: float, daily_limit: int = 0) -> QuotaLimiter:
+        # 同一凭据重复获取返回同一个实例；参数以第一次创建时为准
+        key = self.make_key(kind, credential)
+        with self._lock:
+            lim = self._limiters.get(key)
+            if lim is None:
+                lim = self._limiters[key] = QuotaLimiter(self, kind, key, rate, burst, daily_limit)
+            return lim
+
+    def _consume(self, key: str, daily_limit: int) -> bool:
+        day = _today()
+        with self._lock:
+            self._conn.execute("INSERT OR IGNORE INTO usage (key, day, calls) VALUES (?, ?, 0)", (key, day))
+            if daily_limit > 0:
+                cur = self._conn.execute(
+                    "UPDATE usage SET calls = calls + 1 WHERE key = ? AND day = ? AND calls < ?", (key, day, daily_limit)
+                )
+            else:
+                cur = self._conn.execute("UPDATE usage SET calls = calls + 1 WHERE key = ? AND day = ?", (key, day))
+            self._conn.commit()
+            return cur.rowcount > 0
+
+    def used(self, key: str, day: Optional[str] = None) -> int:
+        with self._lock:
+            row = self._conn.execute("SELECT calls FROM usage WHERE key = ? AND day = ?", (key, day or _today())).fetchone()
+        return row[0] if row else 0
+
+    def usage(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            limiters = dict(self._limiters)
+        return {lim.kind: lim.usage() for lim in limiters.values()}
@@ -0,0 +1,130 @@
+import math
+import re
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, List, Sequence, Tuple
+
+import pandas as pd
+
+from naver_api import BATCH_FALLBACK_SEP, normalize_keyword
+
+SEED_ATTR = '🎯 目标原词'
+COMP_SHORT = {"높음": "H", "중간": "M", "낮음": "L"}
+
+
+@dataclass
+class RankConfig:
+    enabled: bool = True
+    token_budget: int = 2500      # 第三步 market_data 的估算 token 上限
+    w_ngram: float = 0.5          # 与种子词的字符二元组相似度
+    w_anchor: float = 0.35        # 是否包含种子词里的主体/属性词
+    w_volume: float = 0.15        # 搜索量先验（log 归一化）
+    min_score: float = 0.05       # 低于此分数的拓展词直接丢弃（与种子词毫无字面关系）
+
+
+def estimate_tokens(text: str) -> int:
+    # 粗估：韩文/中文每字约 1 token，其余字符约 4 个 1 token；只用于预算控制，不求精确
+    cjk = len(re.findall(r'[가-힣一-鿿]', text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def _bigrams(s: str) -> set:
+    return {s[i:i + 2] for i in range(len(s) - 1)} if len(s) > 1 else {s}
+
+
+def anchor_terms(seeds: Sequence[str]) -> Dict[str, float]:
+    # 种子词按空格拆出的词根，出现在越多种子词里权重越高（主体锚点通常反复出现）
+    counts = Counter()
+    for seed in seeds:
+        for tok in set(str(seed).split()):
+            tok = normalize_keyword(tok)
+            if len(tok) >= 2:
+                counts[tok] += 1
+    if not counts:
+        return {}
+    top = max(counts.values())
+    return {tok: c / top for tok, c in counts.items()}
+
+
+def score_keywords(keywords: Sequence[str], volumes: Sequence[int], seeds: Sequence[str], cfg: RankConfig) -> List[float]:
+    seed_grams = [_bigrams(normalize_keyword(s)) for s in seeds if normalize_keyword(s)]
+    anchors = anchor_terms(seeds)
+    max_log = math.log1p(max([int(v) for v in volumes] or [0]))
+    scores = []
+    for kw, vol in zip(keywords, volumes):
+        norm = normalize_keyword(kw)
+        grams = _bigrams(norm)
+        ngram = max((len(grams & g) / len(grams | g) for g in seed_grams), default=0.0)
+        anchor = max((w for tok, w in anchors.items() if tok in norm), default=0.0)
+        volume = math.log1p(int(vol)) / max_log if max_log > 0 else 0.0
+        scores.append(cfg.w_ngram * ngram + cfg.w_anchor * anchor + cfg.w_volume * volume)
+    return scores
+
+
+def rank_market(df_market: pd.DataFrame, seeds: Sequence[str], cfg: RankConfig) -> pd.DataFrame:
+    """
+    给 df_market 每行打相关性分（目标原词固定 1.0），种子词在前、拓展词按分数降序。
+    结果带 “相关性” 列，尚未按预算截断。
+    """
+    df = df_market.copy()
+    is_seed = df["词组属性"] == SEED_ATTR
+    df["相关性"] = 1.0
+    derived = df[~is_seed]
+    if not derived.empty:
+        df.loc[~is_seed, "相关性"] = score_keywords(derived["Naver实际搜索词"].tolist(), derived["月总搜索量"].tolist(), seeds, cfg)
+    df["相关性"] = df["相关性"].round(3)
+    df = df[is_seed | (df["相关性"] >= cfg.min_score)]
+    seed_df = df[df["词组属性"] == SEED_ATTR].sort_values(by="月总搜索量", ascending=False)
+    derived_df = df[df["词组属性"] != SEED_ATTR].sort_values(by=["相关性", "月总搜索量"], ascending=[False, False])
+    return pd.concat([seed_df, derived_df]).drop_duplicates(subset=["Naver实际搜索词"])
+
+
+def _source_ids(origin: str, seed_ids: Dict[str, int]) -> str:
+    # AI溯源(原词) 压成种子词编号；批量归属失败的 "a | b" 写成 "1+2"
+    ids = [str(seed_ids[n]) for n in map(normalize_keyword, str(origin).split(BATCH_FALLBACK_SEP)) if n in seed_ids]
+    return "+".join(ids) if ids else "-"
+
+
+def encode_market_data(df: pd.DataFrame, seeds: Sequence[str]) -> str:
+    """
+    第三步 market_data 的紧凑编码：短列名、竞争度单字母、目标原词单独成段（不再逐行重复属性文本），
+    拓展词的来源原词写成种子词编号。
+    """
+    seed_ids = {}
+    for s in seeds:
+        seed_ids.setdefault(normalize_keyword(s), len(seed_ids) + 1)
+    is_seed = df["词组属性"] == SEED_ATTR
+    lines = [
+        "字段说明：kw=韩文关键词 vol=月总搜索量 comp=竞争度(H高/M中/L低) src=来源目标原词编号",
+        "[目标原词] #|kw|vol|comp",
+    ]
+    for kw, vol, comp in zip(df.loc[is_seed, "Naver实际搜索词"], df.loc[is_seed, "月总搜索量"], df.loc[is_seed, "竞争度"]):
+        lines.append(f"{seed_ids.get(normalize_keyword(kw), '')}|{kw}|{vol}|{COMP_SHORT.get(comp, comp)}")
+    # 第一步种子词里 Naver 没返回数据的也列出编号，方便 src 对照
+    listed = {normalize_keyword(kw) for kw in df.loc[is_seed, "Naver实际搜索词"]}
+    for s in seeds:
+        n = normalize_keyword(s)
+        if n not in listed:
+            listed.add(n)
+            lines.append(f"{seed_ids[n]}|{s}|-|-")
+    lines.append("[Naver拓展词] kw|vol|comp|src")
+    derived = df[~is_seed]
+    for kw, vol, comp, origin in zip(derived["Naver实际搜索词"], derived["月总搜索量"], derived["竞争度"], derived["AI溯源(原词)"]):
+        lines.append(f"{kw}|{vol}|{COMP_SHORT.get(comp, comp)}|{_source_ids(origin, seed_ids)}")
+    return "\n".join(lines)
+
+
+def prune_to_budget(ranked: pd.DataFrame, seeds: Sequence[str], token_budget: int) -> Tuple[pd.DataFrame, str]:
+    # 种子词全部保留；拓展词按排名依次加入，直到紧凑编码的估算 token 超出预算
+    is_seed = ranked["词组属性"] == SEED_ATTR
+    seed_df, derived = ranked[is_seed], ranked[~is_seed]
+    used = estimate_tokens(encode_market_data(seed_df, seeds))
+    keep = 0
+    for kw, vol, comp in zip(derived["Naver实际搜索词"], derived["月总搜索量"], derived["竞争度"]):
+        cost = estimate_tokens(f"{kw}|{vol}|{COMP_SHORT.get(comp, comp)}|00\n")
+        if used + cost > token_budget:
+            break
+        used += cost
+        keep += 1
+    kept = pd.concat([seed_df, derived.head(keep)])
+    return kept, encode_market_data(kept, seeds)
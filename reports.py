@@ -0,0 +1,139 @@
+import io
+import re
+
+import markdown  # 🚀 用于将文本渲染为极美网页排版
+import pandas as pd
+
+
+def parse_md_table(md_text, keyword):
+    lines = md_text.split('\n')
+    table_data = []
+    is_table = False
+    for line in lines:
+        line = line.strip()
+        if '|' in line and keyword in line:
+            is_table = True
+            table_data.append(line)
+            continue
+        if is_table:
+            if line.startswith('|') or line.endswith('|') or '|' in line:
+                if '---' not in line:
+                    table_data.append(line)
+            else:
+                if len(line.strip()) > 0:
+                    break
+    if not table_data:
+        return pd.DataFrame()
+    parsed_rows = []
+    for row in table_data:
+        cols = [col.strip() for col in row.split('|')]
+        if cols and not cols[0]:
+            cols = cols[1:]
+        if cols and not cols[-1]:
+            cols = cols[:-1]
+        parsed_rows.append(cols)
+    if len(parsed_rows) > 1:
+        return pd.DataFrame(parsed_rows[1:], columns=parsed_rows[0])
+    return pd.DataFrame()
+
+
+def build_listing_sheet(res1_text: str) -> pd.DataFrame:
+    raw_titles = []
+    for line in res1_text.split('\n'):
+        line_clean = line.strip()
+        if 'LxU' in line_clean and not any(x in line_clean for x in ['公式', '规则', '卖点', '核心词', '翻译', '中文']):
+            clean_t = re.sub(r'```[a-zA-Z]*', '', line_clean)
+            clean_t = clean_t.strip('`*>- \t')
+            if clean_t.startswith('LxU') and clean_t not in raw_titles:
+                raw_titles.append(clean_t)
+
+    coupang_title = raw_titles[0] if len(raw_titles) > 0 else "未提取到 Coupang 标题，请查阅全景报告"
+    naver_title = raw_titles[1] if len(raw_titles) > 1 else "未提取到 Naver 标题，请查阅全景报告"
+
+    kw_lines = []
+    for line in res1_text.split('\n'):
+        if ('，' in line or ',' in line) and '|' not in line and re.search(r'[가-힣]', line):
+            if line.count(',') + line.count('，') >= 5:
+                clean_kw = re.sub(r'```[a-zA-Z]*', '', line).strip()
+                clean_kw = clean_kw.strip('`').strip()
+                if clean_kw and clean_kw not in kw_lines:
+                    kw_lines.append(clean_kw)
+
+    coupang_kws = kw_lines[0] if len(kw_lines) > 0 else "未提取到 Coupang 关键词，请查阅全景报告"
+    naver_kws = kw_lines[1] if len(kw_lines) > 1 else "未提取到 Naver 关键词，请查阅全景报告"
+
+    df_sheet1 = pd.DataFrame({
+        "信息维度": ["Coupang 标题", "Coupang 后台关键词", "Naver 标题", "Naver 后台关键词"],
+        "提炼内容": [coupang_title, coupang_kws, naver_title, naver_kws]
+    })
+    return df_sheet1
+
+
+def build_excel_bytes(res1_text: str, res3_text: str) -> bytes:
+    df_sheet1 = build_listing_sheet(res1_text)
+    df_comments = parse_md_table(res1_text, "韩文评价原文")
+    df_ads = parse_md_table(res3_text, "广告组分类")
+
+    # === 写入 Excel (内存) ===
+    excel_buffer = io.BytesIO()
+    with pd.ExcelWriter(excel_buffer, engine='xlsxwriter') as writer:
+        df_sheet1.to_excel(writer, index=False, sheet_name='登品标题')
+        if not df_comments.empty:
+            df_comments.to_excel(writer, index=False, sheet_name='评论区内容')
+        else:
+            pd.DataFrame([{"提示": "未找到规范的评价表格"}]).to_excel(writer, index=False, sheet_name='评论区内容')
+        if not df_ads.empty:
+            df_ads.to_excel(writer, index=False, sheet_name='广告投放关键词')
+        else:
+            pd.DataFrame([{"提示": "未找到规范的广告策略表"}]).to_excel(writer, index=False, sheet_name='广告投放关键词')
+    return excel_buffer.getvalue()
+
+
+def build_html_report(folder_name: str, res1_text: str, res3_text: str) -> str:
+    css_style = """
+    <style>
+        body { font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, "Malgun Gothic", "Microsoft YaHei", sans-serif; padding: 40px; max-width: 1000px; margin: auto; line-height: 1.6; color: #333; background-color: #f4f6f9; }
+        .container { background: #ffffff; padding: 40px; border-radius: 12px; box-shadow: 0 4px 12px rgba(0,0,0,0.05); }
+        h1 { color: #1E3A8A; border-bottom: 2px solid #e2e8f0; padding-bottom: 10px; text-align: center; }
+        h2 { color: #2563eb; margin-top: 30px; }
+        h3 { color: #475569; }
+        table { border-collapse: collapse; width: 100%; margin: 20px 0; font-size: 14px; border-radius: 8px; overflow: hidden; }
+        th, td { border: 1px solid #e2e8f0; padding: 12px 15px; text-align: left; }
+        th { background-color: #f8fafc; color: #1e293b; font-weight: 600; }
+        tr:nth-child(even) { background-color: #f1f5f9; }
+        pre { background-color: #1e293b; padding: 20px; border-radius: 8px; overflow-x: auto; color: #f8fafc; font-family: monospace; }
+        code { background-color: #e2e8f0; padding: 2px 6px; border-radius: 4px; color: #b91c1c; font-size: 0.9em; }
+        .print-btn { display: block; width: 200px; margin: 20px auto; padding: 10px; background-color: #2563eb; color: white; text-align: center; text-decoration: none; border-radius: 5px; font-weight: bold; cursor: pointer; border: none; }
+        @media print { .print-btn { display: none; } body { background-color: white; } .container { box-shadow: none; padding: 0; } }
+    </style>
+    """
+
+    html_part1 = markdown.markdown(res1_text, extensions=['tables', 'fenced_code'])
+    html_part3 = markdown.markdown(res3_text, extensions=['tables', 'fenced_code'])
+
+    html_content = f"""
+    <!DOCTYPE html>
+    <html lang="zh-CN">
+    <head>
+        <meta charset="utf-8">
+        <title>LxU 测品全景报告 - {folder_name}</title>
+        {css_style}
+    </head>
+    <body>
+        <div class="container">
+            <button class="print-btn" onclick="window.print()">🖨️ 保存为高质量 PDF</button>
+            <h1>📊 LxU 测品全景报告</h1>
+            <p style="text-align: center; color: #64748b;">报告归属产品：{folder_name} | 生成日期：自动记录</p>
+
+            <h2>🔍 第一步：AI 视觉提炼与本地化分析</h2>
+            {html_part1}
+
+            <hr style="border: 1px dashed #cbd5e1; margin: 40px 0;">
+
+            <h2>🧠 第三步：产品深度解析与终极广告策略</h2>
+            {html_part3}
+        </div>
+    </body>
+    </html>
+    """
+    return html_content
@@ -0,0 +1,255 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+
+@dataclass
+class PipelineEvent:
+    # kind: stage_start / stage_done / progress / job_failed / job_done
+    kind: str
+    job: Any
+    stage: str = ""
+    data: Dict[str, Any] = field(default_factory=dict)
+
+
+class StageError(Exception):
+    # 阶段内的“业务失败”（如 AI 未返回关键词）：label 用于状态栏，detail 为详细内容
+    def __init__(self, label: str, detail: str = ""):
+        super().__init__(label)
+        self.label = label
+        self.detail = detail
+
+
+class _FairQueue:
+    # 同一阶段的待办按会话分队，取任务时在会话之间轮转：多人同时跑批时谁也不会被饿死
+    def __init__(self):
+        self._queues: "OrderedDict[str, deque]" = OrderedDict()
+        self._cond = threading.Condition()
+
+    def put(self, key: str, item):
+        with self._cond:
+            self._queues.setdefault(key, deque()).append(item)
+            self._cond.notify()
+
+    def get(self):
+        with self._cond:
+            while not self._queues:
+                self._cond.wait()
+            key, q = next(iter(self._queues.items()))
+            item = q.popleft()
+            # 刚取过的会话排到队尾，空了就移除
+            del self._queues[key]
+            if q:
+                self._queues[key] = q
+            return item
+
+    def remove(self, predicate: Callable[[Any], bool]) -> List[Any]:
+        with self._cond:
+            removed = []
+            for key in list(self._queues):
+                q = self._queues[key]
+                removed.extend(item for item in q if predicate(item))
+                kept = deque(item for item in q if not predicate(item))
+                if kept:
+                    self._queues[key] = kept
+                else:
+                    del self._queues[key]
+            return removed
+
+    def __len__(self) -> int:
+        with self._cond:
+            return sum(len(q) for q in self._queues.values())
+
+
+class BatchHandle:
+    """
+    提交到 JobQueue 的一批产品。事件按顺序记在批次自己的日志里：
+    UI 用 poll(cursor) 增量取回；Streamlit rerun 后从 cursor=0 重新回放即可恢复页面。
+    """
+
+    def __init__(self, batch_id: int, session: str, jobs: List[Any], stages: Sequence[Tuple[str, Callable, int]], on_finish: Optional[Callable]):
+        self.id = batch_id
+        self.session = session or f"batch-{batch_id}"
+        self.jobs = list(jobs)
+        self.stages = [(name, fn) for name, fn, _ in stages]
+        self.on_finish = on_finish
+        self.cancelled = False
+        self.submitted_at = time.time()
+        self._log: List[PipelineEvent] = []
+        self._pending = len(self.jobs)
+        self._cond = threading.Condition()
+
+    def _emit(self, kind: str, job, stage: str = "", **data):
+        with self._cond:
+            self._log.append(PipelineEvent(kind, job, stage, data))
+            if kind == "job_done":
+                self._pending -= 1
+            self._cond.notify_all()
+
+    def _finish(self, job, failed: Optional[Tuple[str, str, str]] = None):
+        try:
+            if self.on_finish is not None:
+                self.on_finish(job)
+        except Exception:
+            pass
+        if failed:
+            stage, label, detail = failed
+            self._emit("job_failed", job, stage, label=label, detail=detail)
+        self._emit("job_done", job)
+
+    @property
+    def done(self) -> bool:
+        with self._cond:
+            return self._pending <= 0
+
+    def poll(self, cursor: int = 0, timeout: float = 0.0) -> List[PipelineEvent]:
+        # 返回 cursor 之后的新事件；没有新事件时最多等 timeout 秒
+        with self._cond:
+            if len(self._log) <= cursor and self._pending > 0 and timeout > 0:
+                self._cond.wait(timeout)
+            return self._log[cursor:]
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        with self._cond:
+            self._cond.wait_for(lambda: self._pending <= 0, timeout)
+            return self._pending <= 0
+
+    def events(self, poll_interval: float = 0.2) -> Iterator[PipelineEvent]:
+        cursor = 0
+        while True:
+            batch = self.poll(cursor, poll_interval)
+            cursor += len(batch)
+            yield from batch
+            if not batch and self.done:
+                return
+
+
+class StagedScheduler:
+    """
+    单次运行用的多产品流水线（命令行 / 基准测试）：内部起一个私有的 JobQueue，跑完即关闭。
+    每个阶段一个有界工作线程组，产品完成第 N 阶段后立刻进入第 N+1 阶段的队列，
+    因此产品 N+1 的上传/第一步可以和产品 N 的 Naver/第三步/打包同时进行。
+    - stages: [(阶段名, fn(job, report), 并发数)]；fn 抛异常即视为该产品失败，后续阶段跳过
+    - on_finish(job) 在产品结束（成功或失败）时于工作线程调用，用于清理临时文件/远程文件
+    """
+
+    def __init__(self, stages: Sequence[Tuple[str, Callable, int]], on_finish: Optional[Callable] = None):
+        self.stages = list(stages)
+        self.on_finish = on_finish
+
+    def run(self, jobs: List[Any], poll_interval: float = 0.2) -> Iterator[PipelineEvent]:
+        # 按提交顺序进入第一阶段（FIFO），先上传的产品优先推进
+        job_queue = JobQueue([(name, workers) for name, _, workers in self.stages])
+        handle = job_queue.submit(jobs, self.stages, on_finish=self.on_finish)
+        try:
+            yield from handle.events(poll_interval)
+        finally:
+            # 被中途停止时：排队中的产品直接结束，正在跑的阶段跑完后再关闭工作线程
+            job_queue.cancel(handle)
+            if handle.done:
+                job_queue.close()
+            else:
+                threading.Thread(target=lambda: handle.wait() and job_queue.close(), daemon=True).start()
+
+
+class JobQueue:
+    """
+    进程级作业队列（Streamlit 里用 st.cache_resource 在所有会话间共享）：
+    - 每个阶段固定数量的常驻工作线程，整机并发不随会话数 / 批次数增长
+    - 各阶段待办按会话轮转取任务（_FairQueue），先提交的大批次不会堵住后来者
+    - submit 立即返回 BatchHandle，工作与 Streamlit 脚本线程解耦：rerun / 断线都不影响正在跑的产品
+    - stage_workers: [(阶段名, 工作线程数)]；提交的批次必须使用相同的阶段名与顺序
+    """
+
+    def __init__(self, stage_workers: Sequence[Tuple[str, int]]):
+        self.stage_workers = [(name, max(1, workers)) for name, workers in stage_workers]
+        self.stage_names = [name for name, _ in self.stage_workers]
+        self._queues = [_FairQueue() for _ in self.stage_workers]
+        self._lock = threading.Lock()
+        self._batches: Dict[int, BatchHandle] = {}
+        self._next_id = 1
+        self._running = 0
+        for index, (name, workers) in enumerate(self.stage_workers):
+            for k in range(workers):
+                threading.Thread(target=self._worker, args=(index,), name=f"queue-{name}-{k}", daemon=True).start()
+
+    def submit(self, jobs: List[Any], stages: Sequence[Tuple[str, Callable, int]], session: str = "", on_finish: Optional[Callable] = None) -> BatchHandle:
+        # stages 里的并发数被忽略，以队列的全局配置为准
+        if [name for name, _, _ in stages] != self.stage_names:
+            raise ValueError(f"阶段不匹配：{[name for name, _, _ in stages]} != {self.stage_names}")
+        with self._lock:
+            handle = BatchHandle(self._next_id, session, jobs, stages, on_finish)
+            self._next_id += 1
+            if handle.jobs:
+                self._batches[handle.id] = handle
+        for job in handle.jobs:
+            self._queues[0].put(handle.session, (handle, 0, job))
+        return handle
+
+    def cancel(self, handle: BatchHandle):
+        # 排队中的产品直接结束；正在执行的阶段跑完后不再进入下一阶段
+        handle.cancelled = True
+        for index, q in enumerate(self._queues):
+            for _, _, job in q.remove(lambda item: item[0] is handle):
+                handle._finish(job, failed=(self.stage_names[index], "⏹️ 已取消", ""))
+        with self._lock:
+            if handle.done:
+                self._batches.pop(handle.id, None)
+
+    def close(self):
+        # 让所有工作线程退出（进程级队列不需要调用）；调用前应确保没有在跑的批次
+        for q, (_, workers) in zip(self._queues, self.stage_workers):
+            for _ in range(workers):
+                q.put("", None)
+
+    def _worker(self, index: int):
+        name = self.stage_names[index]
+        while True:
+            item = self._queues[index].get()
+            if item is None:
+                return
+            handle, _, job = item
+            if handle.cancelled:
+                handle._finish(job, failed=(name, "⏹️ 已取消", ""))
+            else:
+                with self._lock:
+                    self._running += 1
+                try:
+                    self._run_stage(handle, index, job)
+                finally:
+                    with self._lock:
+                        self._running -= 1
+            with self._lock:
+                if handle.done:
+                    self._batches.pop(handle.id, None)
+
+    def _run_stage(self, handle: BatchHandle, index: int, job):
+        name, fn = handle.stages[index]
+        handle._emit("stage_start", job, name)
+        try:
+            fn(job, lambda **data: handle._emit("progress", job, name, **data))
+        except StageError as e:
+            handle._finish(job, failed=(name, e.label, e.detail))
+            return
+        except Exception as e:
+            handle._finish(job, failed=(name, f"❌ 本地系统逻辑错误: {e}", ""))
+            return
+        handle._emit("stage_done", job, name)
+        if index + 1 < len(self._queues):
+            self._queues[index + 1].put(handle.session, (handle, index + 1, job))
+        else:
+            handle._finish(job)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            batches = list(self._batches.values())
+            running = self._running
+        return {
+            "workers": dict(self.stage_workers),
+            "queued": {name: len(q) for name, q in zip(self.stage_names, self._queues)},
+            "running": running,
+            "batches": len(batches),
+            "sessions": len({b.session for b in batches}),
+        }